@@ -0,0 +1,99 @@
+"""Compare process startup with a cold and a warm program binary cache.
+
+Each measurement runs in a fresh Python process, which builds a library
+of fragment-shader kernels.  Usage:
+
+    python program_binary_cache.py [nr_kernels]
+
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+import time
+
+KERNEL = """
+uniform float scale;
+varying vec2 vertex;
+
+void main(void) {
+    float x = vertex.x * scale;
+    float acc = 0.0;
+    for (int i = 0; i < %(iterations)d; i++) {
+        acc += sin(x * float(i)) / float(i + 1);
+    }
+    gl_FragColor = vec4(acc, %(k)d.0, 0.0, 1.0);
+}
+"""
+
+def build_kernels(nr_kernels, cache_dir):
+    from scikits.gpu.api import Program, FragmentShader, \
+         default_vertex_shader, enable_binary_cache
+    from scikits.gpu.context import HeadlessContext
+    from pyglet import gl
+
+    # Without a display, pyglet has not created a context
+    context = None
+    if gl.current_context is None:
+        context = HeadlessContext()
+
+    if cache_dir:
+        enable_binary_cache(cache_dir)
+
+    tic = time.time()
+    for k in range(nr_kernels):
+        Program([default_vertex_shader(),
+                 FragmentShader(KERNEL % {'k': k, 'iterations': 10 + k})])
+
+    return time.time() - tic
+
+def run(nr_kernels, cache_dir):
+    """Time kernel construction in a child process.
+
+    Returns
+    -------
+    build : float
+        Time spent building the kernels.
+    total : float
+        Total wall time of the child process, including import and
+        context creation.
+
+    """
+    tic = time.time()
+    child = subprocess.Popen([sys.executable, __file__, '--child',
+                              str(nr_kernels), cache_dir],
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    output, errors = child.communicate()
+    total = time.time() - tic
+
+    if child.returncode != 0:
+        raise RuntimeError("Child process failed with exit status %d:\n%s" % \
+                           (child.returncode, errors))
+
+    return float(output.strip().split()[-1]), total
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        print build_kernels(int(sys.argv[2]), sys.argv[3])
+        sys.exit(0)
+
+    nr_kernels = 50
+    if len(sys.argv) > 1:
+        nr_kernels = int(sys.argv[1])
+
+    cache_dir = tempfile.mkdtemp()
+    try:
+        print "Building %d kernels" % nr_kernels
+        print "%-20s %10s %10s" % ('', 'build [s]', 'total [s]')
+        for name, path in [('no cache', ''),
+                           ('cold cache', cache_dir),
+                           ('warm cache', cache_dir)]:
+            build, total = run(nr_kernels, path)
+            print "%-20s %10.3f %10.3f" % (name, build, total)
+    except RuntimeError, e:
+        print >> sys.stderr, e
+        sys.exit(1)
+    finally:
+        shutil.rmtree(cache_dir)
@@ -0,0 +1,32 @@
+"""Render a zoom sequence into the Mandelbrot fractal offscreen, all
+frames in a single draw call.
+
+"""
+
+from scikits.gpu.api import *
+from scikits.gpu.context import HeadlessContext
+import numpy as np
+import zoo
+
+context = HeadlessContext()
+
+WIDTH, HEIGHT = 200, 150
+FRAMES = 16
+
+# Offset and zoom vary from frame to frame
+kernel = BatchKernel(zoo.mandelbrot(), ['offset', 'zoom'])
+
+values = {'offset': np.tile([-0.743643, 0.131825], (FRAMES, 1)),
+          'zoom': np.logspace(0, 3, FRAMES)}
+
+frames = kernel(values, WIDTH, HEIGHT, bands=3,
+                uniforms={'width_ratio': float(WIDTH) / HEIGHT})
+
+# Display using matplotlib
+
+import matplotlib.pyplot as plt
+for n, frame in enumerate(frames):
+    plt.subplot(4, 4, n + 1)
+    plt.imshow(frame)
+    plt.axis('off')
+plt.show()
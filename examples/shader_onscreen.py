@@ -14,14 +14,7 @@ p['width_ratio'] = 800/600.
 p['zoom'] = 2.0
 
 # Draw full-screen canvas
-gl.glBegin(gl.GL_QUADS)
-for coords in [(-1.0, -1.0),
-               ( 1.0, -1.0),
-               ( 1.0,  1.0),
-               (-1.0,  1.0)]:
-    gl.glVertex3f(coords[0], coords[1], 0.0)
-
-gl.glEnd()
+run_pass(p)
 gl.glFlush()
 
 p.disable()
@@ -26,10 +26,11 @@ def checker():
     varying vec2 pos;
 
     void main(void) {
-        if (fract(pos.x * 5) > 0.5)
-            pos.y += 0.5;
+        float y = pos.y;
+        if (fract(pos.x * 5.0) > 0.5)
+            y += 0.5;
 
-        if (fract(pos.y * 5) > 0.5) {
+        if (fract(y * 5.0) > 0.5) {
             gl_FragColor = vec4(0, 0, 0, 1);
         } else {
             gl_FragColor = vec4(1, 1, 1, 1);
@@ -79,15 +80,15 @@ def mandelbrot():
         float a, b;
         for (k = 0.0; k < 1.0; k += 0.005) {
             a = r*r - i*i + pos.x;
-            b = 2*r*i + pos.y;
+            b = 2.0*r*i + pos.y;
 
-            if ((a*a + b*b) > 4) break;
+            if ((a*a + b*b) > 4.0) break;
 
             r = a;
             i = b;
         }
 
-        gl_FragColor = vec4(k, 3*sin(k), sin(k*3.141/2.), 1.0);
+        gl_FragColor = vec4(k, 3.0*sin(k), sin(k*3.141/2.), 1.0);
     }
     """)
 
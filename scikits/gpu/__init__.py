@@ -2,3 +2,13 @@
 Graphical Processing Unit (GPU) algorithms for scientific computing.
 
 """
+
+import os as _os
+import sys as _sys
+
+if _sys.platform.startswith('linux') and not _os.environ.get('DISPLAY'):
+    # Without a display, pyglet cannot create its hidden "shadow" window
+    # when pyglet.gl is imported.  Contexts can be created with
+    # scikits.gpu.context instead.
+    import pyglet
+    pyglet.options['shadow_window'] = False
@@ -6,3 +6,10 @@ Graphical Processing Unit (GPU) algorithms for scientific computing.
 from scikits.gpu.shader import *
 from scikits.gpu.texture import *
 from scikits.gpu.framebuffer import *
+from scikits.gpu.elementwise import *
+from scikits.gpu.reduction import *
+from scikits.gpu.tiling import *
+from scikits.gpu.pool import *
+from scikits.gpu.canvas import *
+from scikits.gpu.state import *
+from scikits.gpu.batch import *
@@ -0,0 +1,611 @@
+"""Arrays that live in graphics memory.
+
+"""
+
+__all__ = ['GPUArray', 'to_gpu', 'empty', 'zeros']
+
+from pyglet import gl
+import numpy as np
+import weakref
+
+from scikits.gpu.texture import Texture, texture_target
+from scikits.gpu.layout import texture_shape
+from scikits.gpu.tiling import TiledTexture, tile_regions
+from scikits.gpu.elementwise import ElementwiseKernel
+from scikits.gpu.reduction import reduce_sum, reduce_min, reduce_max, \
+                                  reduce_argmax
+
+class _Storage(object):
+    def __init__(self, shape, texture=None, packed=False):
+        """Memory shared by an array and its views.
+
+        The data is held in a texture, and mirrored in host memory.
+        Either copy may be out of date; data is transferred only when
+        the stale copy is needed.  Arrays too large for a single texture
+        are held in a `TiledTexture`.
+
+        Parameters
+        ----------
+        shape : tuple of ints
+            Shape of the array that owns the storage.
+        texture : Texture or TiledTexture, optional
+            Texture holding the data, e.g. the output of a kernel.
+        packed : bool
+            Whether four elements are stored in each texel.  In both
+            layouts, the host copy holds the elements in the same
+            order.
+
+        """
+        self.packed = packed
+        self.bands = packed and 4 or 1
+        self.width, self.height = texture_shape(shape, packed)
+        self.tiled = len(tile_regions(self.width, self.height)) > 1
+        if self.tiled:
+            # Each tile has its own target
+            self.target = None
+        else:
+            self.target = texture_target(self.height, self.width)
+
+        # Host copy, in the order in which elements are stored in the
+        # texture.  Allocating it does not initialise it.
+        self.host = np.empty(self.width * self.height * self.bands,
+                             dtype=np.float32)
+
+        self.texture = texture
+        self.host_valid = False
+        self.device_valid = texture is not None
+
+        # Deferred operations that read the storage (see `_add_reader`)
+        self.readers = []
+
+    def to_device(self):
+        """Make sure that the texture is up to date.
+
+        """
+        if self.texture is None and self.tiled:
+            self.texture = TiledTexture(self.width, self.height, self.bands)
+        elif self.texture is None and self.packed:
+            self.texture = Texture(self.width, self.height, format=gl.GL_RGBA,
+                                   internalformat=gl.GL_RGBA32F_ARB,
+                                   filter=gl.GL_NEAREST)
+        elif self.texture is None:
+            self.texture = Texture(self.width, self.height, format=gl.GL_RED,
+                                   internalformat=gl.GL_RGB32F_ARB,
+                                   filter=gl.GL_NEAREST)
+
+        if not self.device_valid:
+            if self.host_valid:
+                self.texture.write(self.host.reshape((self.height,
+                                                      self.width,
+                                                      self.bands)))
+            self.device_valid = True
+
+    def to_host(self):
+        """Make sure that the host copy is up to date.
+
+        """
+        if not self.host_valid:
+            if self.device_valid:
+                self.texture.read(self.host)
+            self.host_valid = True
+
+    def host_modified(self):
+        """Mark the host copy as the only valid one.
+
+        """
+        self.host_valid = True
+        self.device_valid = False
+
+    def evaluate_readers(self):
+        """Evaluate the deferred operations that read the storage, so
+        that they use the data from before a write.
+
+        """
+        readers, self.readers = self.readers, []
+        for ref in readers:
+            x = ref()
+            if x is not None:
+                x.evaluate()
+
+def _add_reader(readers, x):
+    """Append a weak reference to the deferred operation `x` to a list of
+    readers, dropping those that have been evaluated or deleted.
+
+    """
+    readers[:] = [ref for ref in readers
+                  if ref() is not None and ref()._lazy]
+    readers.append(weakref.ref(x))
+
+class _Expression(object):
+    def __init__(self, format, operands):
+        """Deferred elementwise operation.
+
+        Parameters
+        ----------
+        format : str
+            GLSL expression with a ``%s`` for each operand, e.g.
+            ``"(%s + %s)"``.
+        operands : list
+            GPUArrays (possibly unevaluated themselves) and floats.
+
+        """
+        self.format = format
+        self.operands = operands
+
+        # Deferred operations that read the result, passed on to its
+        # storage on evaluation
+        self.readers = []
+
+        # Number of operations that would be fused
+        self.size = 1 + sum([x._expr.size for x in operands
+                             if isinstance(x, GPUArray) and x._lazy])
+
+    def source(self, leaves, names):
+        """Return the GLSL expression, with the operands that are not
+        deferred operations replaced by the names ``x0``, ``x1``, ...
+
+        Parameters
+        ----------
+        leaves : list
+            Values of the names, appended to as names are introduced.
+        names : dict
+            Names of the arrays introduced so far, by id, so that an
+            array that occurs repeatedly is passed only once.
+
+        """
+        parts = []
+        for x in self.operands:
+            if isinstance(x, GPUArray) and x._lazy:
+                parts.append(x._expr.source(leaves, names))
+                continue
+
+            if isinstance(x, GPUArray) and id(x) in names:
+                parts.append(names[id(x)])
+                continue
+
+            name = 'x%d' % len(leaves)
+            leaves.append(x)
+            if isinstance(x, GPUArray):
+                names[id(x)] = name
+            parts.append(name)
+
+        return self.format % tuple(parts)
+
+# Largest number of operations fused into one kernel.  Longer chains
+# are evaluated in parts, so that shaders remain small.
+max_fused = 32
+
+class GPUArray(object):
+    def __init__(self, shape, dtype=np.float32, packed=False, _storage=None,
+                 _view=None, _expr=None):
+        """Array stored in graphics memory.
+
+        Operations between GPUArrays, and between GPUArrays and scalars
+        or ndarrays (on either side), are evaluated on the graphics card
+        and return new GPUArrays.  Arrays cannot be empty.
+        Data is only copied to the host when it is requested, e.g. by
+        `get`, and only copied to the graphics card when it has been
+        modified on the host.
+
+        Parameters
+        ----------
+        shape : tuple of ints
+            Shape of the array.
+        dtype : data-type
+            Only float32 is supported.
+        packed : bool
+            Store four consecutive elements in each texel, rather than
+            one (see `layout.texture_shape`).  Kernels on packed arrays
+            then process four elements per fragment, which is up to
+            four times faster for kernels limited by memory bandwidth.
+            Packing is transparent, except that kernels written by hand
+            must be valid for ``vec4`` values (see
+            `ElementwiseKernel`).  Operations between packed arrays
+            return packed arrays.
+
+        Notes
+        -----
+        Indexing with integers and slices returns a view, which shares
+        the memory of the original array.  Views are evaluated in
+        kernels directly, without making a copy, as long as the
+        underlying array has fewer than 2**24 elements.
+
+        Arithmetic is evaluated lazily: an expression such as
+        ``a * b + c * d - e`` only records the operations, and is
+        computed by a single generated kernel once its value is needed
+        (see `evaluate`).  Intermediate results are never stored.
+        Kernels are kept by the structure of the expression, so that
+        evaluating it again, with other arrays or scalars, does not
+        generate a new shader.  Assigning to an operand (see `set`)
+        first evaluates the expressions that read it, so that their
+        values are those of the operands when they were written.
+
+        """
+        if np.dtype(dtype) != np.float32:
+            raise ValueError("GPUArray only supports float32 data.")
+
+        self.dtype = np.dtype(np.float32)
+
+        if _expr is not None:
+            # Storage is allocated on evaluation
+            self._expr = _expr
+            self.shape = tuple(shape)
+            self.packed = packed
+            return
+
+        self._expr = None
+
+        if _storage is None:
+            shape = tuple(int(n) for n in np.atleast_1d(shape))
+            _storage = _Storage(shape, packed=packed)
+
+        if _view is None:
+            size = int(np.prod(shape))
+            _view = _storage.host[:size].reshape(shape)
+
+        self._storage = _storage
+        self._view = _view
+
+        self.shape = _view.shape
+        self.packed = _storage.packed
+
+    # Operations with ndarrays on the left are evaluated on the graphics
+    # card as well, rather than on the host copy
+    __array_priority__ = 100
+
+    ndim = property(lambda self: len(self.shape))
+    size = property(lambda self: int(np.prod(self.shape)))
+    nbytes = property(lambda self: self.size * self.dtype.itemsize)
+
+    @property
+    def _lazy(self):
+        """Whether the array is an operation that has not been evaluated.
+
+        """
+        return self._expr is not None
+
+    def __getattr__(self, name):
+        # Evaluate deferred operations when their data is accessed
+        if name in ('_storage', '_view') and \
+               self.__dict__.get('_expr') is not None:
+            self.evaluate()
+            return self.__dict__[name]
+        raise AttributeError(name)
+
+    def evaluate(self):
+        """Compute the array, if it is the result of deferred operations.
+
+        Returns
+        -------
+        self : GPUArray
+
+        """
+        if self._expr is None:
+            return self
+
+        leaves = []
+        expr = self._expr.source(leaves, {})
+        names = ['x%d' % i for i in range(len(leaves))]
+
+        texture, = _kernel('out = %s' % expr, names)._launch(
+            leaves, self.shape, self.packed)
+
+        self._storage = _Storage(self.shape, texture, self.packed)
+        self._view = self._storage.host[:self.size].reshape(self.shape)
+        self._storage.readers = self._expr.readers
+
+        # Release the operands
+        self._expr = None
+
+        return self
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return "<GPUArray of shape %s, %s%s>" % (self.shape, self.dtype,
+                                                 self.packed and ", packed"
+                                                 or "")
+
+    # --- Host transfers
+
+    def get(self):
+        """Return a copy of the data as an ndarray.
+
+        """
+        return self._host().copy()
+
+    def _host(self):
+        """Return the (up to date) host copy of the data.
+
+        """
+        self._storage.to_host()
+        return self._view
+
+    def set(self, arr):
+        """Replace the data by that of an array of the same shape.
+
+        """
+        arr = np.asarray(arr)
+        if arr.shape != self.shape:
+            raise ValueError("Array of shape %s cannot be assigned to "
+                             "GPUArray of shape %s." % (arr.shape, self.shape))
+        self[...] = arr
+
+    def __array__(self, dtype=None):
+        if dtype is None:
+            return self.get()
+        return self.get().astype(dtype)
+
+    # --- Indexing
+
+    def _is_view_key(self, key):
+        """Whether indexing with `key` returns a view, rather than a copy.
+
+        """
+        if not isinstance(key, tuple):
+            key = (key,)
+
+        for k in key:
+            if not (isinstance(k, (int, long, slice, np.integer)) or \
+                    k is Ellipsis or k is None):
+                return False
+        return True
+
+    def __getitem__(self, key):
+        if not self._is_view_key(key):
+            return to_gpu(self._host()[key], packed=self.packed)
+
+        view = self._view[key]
+        if np.ndim(view) == 0:
+            return float(self._host()[key])
+
+        return GPUArray(view.shape, _storage=self._storage, _view=view)
+
+    def __setitem__(self, key, value):
+        if isinstance(value, GPUArray):
+            value = value._host()
+
+        # Deferred operations on the array see the old data
+        self._storage.evaluate_readers()
+
+        # Partial assignments keep the remaining data
+        self._storage.to_host()
+        self._view[key] = value
+        self._storage.host_modified()
+
+    def copy(self):
+        """Return a copy of the array, computed on the graphics card.
+
+        """
+        return _kernel('out = a', 'a')(self)
+
+    # --- Use in kernels
+
+    def _layout(self):
+        """Return the offset and strides of the array's elements in
+        the storage, in units of elements.
+
+        """
+        itemsize = self.dtype.itemsize
+        offset = (self._view.__array_interface__['data'][0] - \
+                  self._storage.host.__array_interface__['data'][0])
+        return offset // itemsize, [s // itemsize for s in self._view.strides]
+
+    def _signature(self, shape, packed=False):
+        """Return the texture target of the storage, and whether the
+        elements can be read at the texel where an output of the given
+        shape and layout is written (no index computation needed).
+
+        """
+        storage = self._storage
+        offset, strides = self._layout()
+        width, height = texture_shape(shape, packed)
+        direct = (storage.packed == packed and offset == 0 and \
+                  self._view.flags.c_contiguous and width == storage.width)
+
+        # Tiles are only read in place
+        if storage.tiled:
+            direct = direct and height == storage.height
+
+        return storage.target, direct
+
+    # --- Reductions
+
+    def _reduce(self, reduction):
+        """Apply a reduction (see `scikits.gpu.reduction`) to the array.
+
+        """
+        if self.size == 0:
+            raise ValueError("Cannot reduce an empty array.")
+
+        x = self
+        if not self._signature(self.shape, self.packed)[1]:
+            x = self.copy()
+
+        x._storage.to_device()
+        size = texture_shape(self.shape, self.packed)
+        if self.packed:
+            return reduction(x._storage.texture, size, self.size,
+                             packed=True)
+        return reduction(x._storage.texture, size, self.size)
+
+    def _reduce_value(self, reduction):
+        """Apply a reduction, and return its value for the elements
+        (packed reductions yield it directly, others in the first
+        colour band).
+
+        """
+        value = self._reduce(reduction)
+        if not self.packed:
+            value = value[0]
+        return float(value)
+
+    def sum(self):
+        """Return the sum of all elements.
+
+        """
+        return self._reduce_value(reduce_sum)
+
+    def mean(self):
+        """Return the mean of all elements.
+
+        """
+        return self.sum() / self.size
+
+    def min(self):
+        """Return the smallest element.
+
+        """
+        return self._reduce_value(reduce_min)
+
+    def max(self):
+        """Return the largest element.
+
+        """
+        return self._reduce_value(reduce_max)
+
+    def argmax(self):
+        """Return the index of the largest element in the flattened
+        array.  Of equal elements, the first is chosen.
+
+        """
+        if self.packed:
+            return self._reduce(reduce_argmax)
+
+        x, y = self._reduce(reduce_argmax)
+        return y * texture_shape(self.shape)[0] + x
+
+    # --- Arithmetic
+
+    def __add__(self, other):
+        return _operation('(%s + %s)', self, other)
+
+    def __radd__(self, other):
+        return _operation('(%s + %s)', other, self)
+
+    def __sub__(self, other):
+        return _operation('(%s - %s)', self, other)
+
+    def __rsub__(self, other):
+        return _operation('(%s - %s)', other, self)
+
+    def __mul__(self, other):
+        return _operation('(%s * %s)', self, other)
+
+    def __rmul__(self, other):
+        return _operation('(%s * %s)', other, self)
+
+    def __div__(self, other):
+        return _operation('(%s / %s)', self, other)
+
+    def __rdiv__(self, other):
+        return _operation('(%s / %s)', other, self)
+
+    __truediv__ = __div__
+    __rtruediv__ = __rdiv__
+
+    def __pow__(self, other):
+        return _operation('pow(%s, %s)', self, other)
+
+    def __rpow__(self, other):
+        return _operation('pow(%s, %s)', other, self)
+
+    def __neg__(self):
+        return _operation('(-%s)', self)
+
+    def __pos__(self):
+        return self
+
+    def __abs__(self):
+        return _operation('abs(%s)', self)
+
+def _operation(format, *operands):
+    """Defer an elementwise operation.
+
+    Parameters
+    ----------
+    format : str
+        GLSL expression, with a ``%s`` for each operand.
+    operands : GPUArray, ndarray or float
+
+    Returns
+    -------
+    out : GPUArray
+        Unevaluated result.
+
+    """
+    # The result is packed if all array operands are
+    arrays = [x for x in operands if isinstance(x, GPUArray)]
+    packed = bool(arrays) and not [x for x in arrays if not x.packed]
+
+    shape = None
+    values = []
+    for x in operands:
+        if np.ndim(x) == 0 and not isinstance(x, GPUArray):
+            values.append(float(x))
+            continue
+
+        if not isinstance(x, GPUArray):
+            x = to_gpu(np.asarray(x, dtype=np.float32), packed=packed)
+
+        if shape is None:
+            shape = x.shape
+        elif x.shape != shape:
+            raise ValueError("Operands have shapes %s and %s." % \
+                             (shape, x.shape))
+        values.append(x)
+
+    expr = _Expression(format, values)
+    if expr.size > max_fused:
+        for x in values:
+            if isinstance(x, GPUArray):
+                x.evaluate()
+        expr = _Expression(format, values)
+
+    out = GPUArray(shape, packed=packed, _expr=expr)
+
+    # Writes to the operands evaluate the result first
+    for x in values:
+        if isinstance(x, GPUArray) and x._lazy:
+            _add_reader(x._expr.readers, out)
+        elif isinstance(x, GPUArray):
+            _add_reader(x._storage.readers, out)
+
+    return out
+
+# Kernels of copies and of fused operations, by operation
+_kernels = {}
+
+def _kernel(operation, args):
+    if operation not in _kernels:
+        _kernels[operation] = ElementwiseKernel(operation, args)
+    return _kernels[operation]
+
+def to_gpu(arr, packed=False):
+    """Create a GPUArray holding a copy of `arr`.
+
+    The data is uploaded when the array is first used on the graphics
+    card.  If `packed`, four elements are stored in each texel (see
+    `GPUArray`).
+
+    """
+    arr = np.asarray(arr)
+    out = GPUArray(arr.shape, packed=packed)
+    out.set(arr)
+    return out
+
+def empty(shape, dtype=np.float32, packed=False):
+    """Create an uninitialised GPUArray.
+
+    """
+    return GPUArray(shape, dtype=dtype, packed=packed)
+
+def zeros(shape, dtype=np.float32, packed=False):
+    """Create a GPUArray filled with zeros.
+
+    """
+    out = GPUArray(shape, dtype=dtype, packed=packed)
+    out._storage.host.fill(0)
+    out._storage.host_modified()
+    return out
@@ -0,0 +1,338 @@
+"""Evaluation of a program for many sets of uniform values at once.
+
+"""
+
+__all__ = ['BatchKernel']
+
+from pyglet import gl
+import numpy as np
+import re
+
+from scikits.gpu.config import require_extension, max_texture_size, \
+                              GLSLError
+from scikits.gpu.shader import Program, Shader
+from scikits.gpu.framebuffer import Framebuffer
+from scikits.gpu.texture import Texture
+from scikits.gpu.canvas import Canvas, quad
+from scikits.gpu.state import current_state, ContextLocal
+
+# Number of components of each type of parameter, and the swizzle that
+# extracts it from a texel
+_parameter_types = {'float': (1, '.x'),
+                    'vec2': (2, '.xy'),
+                    'vec3': (3, '.xyz'),
+                    'vec4': (4, '')}
+
+_main = re.compile(r'\bvoid\s+main\s*\(')
+
+# Canvas of the cells of the atlas, created when first needed in each
+# context
+_cell_canvas = ContextLocal(lambda: Canvas(quad))
+
+def _grid(count, width, height, size):
+    """Return the number of columns and rows of cells of `width` x
+    `height` pixels in an atlas that holds `count` images, or as many as
+    fit into a texture of `size` x `size` texels.
+
+    >>> _grid(10, 4, 4, 64)
+    (4, 3)
+
+    >>> _grid(100, 4, 4, 16)
+    (4, 4)
+
+    """
+    columns, rows = size // width, size // height
+    if not (columns and rows):
+        raise ValueError("Images of %dx%d pixels exceed the maximum "
+                         "texture size of %d." % (width, height, size))
+
+    count = min(count, columns * rows)
+    columns = min(count, columns, int(np.ceil(np.sqrt(count))))
+    return columns, -(-count // columns)
+
+class BatchKernel(object):
+    def __init__(self, shaders, parameters):
+        """Program that is run for many sets of parameter values in a
+        single draw call.
+
+        Parameters
+        ----------
+        shaders : list of Shader
+            Vertex and fragment shaders of a program that renders an
+            image covering the viewport, e.g. ``zoo.mandelbrot()``.
+        parameters : list of str
+            Uniforms that take a different value in each image.  Each
+            must be declared on its own, as ``uniform float``, ``vec2``,
+            ``vec3`` or ``vec4``.  Other uniforms hold the same value
+            for all images.
+
+        Notes
+        -----
+        The parameter values are uploaded as a texture, with one row
+        per image.  All images are rendered into the cells of a single
+        texture (the atlas), by instanced drawing (ARB_draw_instanced):
+        the vertex shader places each instance in its cell, and looks
+        up its parameters by ``gl_InstanceIDARB``, while the fragment
+        shader finds them from the cell in which the fragment lies.
+        The atlas is then copied to host memory at once.
+
+        The shaders are rewritten for this purpose, so that their
+        ``main`` functions are renamed, and the parameters become global
+        variables.  Vertex shaders must place the geometry in the
+        viewport as usual (e.g. by ``ftransform()``), while fragment
+        shaders should not rely on ``gl_FragCoord``, which refers to
+        the atlas.
+
+        Examples
+        --------
+        >>> kernel = BatchKernel(zoo.mandelbrot(), ['offset', 'zoom'])
+        >>> values = {'offset': [[-1.0, 0.0], [-0.5, 0.5]],
+        ...           'zoom': [2.0, 8.0]}
+        >>> images = kernel(values, 80, 60, uniforms={'width_ratio': 4/3.})
+        >>> images.shape
+        (2, 60, 80, 4)
+
+        """
+        self.shaders = list(shaders)
+        self.parameters = list(parameters)
+
+        # Type of each parameter
+        self.types = {}
+        for shader in self.shaders:
+            for name in self.parameters:
+                match = self._declaration(name).search(shader.source)
+                if match is not None:
+                    self.types[name] = match.group(1)
+
+        for name in self.parameters:
+            if name not in self.types:
+                raise GLSLError("Parameter '%s' is not declared as a "
+                                "uniform float, vec2, vec3 or vec4." % name)
+
+        # Generated programs, by target of the parameter texture, for
+        # each context
+        self._programs = ContextLocal(dict)
+
+    def _declaration(self, name):
+        return re.compile(r'\buniform\s+(%s)\s+%s\s*;' % \
+                          ('|'.join(_parameter_types), name))
+
+    def source(self, shader, target):
+        """Rewrite the source of a shader to draw all instances.
+
+        Parameters
+        ----------
+        shader : Shader
+            Vertex or fragment shader given to the kernel.
+        target : int
+            Texture target of the parameter texture.
+
+        """
+        source = shader.source
+        if len(_main.findall(source)) != 1:
+            raise GLSLError("Shader must define one main function.")
+        source = _main.sub('void _main(', source)
+
+        # Parameters used by this shader become global variables
+        declared = []
+        for name in self.parameters:
+            source, n = self._declaration(name).subn(r'\1 %s;' % name,
+                                                     source)
+            if n:
+                declared.append(name)
+
+        lines = []
+        if shader.type == 'vertex':
+            lines += ['#extension GL_ARB_draw_instanced : enable']
+
+        if target == gl.GL_TEXTURE_2D:
+            lines += ['uniform sampler2D _params;',
+                      'uniform vec2 _params_scale;',
+                      '',
+                      'vec4 _param(float k, float j) {',
+                      '    return texture2D(_params, '
+                      '(vec2(j, k) + 0.5) * _params_scale);',
+                      '}']
+        else:
+            lines += ['#extension GL_ARB_texture_rectangle : enable',
+                      'uniform sampler2DRect _params;',
+                      '',
+                      'vec4 _param(float k, float j) {',
+                      '    return texture2DRect(_params, vec2(j, k) + 0.5);',
+                      '}']
+
+        # Columns and rows of the atlas, and size of a cell in pixels
+        lines += ['uniform vec2 _grid;',
+                  'uniform vec2 _cell;']
+
+        main = ['void main(void) {']
+        if shader.type == 'vertex':
+            main += ['    float _k = float(gl_InstanceIDARB);']
+        else:
+            main += ['    vec2 _c = floor(gl_FragCoord.xy / _cell);',
+                     '    float _k = _c.y * _grid.x + _c.x;']
+
+        for name in declared:
+            j = self.parameters.index(name)
+            swizzle = _parameter_types[self.types[name]][1]
+            main += ['    %s = _param(_k, %d.0)%s;' % (name, j, swizzle)]
+
+        main += ['    _main();']
+
+        if shader.type == 'vertex':
+            # Move the viewport, [-1, 1] x [-1, 1], onto the cell
+            main += ['    float _row = floor((_k + 0.5) / _grid.x);',
+                     '    vec2 _offset = 2.0 * vec2(_k - _row * _grid.x, '
+                     '_row) + 1.0;',
+                     '    gl_Position.xy = ((gl_Position.xy / gl_Position.w '
+                     '+ _offset) / _grid - 1.0) * gl_Position.w;']
+
+        main += ['}']
+
+        # Extensions must be enabled before any other statement
+        header = ''
+        version = re.match(r'\s*#version[^\n]*\n', source)
+        if version is not None:
+            header = version.group(0)
+            source = source[version.end():]
+
+        return '\n'.join([header] + lines + [source] + main)
+
+    def program(self, target):
+        """Return the compiled program, for a parameter texture of the
+        given target.
+
+        """
+        programs = self._programs.get()
+        if target not in programs:
+            shaders = []
+            for shader in self.shaders:
+                shaders.append(Shader(self.source(shader, target),
+                                      type=shader.type))
+            programs[target] = Program(shaders)
+
+        return programs[target]
+
+    def _table(self, values):
+        """Arrange the parameter values in an array of shape
+        (count, len(parameters), 4).
+
+        """
+        columns = []
+        for name in self.parameters:
+            size = _parameter_types[self.types[name]][0]
+            column = np.asarray(values[name], dtype=np.float32)
+            column = column.reshape((len(column), -1))
+            if column.shape[1] != size:
+                raise ValueError("Parameter '%s' needs %d values per "
+                                 "image." % (name, size))
+            columns.append(column)
+
+        count = len(columns[0])
+        if count == 0 or [c for c in columns if len(c) != count]:
+            raise ValueError("All parameters must have the same, non-zero "
+                             "number of values.")
+
+        table = np.zeros((count, len(columns), 4), dtype=np.float32)
+        for j, column in enumerate(columns):
+            table[:, j, :column.shape[1]] = column
+
+        return table
+
+    def __call__(self, values, width, height, bands=4, uniforms=None):
+        """Render an image for each set of parameter values.
+
+        Parameters
+        ----------
+        values : dict or structured ndarray
+            Values of each parameter, as an array of shape (K,) or
+            (K, n) for ``vecn`` parameters.
+        width, height : int
+            Size of each image.
+        bands : {1, 2, 3, 4}
+            Number of colour bands to keep.
+        uniforms : dict, optional
+            Values of the other uniforms, shared by all images.
+
+        Returns
+        -------
+        out : ndarray
+            Images of shape (K, height, width, bands).
+
+        Notes
+        -----
+        Up to as many images as fit into the largest texture are
+        rendered at once; more images take several passes.
+
+        """
+        require_extension('ARB_draw_instanced')
+
+        table = self._table(values)
+        count = len(table)
+
+        out = np.empty((count, height, width, bands), dtype=np.float32)
+
+        columns, rows = _grid(count, width, height, max_texture_size())
+        per_pass = columns * rows
+
+        cell_canvas = _cell_canvas.get()
+        state = current_state()
+        state.refresh()
+        previous = state.get_framebuffer()
+        viewport = state.viewport
+
+        program = None
+        try:
+            for first in range(0, count, per_pass):
+                n = min(per_pass, count - first)
+                columns, rows = _grid(n, width, height, max_texture_size())
+
+                params = Texture.from_array(
+                    table[first:first + n],
+                    internalformat=gl.GL_RGBA32F_ARB, filter=gl.GL_NEAREST)
+
+                atlas = Framebuffer()
+                atlas.add_texture(
+                    [columns * width, rows * height, bands],
+                    filter=gl.GL_NEAREST,
+                    internalformat={4: gl.GL_RGBA32F_ARB}.get(
+                        bands, gl.GL_RGB32F_ARB))
+
+                program = self.program(params.target)
+                program.use()
+
+                active = set(program.active_uniforms)
+                for name, value in (uniforms or {}).items():
+                    program[name] = value
+
+                program['_params'] = 0
+                if '_params_scale' in active:
+                    program['_params_scale'] = [1. / params.width,
+                                                1. / params.height]
+                for name, value in [('_grid', [columns, rows]),
+                                    ('_cell', [width, height])]:
+                    if name in active:
+                        program[name] = [float(k) for k in value]
+
+                state.bind_texture(params.target, params.id, 0)
+                atlas.bind()
+                state.set_viewport(0, 0, columns * width, rows * height)
+
+                cell_canvas.bind()
+                cell_canvas.draw(instances=n)
+                cell_canvas.unbind()
+
+                state.bind_texture(params.target, 0)
+
+                images = atlas.read().reshape(rows, height, columns, width,
+                                              bands)
+                images = images.transpose(0, 2, 1, 3, 4)
+                out[first:first + n] = images.reshape(
+                    (rows * columns, height, width, bands))[:n]
+        finally:
+            if program is not None:
+                program.disable()
+            state.set_viewport(*viewport)
+            state.bind_framebuffer(previous)
+
+        return out
@@ -0,0 +1,269 @@
+"""Pixel buffer objects and fences, used to move data between host and
+graphics memory without stalling the pipeline.
+
+"""
+
+__all__ = ['PixelBuffer', 'Fence', 'PixelBufferRing']
+
+from pyglet import gl
+import ctypes
+
+from scikits.gpu.config import have_extension, initialize
+from scikits.gpu import glext
+
+class PixelBuffer(object):
+    def __init__(self, target=glext.GL_PIXEL_PACK_BUFFER, size=0,
+                 usage=None):
+        """Pixel Buffer Object (PBO).
+
+        A buffer in graphics memory which acts as the destination of
+        pixel reads (``glReadPixels``) or the source of texture uploads
+        (``glTexSubImage2D``).  Transfers through a PBO return
+        immediately and complete asynchronously.
+
+        Parameters
+        ----------
+        target : {GL_PIXEL_PACK_BUFFER, GL_PIXEL_UNPACK_BUFFER}
+            Pack buffers receive data from OpenGL, unpack buffers
+            provide data to OpenGL.
+        size : int
+            Initial size, in bytes.
+        usage : GLenum
+            Usage hint.  Defaults to ``GL_STREAM_READ`` for pack and
+            ``GL_STREAM_DRAW`` for unpack buffers.
+
+        """
+        initialize()
+
+        if target == glext.GL_PIXEL_PACK_BUFFER:
+            default_usage = gl.GL_STREAM_READ
+        elif target == glext.GL_PIXEL_UNPACK_BUFFER:
+            default_usage = gl.GL_STREAM_DRAW
+        else:
+            raise ValueError("Invalid pixel buffer target.")
+
+        self.target = target
+        self.usage = usage or default_usage
+        self.size = 0
+
+        id = gl.GLuint()
+        gl.glGenBuffers(1, ctypes.byref(id))
+        self.id = id
+
+        if size:
+            self.resize(size)
+
+    def bind(self):
+        """Bind the buffer to its target.
+
+        """
+        if not self.id:
+            raise RuntimeError("Cannot bind to deleted pixel buffer.")
+        gl.glBindBuffer(self.target, self.id)
+
+    def unbind(self):
+        gl.glBindBuffer(self.target, 0)
+
+    def resize(self, size):
+        """Allocate `size` bytes of (uninitialised) storage.
+
+        The buffer is left bound.
+
+        """
+        self.bind()
+        gl.glBufferData(self.target, size, None, self.usage)
+        self.size = size
+
+    def reserve(self, size):
+        """Make sure that the buffer holds at least `size` bytes.
+
+        The buffer is left bound.
+
+        """
+        if size > self.size:
+            self.resize(size)
+        else:
+            self.bind()
+
+    def read(self, out, offset=0):
+        """Copy the buffer's contents to host memory.
+
+        Parameters
+        ----------
+        out : ndarray
+            C-contiguous output array; ``out.nbytes`` bytes are copied.
+        offset : int
+            Position in the buffer, in bytes, from where to copy.
+
+        """
+        self.bind()
+        gl.glGetBufferSubData(self.target, offset, out.nbytes,
+                              out.ctypes.data)
+        self.unbind()
+
+    def write(self, data, offset=0):
+        """Copy host memory into the buffer.
+
+        Parameters
+        ----------
+        data : ndarray
+            C-contiguous input array.
+        offset : int
+            Position in the buffer, in bytes, where to copy to.
+
+        """
+        self.reserve(offset + data.nbytes)
+        gl.glBufferSubData(self.target, offset, data.nbytes,
+                           data.ctypes.data)
+        self.unbind()
+
+    def __del__(self):
+        """Delete the buffer from the graphics card's memory.
+
+        """
+        if getattr(self, 'id', None):
+            try:
+                gl.glDeleteBuffers(1, ctypes.byref(self.id))
+            except:
+                pass
+            self.id = None
+
+class Fence(object):
+    def __init__(self):
+        """Marker in the OpenGL command stream.
+
+        The fence is signaled once all commands issued before it have
+        completed.  Without the ARB_sync extension, waiting on a fence
+        falls back to ``glFinish``.
+
+        """
+        if have_extension('ARB_sync'):
+            self._sync = glext.glFenceSync(glext.GL_SYNC_GPU_COMMANDS_COMPLETE,
+                                           0)
+        else:
+            self._sync = None
+
+        self._signaled = False
+
+    def wait(self, timeout=None):
+        """Wait for the commands before the fence to complete.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Maximum time to wait, in seconds.  By default, wait
+            indefinitely.
+
+        Returns
+        -------
+        signaled : bool
+            Whether the commands have completed.
+
+        """
+        if self._signaled:
+            return True
+
+        if self._sync is None:
+            gl.glFinish()
+            self._signaled = True
+            return True
+
+        if timeout is None:
+            # Wait in steps of a second, so that the process remains
+            # responsive to interrupts
+            nanoseconds = 10**9
+        else:
+            nanoseconds = int(timeout * 1e9)
+
+        while True:
+            status = glext.glClientWaitSync(
+                self._sync, glext.GL_SYNC_FLUSH_COMMANDS_BIT, nanoseconds)
+
+            if status in (glext.GL_ALREADY_SIGNALED,
+                          glext.GL_CONDITION_SATISFIED):
+                self._release()
+                return True
+            elif status == glext.GL_WAIT_FAILED:
+                raise RuntimeError("Waiting on OpenGL fence failed.")
+            elif timeout is not None:
+                return False
+
+    @property
+    def signaled(self):
+        """Whether the commands before the fence have completed.
+
+        Does not block, unless the fence falls back to ``glFinish``.
+
+        """
+        return self.wait(0)
+
+    def _release(self):
+        if self._sync is not None:
+            glext.glDeleteSync(self._sync)
+            self._sync = None
+        self._signaled = True
+
+    def __del__(self):
+        if getattr(self, '_sync', None) is not None:
+            try:
+                glext.glDeleteSync(self._sync)
+            except:
+                pass
+
+class PixelBufferRing(object):
+    def __init__(self, target=glext.GL_PIXEL_UNPACK_BUFFER, count=2):
+        """Pixel buffers that are used in turn.
+
+        A buffer is reused only once OpenGL has finished with its
+        previous contents, so that up to `count` transfers can be in
+        flight at the same time.
+
+        Parameters
+        ----------
+        target : {GL_PIXEL_PACK_BUFFER, GL_PIXEL_UNPACK_BUFFER}
+            Target of the buffers.
+        count : int
+            Number of buffers.
+
+        """
+        self.target = target
+        self.count = count
+
+        # [buffer, fence of the last transfer] pairs, created on demand
+        self._entries = []
+        self._index = 0
+
+    def acquire(self, size):
+        """Return the next buffer, holding at least `size` bytes.
+
+        Waits until OpenGL is done with the buffer's previous contents.
+
+        """
+        if len(self._entries) < self.count:
+            self._entries.append([PixelBuffer(self.target), None])
+            entry = self._entries[-1]
+        else:
+            entry = self._entries[self._index]
+            self._index = (self._index + 1) % self.count
+
+        pbo, fence = entry
+        if fence is not None:
+            fence.wait()
+            entry[1] = None
+
+        pbo.reserve(size)
+        return pbo
+
+    def release(self, pbo):
+        """Mark the end of the transfer that uses `pbo`.
+
+        Must be called after the OpenGL commands that use the buffer
+        have been issued.
+
+        """
+        for entry in self._entries:
+            if entry[0] is pbo:
+                entry[1] = Fence()
+                return
+
+        raise ValueError("Buffer does not belong to this ring.")
@@ -0,0 +1,189 @@
+"""Caching of OpenGL objects.
+
+"""
+
+__all__ = ['HandleCache', 'BinaryCache']
+
+from collections import OrderedDict
+import os
+import struct
+import tempfile
+
+class HandleCache(object):
+    def __init__(self, delete, max_unused=32):
+        """Reference-counted cache of OpenGL objects.
+
+        Objects are created on first request and shared between all
+        users of the same key.  Once an object is no longer referenced,
+        it is kept around in case it is requested again.  When more
+        than `max_unused` objects are unreferenced, the least recently
+        used of them are deleted.
+
+        Parameters
+        ----------
+        delete : callable
+            Called as ``delete(value)`` to free an evicted object.
+        max_unused : int
+            Maximum number of unreferenced objects to keep.
+
+        """
+        self._delete = delete
+        self.max_unused = max_unused
+
+        # key -> [value, reference count]
+        self._entries = {}
+
+        # Keys of unreferenced entries, least recently used first
+        self._unused = OrderedDict()
+
+    def acquire(self, key, create):
+        """Return the object stored under `key` and add a reference to it.
+
+        Parameters
+        ----------
+        key : hashable
+            Identifier of the object.
+        create : callable
+            Called without arguments to create the object if it is not
+            in the cache.  Exceptions are propagated, and nothing is
+            stored.
+
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = [create(), 0]
+            self._entries[key] = entry
+        elif entry[1] == 0:
+            del self._unused[key]
+
+        entry[1] += 1
+        return entry[0]
+
+    def release(self, key):
+        """Remove a reference to the object stored under `key`.
+
+        """
+        entry = self._entries[key]
+        entry[1] -= 1
+
+        if entry[1] == 0:
+            self._unused[key] = None
+            self._evict(self.max_unused)
+
+    def _evict(self, max_unused):
+        while len(self._unused) > max_unused:
+            key, _ = self._unused.popitem(last=False)
+            value, refcount = self._entries.pop(key)
+            self._delete(value)
+
+    def clear(self):
+        """Delete all unreferenced objects.
+
+        """
+        self._evict(0)
+
+    def refcount(self, key):
+        """Number of references to the object stored under `key`.
+
+        """
+        try:
+            return self._entries[key][1]
+        except KeyError:
+            return 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+class BinaryCache(object):
+    def __init__(self, path):
+        """On-disk store of program binaries.
+
+        Each binary is kept in its own file, named after its key, and
+        prefixed with the OpenGL binary format.
+
+        Parameters
+        ----------
+        path : str
+            Cache directory.  It is created if it does not exist.
+
+        """
+        self.path = path
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def _filename(self, key):
+        return os.path.join(self.path, key + '.bin')
+
+    def load(self, key):
+        """Return the binary stored under `key`.
+
+        Returns
+        -------
+        format : int
+            OpenGL binary format.
+        data : str
+            The binary.
+
+        If no such binary is stored, None is returned instead.
+
+        """
+        try:
+            f = open(self._filename(key), 'rb')
+        except IOError:
+            return None
+
+        try:
+            data = f.read()
+        finally:
+            f.close()
+
+        if len(data) < 4:
+            return None
+
+        format, = struct.unpack('<I', data[:4])
+        return format, data[4:]
+
+    def save(self, key, format, data):
+        """Store a binary under `key`.
+
+        The file is written under a temporary name and then renamed,
+        so that concurrent processes never see a partial binary.
+
+        """
+        fd, tmp_name = tempfile.mkstemp(dir=self.path)
+        try:
+            f = os.fdopen(fd, 'wb')
+            try:
+                f.write(struct.pack('<I', format))
+                f.write(data)
+            finally:
+                f.close()
+            os.rename(tmp_name, self._filename(key))
+        except:
+            os.remove(tmp_name)
+            raise
+
+    def __contains__(self, key):
+        return os.path.exists(self._filename(key))
+
+    def remove(self, key):
+        """Remove the binary stored under `key`, e.g. after the driver
+        rejected it.
+
+        """
+        try:
+            os.remove(self._filename(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        """Remove all stored binaries.
+
+        """
+        for name in os.listdir(self.path):
+            if name.endswith('.bin'):
+                os.remove(os.path.join(self.path, name))
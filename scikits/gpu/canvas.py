@@ -0,0 +1,181 @@
+"""Full-screen geometry, through which fragment programs are run.
+
+"""
+
+__all__ = ['Canvas', 'canvas', 'run_pass']
+
+from pyglet import gl
+from pyglet.gl.lib import MissingFunctionException
+import numpy as np
+import ctypes
+
+from scikits.gpu.config import initialize
+from scikits.gpu.state import current_state, ContextLocal
+from scikits.gpu import glext
+
+# A single triangle that covers the viewport, [-1, 1] x [-1, 1]
+_vertices = np.array([-1.0, -1.0,
+                      3.0, -1.0,
+                      -1.0, 3.0], dtype=np.float32)
+
+# Two triangles that cover exactly the viewport
+quad = np.array([-1.0, -1.0,
+                 1.0, -1.0,
+                 -1.0, 1.0,
+                 -1.0, 1.0,
+                 1.0, -1.0,
+                 1.0, 1.0], dtype=np.float32)
+
+class Canvas(object):
+    def __init__(self, vertices=None):
+        """Triangle covering the viewport, stored in graphics memory.
+
+        Drawing the canvas runs the current fragment program once for
+        each pixel of the viewport.  The vertices are held in a vertex
+        buffer object, and fed to generic vertex attribute 0, which
+        vertex shaders read as ``gl_Vertex`` (or as an input declared
+        with ``layout(location = 0)``).  Where vertex array objects are
+        available (OpenGL 3.0, and required by core profiles), the
+        attribute setup is recorded once, so that binding the canvas
+        is a single call.
+
+        Parameters
+        ----------
+        vertices : ndarray, optional
+            Positions (x, y) of the vertices of other triangles to
+            draw instead, flattened.  E.g., `quad` covers exactly the
+            viewport, which is needed when the geometry is moved
+            elsewhere by the vertex shader.
+
+        Examples
+        --------
+        >>> c = canvas()
+        >>> c.bind()
+        >>> for i in range(10):
+        ...     c.draw()
+        >>> c.unbind()
+
+        """
+        initialize()
+
+        if vertices is None:
+            vertices = _vertices
+        vertices = np.ascontiguousarray(vertices, dtype=np.float32)
+        self.count = vertices.size // 2
+
+        vbo = gl.GLuint()
+        gl.glGenBuffers(1, ctypes.byref(vbo))
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, vbo)
+        gl.glBufferData(gl.GL_ARRAY_BUFFER, vertices.nbytes,
+                        vertices.ctypes.data, gl.GL_STATIC_DRAW)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+        self.vbo = vbo
+
+        self.vao = None
+        try:
+            vao = gl.GLuint()
+            glext.glGenVertexArrays(1, ctypes.byref(vao))
+        except MissingFunctionException:
+            pass
+        else:
+            glext.glBindVertexArray(vao)
+            self._set_attributes()
+            glext.glBindVertexArray(0)
+            self.vao = vao
+
+    def _set_attributes(self):
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.vbo)
+        gl.glVertexAttribPointer(0, 2, gl.GL_FLOAT, gl.GL_FALSE, 0, None)
+        gl.glEnableVertexAttribArray(0)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+
+    def bind(self):
+        """Prepare for drawing the canvas.
+
+        """
+        if self.vao is not None:
+            glext.glBindVertexArray(self.vao)
+        else:
+            self._set_attributes()
+
+    def unbind(self):
+        """Restore the vertex array state after drawing.
+
+        """
+        if self.vao is not None:
+            glext.glBindVertexArray(0)
+        else:
+            gl.glDisableVertexAttribArray(0)
+
+    def draw(self, instances=1):
+        """Draw the canvas, which must be bound.
+
+        Parameters
+        ----------
+        instances : int
+            Number of times to draw the canvas, in a single call
+            (ARB_draw_instanced).  Vertex shaders tell the instances
+            apart by ``gl_InstanceIDARB``.
+
+        """
+        if instances == 1:
+            gl.glDrawArrays(gl.GL_TRIANGLES, 0, self.count)
+        else:
+            glext.glDrawArraysInstancedARB(gl.GL_TRIANGLES, 0, self.count,
+                                           instances)
+
+    def __del__(self):
+        try:
+            if self.vao is not None:
+                glext.glDeleteVertexArrays(1, ctypes.byref(self.vao))
+            gl.glDeleteBuffers(1, ctypes.byref(self.vbo))
+        except:
+            pass
+
+# Canvas shared by all passes of a context, created when first needed
+_canvas = ContextLocal(lambda: Canvas())
+
+def canvas():
+    """Return the canvas shared by all passes.
+
+    """
+    return _canvas.get()
+
+def run_pass(program, framebuffer=None):
+    """Run a fragment program once for each pixel of a framebuffer.
+
+    Parameters
+    ----------
+    program : Program
+        Program to run, with its uniforms set.
+    framebuffer : Framebuffer, optional
+        Framebuffer to render to.  The viewport is set to the size of
+        its first texture for the duration of the pass.  By default,
+        render to the current framebuffer and viewport.
+
+    """
+    state = current_state()
+    was_bound = program.bound
+
+    if framebuffer is not None:
+        state.refresh()
+        previous = state.get_framebuffer()
+        viewport = state.viewport
+
+        tex = framebuffer._textures[0]
+        framebuffer.bind()
+        state.set_viewport(0, 0, tex.width, tex.height)
+
+    c = canvas()
+    try:
+        program.use()
+        c.bind()
+        c.draw()
+    finally:
+        c.unbind()
+        if not was_bound:
+            program.disable()
+
+        if framebuffer is not None:
+            state.set_viewport(*viewport)
+            state.bind_framebuffer(previous)
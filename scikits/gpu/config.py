@@ -1,15 +1,22 @@
-__all__ = ['HardwareSupportError', 'GLSLError', 'MAX_COLOR_ATTACHMENTS',
-           'require_extension', 'hardware_info']
+"""Hardware configuration and capabilities.
+
+Nothing is queried from OpenGL when this module is imported.  Each
+capability is probed the first time it is needed, and then remembered
+until `reset` is called (e.g. after switching to a different context).
+
+The constant ``MAX_COLOR_ATTACHMENTS`` is deprecated in favour of
+`max_color_attachments`.  It is None until the capability has been
+probed, which `initialize` does.
+
+"""
+
+__all__ = ['HardwareSupportError', 'GLSLError', 'max_color_attachments',
+           'max_texture_size', 'have_extension', 'require_extension',
+           'hardware_info', 'initialize', 'reset']
 
 from pyglet import gl
-import pyglet.gl.gl_info as gli
 import ctypes
 
-MAX_COLOR_ATTACHMENTS = gl.GLint()
-gl.glGetIntegerv(gl.GL_MAX_COLOR_ATTACHMENTS,
-                 ctypes.byref(MAX_COLOR_ATTACHMENTS))
-MAX_COLOR_ATTACHMENTS = MAX_COLOR_ATTACHMENTS.value
-
 class HardwareSupportError(Exception):
     def __init__(self, message):
         self.message = "Your graphics hardware does not support %s." % \
@@ -24,29 +31,132 @@ class DriverError(Exception):
 class GLSLError(Exception):
     pass
 
+# Capabilities probed so far
+_probed = {}
+
+#: Deprecated, use `max_color_attachments`.  Set when that is probed.
+MAX_COLOR_ATTACHMENTS = None
+
+def _get_string(name):
+    return ctypes.cast(gl.glGetString(name), ctypes.c_char_p).value
+
+def _get_integer(name):
+    key = ('integer', name)
+    if key not in _probed:
+        value = gl.GLint()
+        gl.glGetIntegerv(name, ctypes.byref(value))
+        _probed[key] = value.value
+
+    return _probed[key]
+
+def max_color_attachments():
+    """Maximum number of colour attachments of a framebuffer object.
+
+    """
+    global MAX_COLOR_ATTACHMENTS
+
+    MAX_COLOR_ATTACHMENTS = _get_integer(gl.GL_MAX_COLOR_ATTACHMENTS_EXT)
+    return MAX_COLOR_ATTACHMENTS
+
+def max_texture_size():
+    """Maximum width and height of a texture.
+
+    """
+    return _get_integer(gl.GL_MAX_TEXTURE_SIZE)
+
+def have_extension(ext):
+    """Determine whether the given graphics extension is supported.
+
+    Parameters
+    ----------
+    ext : str
+        Name of the extension, with or without the ``GL_`` prefix.
+
+    """
+    if 'extensions' not in _probed:
+        _probed['extensions'] = set((_get_string(gl.GL_EXTENSIONS)
+                                     or '').split())
+
+    if not ext.startswith('GL_'):
+        ext = 'GL_' + ext
+
+    return ext in _probed['extensions']
+
 def require_extension(ext):
     """Ensure that the given graphics extension is supported.
 
     """
-    if not gl.gl_info.have_extension('GL_' + ext):
+    if not have_extension(ext):
         raise HardwareSupportError("the %s extension" % ext)
 
-hardware_info = {'vendor': gli.get_vendor(),
-                 'renderer': gli.get_renderer(),
-                 'version': gli.get_version()}
+class _HardwareInfo(dict):
+    """Vendor, renderer and version of the OpenGL driver.
+
+    The driver is queried the first time the dictionary is accessed.
+
+    """
+    def _query(self):
+        if not dict.__len__(self):
+            dict.update(self,
+                        vendor=_get_string(gl.GL_VENDOR),
+                        renderer=_get_string(gl.GL_RENDERER),
+                        version=_get_string(gl.GL_VERSION))
+
+def _querying(name):
+    method = getattr(dict, name)
+
+    def query_first(self, *args):
+        self._query()
+        return method(self, *args)
+
+    query_first.__name__ = name
+    query_first.__doc__ = method.__doc__
+    return query_first
+
+for _name in ['__getitem__', '__iter__', '__len__', '__contains__',
+              '__repr__', 'get', 'keys', 'values', 'items', 'copy',
+              'iterkeys', 'itervalues', 'iteritems']:
+    if hasattr(dict, _name):
+        setattr(_HardwareInfo, _name, _querying(_name))
+
+hardware_info = _HardwareInfo()
 
-# Check hardware support
+def initialize():
+    """Check hardware support, and configure the current context.
 
-_opengl_version = hardware_info['version'].split(' ')[0]
-if _opengl_version < "2.0":
-    raise DriverError("This package requires OpenGL v2.0 or higher. "
-                      "Your version is %s." % _opengl_version)
+    This is called before creating OpenGL objects, and does its work
+    only once (until `reset` is called).
 
-# This extension is required to return floats outside [0, 1]
-# in gl_FragColor
-require_extension('ARB_color_buffer_float')
-require_extension('ARB_texture_float')
+    """
+    if 'initialized' in _probed:
+        return
+
+    _opengl_version = hardware_info['version'].split(' ')[0]
+    if _opengl_version < "2.0":
+        raise DriverError("This package requires OpenGL v2.0 or higher. "
+                          "Your version is %s." % _opengl_version)
+
+    # This extension is required to return floats outside [0, 1]
+    # in gl_FragColor
+    require_extension('ARB_color_buffer_float')
+    require_extension('ARB_texture_float')
+
+    gl.glClampColorARB(gl.GL_CLAMP_VERTEX_COLOR_ARB, False)
+    gl.glClampColorARB(gl.GL_CLAMP_FRAGMENT_COLOR_ARB, False)
+    gl.glClampColorARB(gl.GL_CLAMP_READ_COLOR_ARB, False)
+
+    max_color_attachments()
+
+    _probed['initialized'] = True
+
+def reset():
+    """Forget all probed capabilities.
+
+    They are probed again, in the current context, when next needed.
+
+    """
+    global MAX_COLOR_ATTACHMENTS
 
-gl.glClampColorARB(gl.GL_CLAMP_VERTEX_COLOR_ARB, False)
-gl.glClampColorARB(gl.GL_CLAMP_FRAGMENT_COLOR_ARB, False)
-gl.glClampColorARB(gl.GL_CLAMP_READ_COLOR_ARB, False)
+    _probed.clear()
+    dict.clear(hardware_info)
+    MAX_COLOR_ATTACHMENTS = None
@@ -0,0 +1,359 @@
+"""Windowless OpenGL contexts.
+
+Off-screen computations only need a context, not a window.  The
+contexts created here do not depend on pyglet's window system, so they
+can be used on machines without a display, e.g. on batch nodes.  Two
+backends are available:
+
+EGL
+    Uses the Mesa surfaceless platform (EGL_MESA_platform_surfaceless)
+    where available, and the default EGL display otherwise.  This works
+    with the vendor's GL library as well as with Mesa, including its
+    llvmpipe software rasterizer.
+OSMesa
+    Mesa's off-screen rendering interface.  Since pyglet takes its GL
+    functions from libGL, this backend requires libGL to be provided by
+    an OSMesa build of Mesa (e.g. through LD_LIBRARY_PATH).
+
+When no display is available, pyglet must not create its hidden
+"shadow" window on import; importing scikits.gpu takes care of this.
+
+"""
+
+__all__ = ['HeadlessContext', 'ContextError']
+
+import ctypes
+import ctypes.util
+import os
+
+from pyglet import gl
+
+from scikits.gpu import config
+
+class ContextError(Exception):
+    pass
+
+def _load_library(*names):
+    """Load the first available shared library out of `names`.
+
+    """
+    for name in names:
+        path = ctypes.util.find_library(name) or 'lib%s.so' % name
+        try:
+            return ctypes.CDLL(path)
+        except OSError:
+            pass
+
+    raise ContextError("Could not load %s." % " or ".join(
+        ['lib%s' % name for name in names]))
+
+def _attrib_list(*attribs):
+    """Zero-terminated list of integer attributes, as passed to EGL.
+
+    """
+    attribs = list(attribs)
+    return (ctypes.c_int * len(attribs))(*attribs)
+
+# EGL constants
+EGL_NONE = 0x3038
+EGL_EXTENSIONS = 0x3055
+EGL_SURFACE_TYPE = 0x3033
+EGL_PBUFFER_BIT = 0x0001
+EGL_RENDERABLE_TYPE = 0x3040
+EGL_OPENGL_BIT = 0x0008
+EGL_RED_SIZE = 0x3024
+EGL_GREEN_SIZE = 0x3023
+EGL_BLUE_SIZE = 0x3022
+EGL_ALPHA_SIZE = 0x3021
+EGL_WIDTH = 0x3057
+EGL_HEIGHT = 0x3056
+EGL_OPENGL_API = 0x30A2
+EGL_PLATFORM_SURFACELESS_MESA = 0x31DD
+
+class _EGLBackend(object):
+    def __init__(self, width, height):
+        egl = _load_library('EGL')
+        c_void_p, c_int, c_uint = ctypes.c_void_p, ctypes.c_int, ctypes.c_uint
+        int_p = ctypes.POINTER(c_int)
+
+        for name, restype, argtypes in [
+            ('eglGetError', c_int, []),
+            ('eglGetDisplay', c_void_p, [c_void_p]),
+            ('eglGetProcAddress', c_void_p, [ctypes.c_char_p]),
+            ('eglQueryString', ctypes.c_char_p, [c_void_p, c_int]),
+            ('eglInitialize', c_uint, [c_void_p, int_p, int_p]),
+            ('eglTerminate', c_uint, [c_void_p]),
+            ('eglBindAPI', c_uint, [c_uint]),
+            ('eglChooseConfig', c_uint, [c_void_p, int_p,
+                                         ctypes.POINTER(c_void_p),
+                                         c_int, int_p]),
+            ('eglCreatePbufferSurface', c_void_p, [c_void_p, c_void_p,
+                                                   int_p]),
+            ('eglCreateContext', c_void_p, [c_void_p, c_void_p, c_void_p,
+                                            int_p]),
+            ('eglMakeCurrent', c_uint, [c_void_p, c_void_p, c_void_p,
+                                        c_void_p]),
+            ('eglDestroySurface', c_uint, [c_void_p, c_void_p]),
+            ('eglDestroyContext', c_uint, [c_void_p, c_void_p])]:
+            func = getattr(egl, name)
+            func.restype = restype
+            func.argtypes = argtypes
+
+        self._egl = egl
+        self.surface = None
+        self.context = None
+
+        self.display = self._get_display()
+        major, minor = c_int(), c_int()
+        if not egl.eglInitialize(self.display, ctypes.byref(major),
+                                 ctypes.byref(minor)):
+            raise ContextError("eglInitialize failed (error 0x%x)." % \
+                               egl.eglGetError())
+
+        if not egl.eglBindAPI(EGL_OPENGL_API):
+            raise ContextError("EGL implementation does not support "
+                               "desktop OpenGL.")
+
+        # Prefer a configuration with a (tiny) pbuffer as default
+        # framebuffer.  Without one, rely on EGL_KHR_surfaceless_context.
+        extensions = (egl.eglQueryString(self.display, EGL_EXTENSIONS)
+                      or '').split()
+
+        cfg = self._choose_config(EGL_PBUFFER_BIT)
+        if cfg is not None:
+            self.surface = egl.eglCreatePbufferSurface(
+                self.display, cfg,
+                _attrib_list(EGL_WIDTH, width, EGL_HEIGHT, height, EGL_NONE))
+        elif 'EGL_KHR_surfaceless_context' in extensions:
+            cfg = self._choose_config(0)
+
+        if cfg is None:
+            raise ContextError("No suitable EGL configuration found.")
+
+        self.context = egl.eglCreateContext(self.display, cfg, None,
+                                            _attrib_list(EGL_NONE))
+        if not self.context:
+            raise ContextError("eglCreateContext failed (error 0x%x)." % \
+                               egl.eglGetError())
+
+    def _get_display(self):
+        egl = self._egl
+
+        client_extensions = (egl.eglQueryString(None, EGL_EXTENSIONS)
+                             or '').split()
+
+        if 'EGL_MESA_platform_surfaceless' in client_extensions:
+            address = egl.eglGetProcAddress('eglGetPlatformDisplayEXT')
+            if address:
+                get_platform_display = ctypes.CFUNCTYPE(
+                    ctypes.c_void_p, ctypes.c_uint, ctypes.c_void_p,
+                    ctypes.POINTER(ctypes.c_int))(address)
+                display = get_platform_display(EGL_PLATFORM_SURFACELESS_MESA,
+                                               None, None)
+                if display:
+                    return display
+
+        display = egl.eglGetDisplay(None)
+        if not display:
+            raise ContextError("No EGL display available.")
+
+        return display
+
+    def _choose_config(self, surface_type):
+        cfg = ctypes.c_void_p()
+        nr_configs = ctypes.c_int()
+
+        attribs = _attrib_list(EGL_SURFACE_TYPE, surface_type,
+                               EGL_RENDERABLE_TYPE, EGL_OPENGL_BIT,
+                               EGL_RED_SIZE, 8, EGL_GREEN_SIZE, 8,
+                               EGL_BLUE_SIZE, 8, EGL_ALPHA_SIZE, 8,
+                               EGL_NONE)
+
+        if not self._egl.eglChooseConfig(self.display, attribs,
+                                         ctypes.byref(cfg), 1,
+                                         ctypes.byref(nr_configs)) \
+               or nr_configs.value < 1:
+            return None
+
+        return cfg
+
+    def make_current(self):
+        if not self._egl.eglMakeCurrent(self.display, self.surface,
+                                        self.surface, self.context):
+            raise ContextError("eglMakeCurrent failed (error 0x%x)." % \
+                               self._egl.eglGetError())
+
+    def destroy(self):
+        egl = self._egl
+        egl.eglMakeCurrent(self.display, None, None, None)
+        if self.context:
+            egl.eglDestroyContext(self.display, self.context)
+        if self.surface:
+            egl.eglDestroySurface(self.display, self.surface)
+        self.context = self.surface = None
+
+# OSMesa constants
+OSMESA_RGBA = 0x1908
+GL_UNSIGNED_BYTE = 0x1401
+
+class _OSMesaBackend(object):
+    def __init__(self, width, height):
+        osmesa = _load_library('OSMesa')
+        c_void_p, c_int, c_uint = ctypes.c_void_p, ctypes.c_int, ctypes.c_uint
+
+        osmesa.OSMesaCreateContextExt.restype = c_void_p
+        osmesa.OSMesaCreateContextExt.argtypes = [c_uint, c_int, c_int, c_int,
+                                                  c_void_p]
+        osmesa.OSMesaMakeCurrent.restype = ctypes.c_ubyte
+        osmesa.OSMesaMakeCurrent.argtypes = [c_void_p, c_void_p, c_uint,
+                                             c_int, c_int]
+        osmesa.OSMesaDestroyContext.restype = None
+        osmesa.OSMesaDestroyContext.argtypes = [c_void_p]
+
+        self._osmesa = osmesa
+        self.context = osmesa.OSMesaCreateContextExt(OSMESA_RGBA, 24, 8, 0,
+                                                     None)
+        if not self.context:
+            raise ContextError("OSMesaCreateContextExt failed.")
+
+        # Default framebuffer, in host memory
+        self.width, self.height = width, height
+        self.buffer = (ctypes.c_ubyte * (width * height * 4))()
+
+    def make_current(self):
+        if not self._osmesa.OSMesaMakeCurrent(self.context, self.buffer,
+                                              GL_UNSIGNED_BYTE,
+                                              self.width, self.height):
+            raise ContextError("OSMesaMakeCurrent failed.")
+
+    def destroy(self):
+        if self.context:
+            self._osmesa.OSMesaDestroyContext(self.context)
+        self.context = None
+
+_backends = {'egl': _EGLBackend,
+             'osmesa': _OSMesaBackend}
+
+# Headless context that was made current last
+_current = None
+
+class HeadlessContext(object):
+    def __init__(self, backend='auto', software=False, width=1, height=1):
+        """OpenGL context without a window.
+
+        The context is made current on creation.  Used in a ``with``
+        statement, it is destroyed at the end of the block, and the
+        headless context that was current before is made current again.
+
+        Parameters
+        ----------
+        backend : {'auto', 'egl', 'osmesa'}
+            Backend used to create the context.  'auto' tries EGL
+            first, then OSMesa.
+        software : bool
+            Render with Mesa's llvmpipe software rasterizer, even if
+            graphics hardware is present.  This takes effect only for
+            the first context created by the process.
+        width, height : int
+            Size of the default framebuffer.  Computations render into
+            a Framebuffer, so this is normally left tiny.
+
+        Attributes
+        ----------
+        backend : str
+            Name of the backend in use.
+        hardware_info : dict
+            Vendor, renderer and version of the context's driver, in
+            the format of `scikits.gpu.config.hardware_info`.
+
+        """
+        if software:
+            os.environ['LIBGL_ALWAYS_SOFTWARE'] = '1'
+            os.environ.setdefault('GALLIUM_DRIVER', 'llvmpipe')
+
+        if backend == 'auto':
+            names = ['egl', 'osmesa']
+        elif backend in _backends:
+            names = [backend]
+        else:
+            raise ValueError("Unknown backend '%s'." % backend)
+
+        errors = []
+        for name in names:
+            try:
+                self._backend = _backends[name](width, height)
+                self.backend = name
+                break
+            except ContextError, e:
+                errors.append("%s: %s" % (name, e))
+        else:
+            raise ContextError("Could not create a headless context (%s)." % \
+                               "; ".join(errors))
+
+        # pyglet checks calls against its notion of the current context
+        self._pyglet_context = gl.Context()
+
+        self._previous = _current
+        self.make_current()
+        self.hardware_info = config.hardware_info.copy()
+
+    def make_current(self):
+        """Direct all OpenGL calls to this context.
+
+        """
+        global _current
+
+        if self._backend is None:
+            raise ContextError("Cannot use destroyed context.")
+
+        self._backend.make_current()
+        self._pyglet_context.set_current()
+        _current = self
+
+        # Capabilities differ between contexts
+        config.reset()
+
+    def destroy(self):
+        """Release the context.
+
+        OpenGL objects created in the context, such as programs and
+        textures, must no longer be used.  If another headless context
+        was current, it remains current.
+
+        """
+        global _current
+
+        if self._backend is not None:
+            previous = _current
+            self.make_current()
+
+            # Drop the caches of OpenGL objects of this context while it
+            # is current, so that objects deleted along with them delete
+            # their own names
+            state = getattr(self._pyglet_context, '_gpu_state', None)
+            if state is not None:
+                state.resources.clear()
+
+            self._pyglet_context.destroy()
+            self._backend.destroy()
+            self._backend = None
+            _current = None
+            config.reset()
+
+            if previous is not None and previous is not self:
+                previous.make_current()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.destroy()
+
+        previous = self._previous
+        if previous is not None and previous._backend is not None and \
+               _current is None:
+            previous.make_current()
+
+    def __del__(self):
+        if getattr(self, '_backend', None) is not None:
+            self.destroy()
@@ -0,0 +1,438 @@
+"""Elementwise operations on arrays, generated from GLSL expressions.
+
+"""
+
+__all__ = ['ElementwiseKernel']
+
+from pyglet import gl
+import numpy as np
+import re
+
+from scikits.gpu.shader import Program, VertexShader, FragmentShader
+from scikits.gpu.framebuffer import Framebuffer, _draw_canvas
+from scikits.gpu.layout import texture_shape, index_functions
+from scikits.gpu.tiling import TiledTexture, tile_regions
+from scikits.gpu.state import current_state, ContextLocal
+
+_vertex_source = """
+void main(void) {
+    gl_Position = gl_Vertex;
+}
+"""
+
+# Names assigned to at the start of a statement, e.g. `out` in
+# "out = a * b" (but not in "out == a")
+_assignment = re.compile(r'(?:^|[;{})]|\belse)\s*([A-Za-z_]\w*)\s*=(?!=)')
+
+def _packed(inputs):
+    """Whether a kernel is evaluated on packed arrays, which is the case
+    if all array inputs are packed (see `GPUArray`).
+
+    """
+    arrays = [x for x in inputs if not isinstance(x, float)]
+    return bool(arrays) and not [x for x in arrays if not x.packed]
+
+def _names(names):
+    """Convert a comma-separated string of names to a list.
+
+    """
+    if isinstance(names, basestring):
+        names = names.split(',')
+    return [n.strip() for n in names if n.strip()]
+
+class ElementwiseKernel(object):
+    def __init__(self, operation, args, outputs=None):
+        """Kernel that evaluates GLSL statements for each array element.
+
+        Parameters
+        ----------
+        operation : str
+            GLSL statements that compute the outputs from the inputs,
+            e.g. ``"out = a * sin(b) + c"``.  All values are floats.
+        args : str or list of str
+            Names of the inputs, in the order in which they are passed
+            to the kernel, e.g. ``"a, b, c"``.  Each input is either an
+            array or a scalar.
+        outputs : str or list of str, optional
+            Names of the outputs.  By default, every other variable that
+            `operation` assigns to is an output, in order of
+            appearance.
+
+        Examples
+        --------
+        >>> k = ElementwiseKernel("out = a * sin(b) + c", "a, b, c")
+        >>> k(np.ones(4), np.zeros(4), 2.0)
+        array([ 2.,  2.,  2.,  2.], dtype=float32)
+
+        Notes
+        -----
+        A fragment shader is generated for each signature of the
+        inputs, i.e. which of them are scalars, which arrays, and how
+        the elements of the arrays are laid out, and kept for later
+        calls.  Inputs and outputs are stored as 32-bit float textures;
+        the maximum number of outputs is that of the framebuffer's
+        colour attachments.  Arrays too large for a single texture are
+        processed one tile at a time (see `tiling.TiledTexture`).
+
+        If all array inputs are packed GPUArrays, which hold four
+        elements per texel, the statements are evaluated on four
+        elements at once: inputs, outputs and scalars are then
+        ``vec4``, so that the statements must be valid for vectors as
+        well (e.g. ``lessThan(a, b)`` instead of ``a < b``).  The
+        outputs are packed in turn.  Other arrays are packed first,
+        through host memory.
+
+        """
+        self.operation = operation.strip().rstrip(';')
+        self.args = _names(args)
+
+        if outputs is None:
+            outputs = []
+            for name in _assignment.findall(self.operation):
+                if name not in self.args and name not in outputs:
+                    outputs.append(name)
+        self.outputs = _names(outputs)
+
+        if not self.outputs:
+            raise ValueError("Kernel has no outputs.")
+
+        # Variables are renamed in the generated code, since names such
+        # as `out` are reserved in GLSL
+        self._body = re.sub(r'(?<![.\w])(%s)\b' % \
+                            '|'.join(self.args + self.outputs),
+                            r'_\1', self.operation)
+
+        # Generated programs, by signature, for each context
+        self._programs = ContextLocal(dict)
+
+    def source(self, signature, ndim=1, packed=False):
+        """Generate the fragment shader for the given signature.
+
+        Parameters
+        ----------
+        signature : list
+            For each input, None if it is a scalar, and otherwise a
+            tuple ``(target, direct)`` of the texture target of the
+            array and whether its elements are stored at the texel of
+            the corresponding output element (see
+            `GPUArray._signature`).
+        ndim : int
+            Number of dimensions of the arrays.
+        packed : bool
+            Whether the arrays are packed, and all values ``vec4``.
+            Packed arrays must be read in place (`direct`).
+
+        """
+        # Type of the values, and the colour bands that hold them
+        type, bands = packed and ('vec4', '') or ('float', '.r')
+
+        arrays = [s for s in signature if s is not None]
+        strided = [s for s in arrays if not s[1]]
+
+        lines = []
+        if [s for s in arrays if s[0] != gl.GL_TEXTURE_2D]:
+            lines.append('#extension GL_ARB_texture_rectangle : enable')
+
+        if strided:
+            # Output width and shape, to compute element indices
+            lines += ['uniform float _width;',
+                      'uniform float _shape[%d];' % ndim]
+
+        for name, s in zip(self.args, signature):
+            if s is None:
+                lines.append('uniform %s _%s;' % (type, name))
+                continue
+
+            if s[0] == gl.GL_TEXTURE_2D:
+                lines.append('uniform sampler2D _%s_tex;' % name)
+            else:
+                lines.append('uniform sampler2DRect _%s_tex;' % name)
+
+            # Conversion from texels to texture coordinates
+            lines.append('uniform vec2 _%s_scale;' % name)
+
+            if not s[1]:
+                lines += ['uniform float _%s_offset;' % name,
+                          'uniform float _%s_strides[%d];' % (name, ndim),
+                          'uniform float _%s_width;' % name]
+
+        if strided:
+            lines.append(index_functions)
+
+        lines += ['', 'void main(void) {']
+
+        if strided:
+            # Linear index of the output element, and its index along
+            # each axis
+            lines += ['    float _q = _index(gl_FragCoord.xy, _width);']
+            for d in range(ndim - 1, 0, -1):
+                lines += ['    float _i%d = _q;' % d,
+                          '    _q = floor((_q + 0.5) / _shape[%d]);' % d,
+                          '    _i%d -= _q * _shape[%d];' % (d, d)]
+            lines.append('    float _i0 = _q;')
+
+        for name, s in zip(self.args, signature):
+            if s is None:
+                continue
+
+            lookup = {gl.GL_TEXTURE_2D: 'texture2D'}.get(s[0],
+                                                         'texture2DRect')
+            if s[1]:
+                lines.append('    %s _%s = %s(_%s_tex, gl_FragCoord.xy * '
+                             '_%s_scale)%s;' % (type, name, lookup, name,
+                                                name, bands))
+            else:
+                offset = ' + '.join(['_%s_offset' % name] + \
+                                    ['_i%d * _%s_strides[%d]' % (d, name, d)
+                                     for d in range(ndim)])
+                lines.append('    float _%s = %s(_%s_tex, _texel(%s, _%s_width) '
+                             '* _%s_scale).r;' % (name, lookup, name, offset,
+                                                  name, name))
+
+        for name in self.outputs:
+            lines.append('    %s _%s = %s(0.0);' % (type, name, type))
+
+        lines += ['', '    %s;' % self._body, '']
+
+        for n, name in enumerate(self.outputs):
+            if packed:
+                lines.append('    gl_FragData[%d] = _%s;' % (n, name))
+            else:
+                lines.append('    gl_FragData[%d] = vec4(_%s, 0.0, 0.0, '
+                             '1.0);' % (n, name))
+        lines.append('}')
+
+        return '\n'.join(lines)
+
+    def program(self, signature, ndim=1, packed=False):
+        """Return the compiled program for the given signature.
+
+        """
+        programs = self._programs.get()
+        key = (tuple(signature), ndim, packed)
+        if key not in programs:
+            programs[key] = Program(
+                [VertexShader(_vertex_source),
+                 FragmentShader(self.source(signature, ndim, packed))])
+
+        return programs[key]
+
+    def _launch(self, inputs, shape, packed=False):
+        """Evaluate the kernel on the graphics card.
+
+        Parameters
+        ----------
+        inputs : list
+            For each argument, a GPUArray or a float.
+        shape : tuple of ints
+            Shape of the arrays.
+        packed : bool
+            Whether to evaluate the kernel on packed arrays, and return
+            packed outputs.  Inputs of another layout are converted.
+
+        Returns
+        -------
+        textures : list of Texture or TiledTexture
+            The outputs, stored as described in `layout.texture_shape`.
+            Outputs too large for a single texture are tiled, and the
+            kernel is evaluated one tile at a time.
+
+        """
+        from scikits.gpu.array import to_gpu
+
+        width, height = texture_shape(shape, packed)
+        ndim = len(shape)
+
+        regions = tile_regions(width, height)
+        tiled = len(regions) > 1
+
+        inputs = list(inputs)
+        signature = [None if isinstance(x, float) else
+                     x._signature(shape, packed) for x in inputs]
+
+        for n, (x, s) in enumerate(zip(inputs, signature)):
+            if s is None or s[1]:
+                continue
+
+            # Elements of tiled and packed arrays can only be read in
+            # place, and arrays of another layout are converted
+            if packed or tiled or x._storage.tiled or \
+                   x._storage.packed != packed:
+                inputs[n] = to_gpu(x.get(), packed=packed)
+                signature[n] = inputs[n]._signature(shape, packed)
+
+        # Upload before binding, since uploads change texture bindings
+        for x, s in zip(inputs, signature):
+            if s is not None:
+                x._storage.to_device()
+
+        bands = packed and 4 or 1
+        if tiled:
+            outputs = [TiledTexture(width, height, bands)
+                       for name in self.outputs]
+
+        state = current_state()
+        state.refresh()
+        previous = state.get_framebuffer()
+        viewport = state.viewport
+
+        program = None
+        bound = set()
+        try:
+            for n, (x0, y0, w, h) in enumerate(regions):
+                fbo = Framebuffer()
+                if tiled:
+                    for out in outputs:
+                        fbo.attach_texture(out.textures[n])
+                elif packed:
+                    for name in self.outputs:
+                        fbo.add_texture([w, h, 4], filter=gl.GL_NEAREST,
+                                        internalformat=gl.GL_RGBA32F_ARB)
+                    outputs = fbo._textures
+                else:
+                    for name in self.outputs:
+                        fbo.add_texture([w, h], filter=gl.GL_NEAREST)
+                    outputs = fbo._textures
+
+                # Texture of each array input
+                textures = [None] * len(inputs)
+                for i, x in enumerate(inputs):
+                    if signature[i] is None:
+                        continue
+                    storage = x._storage
+                    textures[i] = storage.texture
+                    if storage.tiled:
+                        textures[i] = storage.texture.textures[n]
+
+                program = self.program(
+                    [s and (t.target, s[1])
+                     for s, t in zip(signature, textures)], ndim, packed)
+
+                fbo.bind()
+                state.set_viewport(0, 0, w, h)
+
+                program.use()
+
+                # Inputs that the operation does not use are not active
+                active = set(program.active_uniforms)
+                if '_width' in active:
+                    program['_width'] = float(width)
+                if '_shape' in active:
+                    program['_shape'] = [float(k) for k in shape]
+
+                unit = 0
+                for name, x, s, tex in zip(self.args, inputs, signature,
+                                           textures):
+                    if s is None:
+                        if '_' + name in active:
+                            program['_' + name] = packed and [x] * 4 or x
+                        continue
+                    elif '_%s_tex' % name not in active:
+                        continue
+
+                    state.bind_texture(tex.target, tex.id, unit)
+                    bound.add((unit, tex.target))
+                    program['_%s_tex' % name] = unit
+                    unit += 1
+
+                    if tex.target == gl.GL_TEXTURE_2D:
+                        program['_%s_scale' % name] = [1. / tex.width,
+                                                       1. / tex.height]
+                    else:
+                        program['_%s_scale' % name] = [1., 1.]
+
+                    if not s[1]:
+                        offset, strides = x._layout()
+                        program['_%s_offset' % name] = float(offset)
+                        program['_%s_strides' % name] = [float(k)
+                                                         for k in strides]
+                        program['_%s_width' % name] = float(tex.width)
+
+                _draw_canvas()
+        finally:
+            for i, target in bound:
+                state.bind_texture(target, 0, i)
+            state.active_texture(0)
+
+            if program is not None:
+                program.disable()
+            state.set_viewport(*viewport)
+            state.bind_framebuffer(previous)
+
+        return list(outputs)
+
+    def __call__(self, *args, **kwargs):
+        """Evaluate the kernel.
+
+        Parameters
+        ----------
+        args, kwargs : GPUArray, ndarray or float
+            Inputs, by position or by name.  All arrays must have the
+            same shape; scalars apply to all elements.
+
+        Returns
+        -------
+        out : GPUArray, ndarray or tuple
+            The outputs, of the same shape as the array inputs.  If any
+            of the inputs is a GPUArray, the outputs are GPUArrays, and
+            remain on the graphics card.  Otherwise, they are float32
+            ndarrays.
+
+        """
+        # The array module builds on this one
+        from scikits.gpu.array import GPUArray, _Storage, to_gpu
+
+        if len(args) > len(self.args):
+            raise TypeError("Kernel takes %d arguments (%d given)." % \
+                            (len(self.args), len(args)))
+
+        values = dict(zip(self.args, args))
+        for name, value in kwargs.items():
+            if name not in self.args:
+                raise TypeError("Unknown argument '%s'." % name)
+            if name in values:
+                raise TypeError("Argument '%s' given twice." % name)
+            values[name] = value
+
+        missing = [name for name in self.args if name not in values]
+        if missing:
+            raise TypeError("Missing arguments: %s." % ", ".join(missing))
+
+        # Host arrays are uploaded in the layout of the GPUArrays
+        packed = _packed([x for x in values.values()
+                          if isinstance(x, GPUArray)])
+
+        shape = None
+        on_device = False
+        inputs = []
+        for name in self.args:
+            x = values[name]
+            if isinstance(x, GPUArray):
+                on_device = True
+            elif np.ndim(x) == 0:
+                inputs.append(float(x))
+                continue
+            else:
+                x = to_gpu(np.asarray(x, dtype=np.float32), packed=packed)
+
+            if shape is None:
+                shape = x.shape
+            elif x.shape != shape:
+                raise ValueError("Argument '%s' has shape %s, expected %s." \
+                                 % (name, x.shape, shape))
+            inputs.append(x)
+
+        if shape is None:
+            raise ValueError("At least one argument must be an array.")
+
+        packed = _packed(inputs)
+        out = [GPUArray(shape, _storage=_Storage(shape, texture, packed))
+               for texture in self._launch(inputs, shape, packed)]
+
+        if not on_device:
+            out = [x._host() for x in out]
+
+        if len(out) == 1:
+            return out[0]
+        else:
+            return tuple(out)
@@ -8,14 +8,22 @@ and is released under the MIT license.  See LICENSE.txt for more detail.
 
 """
 
-__all__ = ['Framebuffer']
+__all__ = ['Framebuffer', 'PingPongFramebuffer', 'ReadFuture']
 
 from pyglet import gl, image
 import ctypes
 
-from scikits.gpu.config import require_extension, MAX_COLOR_ATTACHMENTS
-from scikits.gpu.texture import Texture
-
+from scikits.gpu.config import require_extension, max_color_attachments, \
+                              initialize
+from scikits.gpu.texture import Texture, default_format, _format_bands
+from scikits.gpu.buffer import PixelBuffer, Fence
+from scikits.gpu.ntypes import numpy_type, pixel_format, is_integer_format
+from scikits.gpu.pool import framebuffer_pool
+from scikits.gpu.canvas import canvas
+from scikits.gpu.state import current_state
+from scikits.gpu import glext
+
+import numpy as np
 import warnings
 
 def _shape_to_3d(shape):
@@ -47,9 +55,98 @@ def _shape_to_3d(shape):
 
     return shape
 
-class Framebuffer(object):
-    require_extension('EXT_framebuffer_object')
+def _array_shape(shape):
+    """Return the shape of the array that holds the contents of a
+    texture of the given shape.
+
+    >>> _array_shape([5])
+    (5,)
+
+    >>> _array_shape([5, 2])
+    (2, 5)
+
+    >>> _array_shape([5, 2, 3])
+    (2, 5, 3)
+
+    """
+    width, height, bands = _shape_to_3d(shape)
+    return [(width,), (height, width), (height, width, bands)][len(shape) - 1]
+
+def _current_framebuffer():
+    """Return the id of the framebuffer object that is currently bound.
+
+    """
+    return current_state().get_framebuffer()
+
+def _draw_buffers(count):
+    """Render to the first `count` colour attachments of the bound
+    framebuffer object.
+
+    """
+    first = gl.GL_COLOR_ATTACHMENT0_EXT
+    buffers = (gl.GLenum * count)(*range(first, first + count))
+    gl.glDrawBuffers(count, buffers)
+
+def _draw_canvas():
+    """Draw geometry covering the whole viewport (see `canvas.Canvas`).
+
+    """
+    c = canvas()
+    c.bind()
+    c.draw()
+    c.unbind()
+
+class ReadFuture(object):
+    def __init__(self, pbo, fence, out):
+        """Result of an asynchronous read from a framebuffer.
+
+        Created by `Framebuffer.read_async`.
 
+        """
+        self._pbo = pbo
+        self._fence = fence
+        self._out = out
+        self._result = None
+
+    def done(self):
+        """Whether the data has arrived in the pixel buffer, so that
+        `result` does not have to wait.
+
+        """
+        return self._result is not None or self._fence.signaled
+
+    def result(self, timeout=None):
+        """Return the data as an array.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Maximum time to wait for the data, in seconds.  By default,
+            wait indefinitely.
+
+        Raises
+        ------
+        RuntimeError
+            If the data has not arrived within `timeout` seconds.
+
+        """
+        if self._result is None:
+            if not self._fence.wait(timeout):
+                raise RuntimeError("Timed out waiting for framebuffer "
+                                   "read.")
+            self._fetch()
+
+        return self._result
+
+    def _fetch(self):
+        """Copy the data from the pixel buffer, which may then be reused.
+
+        """
+        self._pbo.read(self._out)
+        self._pbo = None
+        self._result = self._out
+
+class Framebuffer(object):
     def __init__(self):
         """Framebuffer Object (FBO) for off-screen rendering.
 
@@ -59,18 +156,36 @@ class Framebuffer(object):
 
         For now the framebuffer object handles only textures.
 
+        Framebuffer objects are taken from, and returned to,
+        `pool.framebuffer_pool` of the current context.
+
         """
-        ## Create a framebuffer object
-        framebuffer = gl.GLuint()
-        gl.glGenFramebuffersEXT(1, ctypes.byref(framebuffer))
-        gl.glBindFramebufferEXT(gl.GL_FRAMEBUFFER_EXT, framebuffer)
+        initialize()
+        require_extension('EXT_framebuffer_object')
+
+        ## Create a framebuffer object, or reuse a deleted one
+        pool = framebuffer_pool.get()
+        framebuffer = pool.acquire(None)
+        if framebuffer is None:
+            pool.allocated(0)
+            framebuffer = gl.GLuint()
+            gl.glGenFramebuffersEXT(1, ctypes.byref(framebuffer))
+        current_state().bind_framebuffer(framebuffer)
 
         self.id = framebuffer
-        self.MAX_COLOR_ATTACHMENTS = MAX_COLOR_ATTACHMENTS
+        self._pool = pool
+        self.MAX_COLOR_ATTACHMENTS = max_color_attachments()
 
         self._textures = []
+        self._shapes = []
 
-    def add_texture(self, shape, dtype=gl.GL_FLOAT):
+        # Ring of pixel buffers used by read_async, with the future that
+        # last wrote to each of them
+        self._read_buffers = []
+        self._read_index = 0
+
+    def add_texture(self, shape, dtype=gl.GL_FLOAT, filter=gl.GL_LINEAR,
+                    internalformat=None):
         """Add texture image to the framebuffer object.
 
         Parameters
@@ -80,6 +195,17 @@ class Framebuffer(object):
             of OpenGL, height and width dimensions must be a power of
             two.  Valid shapes include (16,), (16, 17), (16, 16, 3).
         dtype : opengl data-type, e.g. GL_FLOAT, GL_UNSIGNED_BYTE
+            Type of the data as read back to host memory.
+        filter : {GL_LINEAR, GL_NEAREST}
+            Filter used when the texture is sampled.
+        internalformat : int, optional
+            Internal format of the texture, e.g. ``GL_RGBA32F_ARB`` to
+            store all four colour bands at full precision.  By default,
+            the format that matches `dtype` and the number of bands
+            (see `texture.default_format`), e.g. ``GL_RGBA16F_ARB``
+            for ``GL_HALF_FLOAT_ARB``.  Doubles are stored as floats,
+            and so are signed bytes and shorts, of which the normalized
+            formats cannot be rendered to.
 
         Returns
         -------
@@ -87,59 +213,223 @@ class Framebuffer(object):
             The slot number to which the texture was bound.  E.g., in the
             case of GL_COLOR_ATTACHMENT3_EXT, returns 3.
 
-        """
-        if dtype != gl.GL_FLOAT:
-            warnings.warn("While OpenGL < 3.0 implementations allow the "
-                          "storage of textures with data-types other "
-                          "than FLOAT, gl_FragColor only accepts "
-                          "assigned a floating point value.  In OpenGL 3.0 "
-                          "this can be changed (see READING.txt).",
-                          RuntimeWarning)
-
-        if len(self._textures) >= MAX_COLOR_ATTACHMENTS:
-            raise RuntimeError("Maximum number of textures reached.  This "
-                               "platform supports %d attachments." % \
-                               MAX_COLOR_ATTACHMENTS)
-
-        slot = getattr(gl, "GL_COLOR_ATTACHMENT%d_EXT" % len(self._textures))
+        Notes
+        -----
+        Each texture is attached to its own colour attachment, and all
+        of them are rendered to at the same time.  Fragment shaders
+        write to slot ``i`` through ``gl_FragData[i]``; ``gl_FragColor``
+        is written to all slots.
 
+        """
         width, height, bands = _shape_to_3d(shape)
 
         if bands > 4:
             raise ValueError("Texture cannot have more than 4 colour layers.")
 
-        colour_bands = {1: gl.GL_LUMINANCE,
-                        2: gl.GL_LUMINANCE_ALPHA,
-                        3: gl.GL_RGB,
-                        4: gl.GL_RGBA}
+        if internalformat is None:
+            T = numpy_type(dtype)
+            if T in (np.int8, np.int16, np.float64):
+                T = np.float32
+            internalformat = default_format(T, bands)
+
+        integer = is_integer_format(internalformat)
+        if integer:
+            warnings.warn("Integer textures can only be rendered to by "
+                          "fragment shaders that declare integer outputs, "
+                          "rather than through gl_FragColor (see "
+                          "READING.txt).", RuntimeWarning)
 
         # allocate a texture and add to the frame buffer
         tex = Texture(width, height,
-                      format=colour_bands[bands],
+                      format=pixel_format(bands, integer),
                       dtype=dtype,
-                      internalformat=gl.GL_RGB32F_ARB,
+                      internalformat=internalformat,
+                      filter=filter,
                       )
 
-        gl.glBindTexture(tex.target, tex.id)
-        gl.glFramebufferTexture2DEXT(gl.GL_FRAMEBUFFER_EXT,
-                                     gl.GL_COLOR_ATTACHMENT0_EXT,
-                                     tex.target, tex.id, 0)
-        if (gl.glGetError() != gl.GL_NO_ERROR):
-            raise RuntimeError("Could not create framebuffer texture.")
+        return self.attach_texture(tex, shape)
+
+    def attach_texture(self, tex, shape=None):
+        """Attach an existing texture to the framebuffer object.
 
-        status = gl.glCheckFramebufferStatusEXT(gl.GL_FRAMEBUFFER_EXT)
-        if not (status == gl.GL_FRAMEBUFFER_COMPLETE_EXT):
-            raise RuntimeError("Could not set up framebuffer.")
+        Parameters
+        ----------
+        tex : Texture
+            Texture to render to.
+        shape : tuple of ints, optional
+            Shape of the texture contents (see `add_texture`).  By
+            default, ``(width, height, bands)``, with the number of bands
+            given by the texture's format.
+
+        Returns
+        -------
+        slot : int
+            The slot number to which the texture was bound.
+
+        """
+        if len(self._textures) >= self.MAX_COLOR_ATTACHMENTS:
+            raise RuntimeError("Maximum number of textures reached.  This "
+                               "platform supports %d attachments." % \
+                               self.MAX_COLOR_ATTACHMENTS)
+
+        if shape is None:
+            shape = [tex.width, tex.height, _format_bands.get(tex.format, 4)]
+
+        slot = len(self._textures)
+        attachment = gl.GL_COLOR_ATTACHMENT0_EXT + slot
+
+        state = current_state()
+        previous = state.get_framebuffer()
+        self.bind()
+
+        try:
+            gl.glFramebufferTexture2DEXT(gl.GL_FRAMEBUFFER_EXT, attachment,
+                                         tex.target, tex.id, 0)
+            if (gl.glGetError() != gl.GL_NO_ERROR):
+                raise RuntimeError("Could not create framebuffer texture.")
+
+            status = gl.glCheckFramebufferStatusEXT(gl.GL_FRAMEBUFFER_EXT)
+            if not (status == gl.GL_FRAMEBUFFER_COMPLETE_EXT):
+                gl.glFramebufferTexture2DEXT(gl.GL_FRAMEBUFFER_EXT,
+                                             attachment, tex.target, 0, 0)
+                raise RuntimeError("Could not set up framebuffer.")
+
+            # Render to all attachments.  The draw buffers are part of
+            # the framebuffer object's state, so this holds whenever it
+            # is bound.
+            _draw_buffers(slot + 1)
+        finally:
+            state.bind_framebuffer(previous)
 
         self._textures.append(tex)
-        return len(self._textures) - 1
+        self._shapes.append(list(shape))
+        return slot
+
+    def _read_pixels(self, slot, data):
+        """Read the texture bound to `slot` into `data`, which is either
+        a pointer to host memory or an offset into the bound pixel pack
+        buffer.
+
+        """
+        if not self.id:
+            raise RuntimeError("Cannot read from deleted framebuffer.")
+
+        tex = self._textures[slot]
+        bands = _shape_to_3d(self._shapes[slot])[2]
+
+        state = current_state()
+        previous = state.get_framebuffer()
+
+        state.bind_framebuffer(self.id)
+        gl.glReadBuffer(gl.GL_COLOR_ATTACHMENT0_EXT + slot)
+        gl.glPixelStorei(gl.GL_PACK_ALIGNMENT, 1)
+        gl.glReadPixels(0, 0, tex.width, tex.height,
+                        pixel_format(bands, tex.integer), tex.dtype, data)
+
+        state.bind_framebuffer(previous)
+
+    def _output(self, slot, out):
+        """Validate or allocate an array to hold the contents of `slot`.
+
+        """
+        if not (0 <= slot < len(self._textures)):
+            raise ValueError("No texture in slot %s." % slot)
+
+        shape = _array_shape(self._shapes[slot])
+        dtype = numpy_type(self._textures[slot].dtype)
+
+        if out is None:
+            return np.empty(shape, dtype=dtype)
+
+        if out.shape != shape or out.dtype != dtype or \
+               not out.flags.c_contiguous:
+            raise ValueError("Output must be a C-contiguous array of "
+                             "shape %s and type %s." % (shape, dtype))
+
+        return out
+
+    def read(self, slot=0, out=None):
+        """Copy the texture in the given slot to host memory.
+
+        This waits for rendering to complete.  See `read_async` for a
+        non-blocking alternative.
+
+        Parameters
+        ----------
+        slot : int
+            Slot number, as returned by `add_texture`.
+        out : ndarray, optional
+            C-contiguous array in which to place the result.  Its shape
+            is (height, width, bands), with singleton dimensions left out
+            in the same way as in the texture's shape, and its data-type
+            corresponds to that of the texture.
+
+        Returns
+        -------
+        out : ndarray
+            The texture data.
+
+        """
+        out = self._output(slot, out)
+        self._read_pixels(slot, out.ctypes.data)
+
+        return out
+
+    def read_async(self, slot=0, out=None, buffers=2):
+        """Start copying the texture in the given slot to host memory.
+
+        The data is first copied into a pixel buffer object, which
+        happens in the background while OpenGL continues to execute
+        further commands, e.g. rendering the next tile.  Completion is
+        tracked with a fence (ARB_sync), so that there is no need to
+        call ``glFinish``.
+
+        Parameters
+        ----------
+        slot : int
+            Slot number, as returned by `add_texture`.
+        out : ndarray, optional
+            Array in which to place the result (see `read`).
+        buffers : int
+            Number of pixel buffers to cycle through.  With more than
+            `buffers` reads in flight, the oldest one is completed
+            before its buffer is reused.
+
+        Returns
+        -------
+        future : ReadFuture
+            Call ``future.result()`` to obtain the data.
+
+        """
+        out = self._output(slot, out)
+
+        while len(self._read_buffers) < buffers:
+            self._read_buffers.append(
+                [PixelBuffer(glext.GL_PIXEL_PACK_BUFFER), None])
+
+        self._read_index %= len(self._read_buffers)
+        entry = self._read_buffers[self._read_index]
+        self._read_index += 1
+
+        pbo, previous = entry
+        if previous is not None and previous._pbo is pbo:
+            previous.result()
+
+        pbo.reserve(out.nbytes)
+        self._read_pixels(slot, None)
+        pbo.unbind()
+
+        future = ReadFuture(pbo, Fence(), out)
+        entry[1] = future
+
+        return future
 
     def bind(self):
         """Set the FBO as the active rendering buffer.
 
         """
         if self.id:
-            gl.glBindFramebufferEXT(gl.GL_FRAMEBUFFER_EXT, self.id)
+            current_state().bind_framebuffer(self.id)
         else:
             raise RuntimeError("Cannot bind to deleted framebuffer.")
 
@@ -147,13 +437,168 @@ class Framebuffer(object):
         """Set the window as the active rendering buffer.
 
         """
-        gl.glBindFramebufferEXT(gl.GL_FRAMEBUFFER_EXT, 0)
+        current_state().bind_framebuffer(0)
+
+    def _release(self):
+        """Detach the textures, and return the framebuffer object to the
+        pool.
+
+        """
+        state = current_state()
+        previous = state.get_framebuffer()
+
+        # Detach the textures, which may be deleted or reused
+        # independently
+        self.bind()
+        for slot, tex in enumerate(self._textures):
+            gl.glFramebufferTexture2DEXT(gl.GL_FRAMEBUFFER_EXT,
+                                         gl.GL_COLOR_ATTACHMENT0_EXT + slot,
+                                         tex.target, 0, 0)
+
+        if previous == self.id.value:
+            previous = 0
+        state.bind_framebuffer(previous)
+
+        self._pool.release(None, self.id, 0)
 
     def __del__(self):
-        """Delete the framebuffer from the graphics card's memory.
+        """Return the framebuffer object to the pool, for reuse.
 
         """
-        self.unbind()
         if self.id:
-            gl.glDeleteFramebuffersEXT(1, self.id)
+            try:
+                # Framebuffers of other contexts are deleted along with
+                # those
+                if self._pool is framebuffer_pool.get():
+                    self._release()
+            except:
+                pass
+
             self.id = None
+        self._read_buffers = []
+
+class PingPongFramebuffer(Framebuffer):
+    def __init__(self, shape, dtype=gl.GL_FLOAT):
+        """Framebuffer with two textures, for iterative algorithms.
+
+        Each iteration reads the state from the front texture and
+        renders the new state into the back texture, after which the
+        two swap roles.  Both textures stay attached, so that a swap
+        only changes the draw buffer and the texture bound to the
+        sampler.
+
+        Parameters
+        ----------
+        shape : tuple of ints
+            Shape of the state (see `Framebuffer.add_texture`).
+        dtype : opengl data-type, e.g. GL_FLOAT
+
+        """
+        Framebuffer.__init__(self)
+
+        self.add_texture(shape, dtype=dtype)
+        self.add_texture(shape, dtype=dtype)
+
+        self.shape = list(shape)
+        self.front_slot = 0
+
+    @property
+    def front(self):
+        """Texture holding the current state.
+
+        """
+        return self._textures[self.front_slot]
+
+    @property
+    def back(self):
+        """Texture into which the next state is rendered.
+
+        """
+        return self._textures[1 - self.front_slot]
+
+    def swap(self):
+        """Exchange the front and back textures.
+
+        """
+        self.front_slot = 1 - self.front_slot
+
+    def run(self, program, iterations=1, sampler='state', unit=0):
+        """Apply `program` to the state a number of times.
+
+        Parameters
+        ----------
+        program : Program
+            Computes the new state of each pixel, given the current
+            state as the sampler uniform `sampler`.
+        iterations : int
+            Number of times to apply the program.
+        sampler : str
+            Name of the sampler uniform through which the program reads
+            the current state.
+        unit : int
+            Texture unit to which the current state is bound.
+
+        """
+        tex = self.front
+        width, height = tex.width, tex.height
+
+        state = current_state()
+        state.refresh()
+        previous = state.get_framebuffer()
+        viewport = state.viewport
+        was_bound = program.bound
+
+        self.bind()
+        state.set_viewport(0, 0, width, height)
+
+        program.use()
+        program[sampler] = unit
+        state.active_texture(unit)
+
+        textures = [t.id for t in self._textures]
+        target = tex.target
+        front = self.front_slot
+
+        c = canvas()
+        c.bind()
+        try:
+            for i in xrange(iterations):
+                back = 1 - front
+                state.bind_texture(target, textures[front])
+                gl.glDrawBuffer(gl.GL_COLOR_ATTACHMENT0_EXT + back)
+                c.draw()
+                front = back
+        finally:
+            self.front_slot = front
+            c.unbind()
+
+            # Render to all attachments again, as set by attach_texture
+            _draw_buffers(len(self._textures))
+
+            state.bind_texture(target, 0)
+            state.active_texture(0)
+            if not was_bound:
+                program.disable()
+            state.set_viewport(*viewport)
+            state.bind_framebuffer(previous)
+
+    def read(self, slot=None, out=None):
+        """Copy the state to host memory.
+
+        By default, the front texture is read (see `Framebuffer.read`).
+
+        """
+        if slot is None:
+            slot = self.front_slot
+        return Framebuffer.read(self, slot, out)
+
+    def read_async(self, slot=None, out=None, buffers=2):
+        """Start copying the state to host memory.
+
+        By default, the front texture is read (see
+        `Framebuffer.read_async`).
+
+        """
+        if slot is None:
+            slot = self.front_slot
+        return Framebuffer.read_async(self, slot, out, buffers)
@@ -0,0 +1,165 @@
+"""OpenGL constants and functions that are not exposed by all versions
+of pyglet.
+
+Each name is taken from pyglet if available.  Otherwise, constants fall
+back to the values from the OpenGL registry, and functions are looked
+up in the driver at import time.  Calling a function that the driver
+does not provide raises pyglet's MissingFunctionException.
+
+"""
+
+from pyglet import gl
+from pyglet.gl.lib import link_GL
+from ctypes import POINTER, c_void_p, c_uint64
+
+def _constant(name, value):
+    return getattr(gl, name, value)
+
+def _function(name, restype, argtypes, requires=None):
+    try:
+        return getattr(gl, name)
+    except AttributeError:
+        return link_GL(name, restype, argtypes, requires)
+
+# OpenGL 2.1: non-square matrices
+
+GL_FLOAT_MAT2x3 = _constant('GL_FLOAT_MAT2x3', 0x8B65)
+GL_FLOAT_MAT2x4 = _constant('GL_FLOAT_MAT2x4', 0x8B66)
+GL_FLOAT_MAT3x2 = _constant('GL_FLOAT_MAT3x2', 0x8B67)
+GL_FLOAT_MAT3x4 = _constant('GL_FLOAT_MAT3x4', 0x8B68)
+GL_FLOAT_MAT4x2 = _constant('GL_FLOAT_MAT4x2', 0x8B69)
+GL_FLOAT_MAT4x3 = _constant('GL_FLOAT_MAT4x3', 0x8B6A)
+
+_matrix_args = [gl.GLint, gl.GLsizei, gl.GLboolean, POINTER(gl.GLfloat)]
+
+glUniformMatrix2x3fv = _function('glUniformMatrix2x3fv', None, _matrix_args,
+                                 'VERSION_2_1')
+glUniformMatrix3x2fv = _function('glUniformMatrix3x2fv', None, _matrix_args,
+                                 'VERSION_2_1')
+glUniformMatrix2x4fv = _function('glUniformMatrix2x4fv', None, _matrix_args,
+                                 'VERSION_2_1')
+glUniformMatrix4x2fv = _function('glUniformMatrix4x2fv', None, _matrix_args,
+                                 'VERSION_2_1')
+glUniformMatrix3x4fv = _function('glUniformMatrix3x4fv', None, _matrix_args,
+                                 'VERSION_2_1')
+glUniformMatrix4x3fv = _function('glUniformMatrix4x3fv', None, _matrix_args,
+                                 'VERSION_2_1')
+
+# ARB_get_program_binary (core in OpenGL 4.1)
+
+GL_PROGRAM_BINARY_RETRIEVABLE_HINT = \
+    _constant('GL_PROGRAM_BINARY_RETRIEVABLE_HINT', 0x8257)
+GL_PROGRAM_BINARY_LENGTH = _constant('GL_PROGRAM_BINARY_LENGTH', 0x8741)
+GL_NUM_PROGRAM_BINARY_FORMATS = \
+    _constant('GL_NUM_PROGRAM_BINARY_FORMATS', 0x87FE)
+
+glGetProgramBinary = _function('glGetProgramBinary', None,
+                               [gl.GLuint, gl.GLsizei, POINTER(gl.GLsizei),
+                                POINTER(gl.GLenum), c_void_p],
+                               'ARB_get_program_binary')
+glProgramBinary = _function('glProgramBinary', None,
+                            [gl.GLuint, gl.GLenum, c_void_p, gl.GLsizei],
+                            'ARB_get_program_binary')
+glProgramParameteri = _function('glProgramParameteri', None,
+                                [gl.GLuint, gl.GLenum, gl.GLint],
+                                'ARB_get_program_binary')
+
+# ARB_pixel_buffer_object (core in OpenGL 2.1)
+
+GL_PIXEL_PACK_BUFFER = _constant('GL_PIXEL_PACK_BUFFER', 0x88EB)
+GL_PIXEL_UNPACK_BUFFER = _constant('GL_PIXEL_UNPACK_BUFFER', 0x88EC)
+
+# ARB_half_float_pixel (core in OpenGL 3.0)
+
+GL_HALF_FLOAT_ARB = _constant('GL_HALF_FLOAT_ARB', 0x140B)
+
+# ARB_texture_rg (core in OpenGL 3.0)
+
+GL_RG = _constant('GL_RG', 0x8227)
+GL_RG_INTEGER = _constant('GL_RG_INTEGER', 0x8228)
+GL_R8 = _constant('GL_R8', 0x8229)
+GL_R16 = _constant('GL_R16', 0x822A)
+GL_RG8 = _constant('GL_RG8', 0x822B)
+GL_RG16 = _constant('GL_RG16', 0x822C)
+GL_R16F = _constant('GL_R16F', 0x822D)
+GL_R32F = _constant('GL_R32F', 0x822E)
+GL_RG16F = _constant('GL_RG16F', 0x822F)
+GL_RG32F = _constant('GL_RG32F', 0x8230)
+GL_R8I = _constant('GL_R8I', 0x8231)
+GL_R8UI = _constant('GL_R8UI', 0x8232)
+GL_R16I = _constant('GL_R16I', 0x8233)
+GL_R16UI = _constant('GL_R16UI', 0x8234)
+GL_R32I = _constant('GL_R32I', 0x8235)
+GL_R32UI = _constant('GL_R32UI', 0x8236)
+GL_RG8I = _constant('GL_RG8I', 0x8237)
+GL_RG8UI = _constant('GL_RG8UI', 0x8238)
+GL_RG16I = _constant('GL_RG16I', 0x8239)
+GL_RG16UI = _constant('GL_RG16UI', 0x823A)
+GL_RG32I = _constant('GL_RG32I', 0x823B)
+GL_RG32UI = _constant('GL_RG32UI', 0x823C)
+
+# EXT_texture_integer (core in OpenGL 3.0)
+
+GL_RGBA32UI = _constant('GL_RGBA32UI', 0x8D70)
+GL_RGB32UI = _constant('GL_RGB32UI', 0x8D71)
+GL_RGBA16UI = _constant('GL_RGBA16UI', 0x8D76)
+GL_RGB16UI = _constant('GL_RGB16UI', 0x8D77)
+GL_RGBA8UI = _constant('GL_RGBA8UI', 0x8D7C)
+GL_RGB8UI = _constant('GL_RGB8UI', 0x8D7D)
+GL_RGBA32I = _constant('GL_RGBA32I', 0x8D82)
+GL_RGB32I = _constant('GL_RGB32I', 0x8D83)
+GL_RGBA16I = _constant('GL_RGBA16I', 0x8D88)
+GL_RGB16I = _constant('GL_RGB16I', 0x8D89)
+GL_RGBA8I = _constant('GL_RGBA8I', 0x8D8E)
+GL_RGB8I = _constant('GL_RGB8I', 0x8D8F)
+GL_RED_INTEGER = _constant('GL_RED_INTEGER', 0x8D94)
+GL_RGB_INTEGER = _constant('GL_RGB_INTEGER', 0x8D98)
+GL_RGBA_INTEGER = _constant('GL_RGBA_INTEGER', 0x8D99)
+
+# EXT_texture_snorm (core in OpenGL 3.1)
+
+GL_R8_SNORM = _constant('GL_R8_SNORM', 0x8F94)
+GL_RG8_SNORM = _constant('GL_RG8_SNORM', 0x8F95)
+GL_RGB8_SNORM = _constant('GL_RGB8_SNORM', 0x8F96)
+GL_RGBA8_SNORM = _constant('GL_RGBA8_SNORM', 0x8F97)
+GL_R16_SNORM = _constant('GL_R16_SNORM', 0x8F98)
+GL_RG16_SNORM = _constant('GL_RG16_SNORM', 0x8F99)
+GL_RGB16_SNORM = _constant('GL_RGB16_SNORM', 0x8F9A)
+GL_RGBA16_SNORM = _constant('GL_RGBA16_SNORM', 0x8F9B)
+
+# ARB_sync (core in OpenGL 3.2)
+
+GLsync = c_void_p
+
+GL_SYNC_GPU_COMMANDS_COMPLETE = \
+    _constant('GL_SYNC_GPU_COMMANDS_COMPLETE', 0x9117)
+GL_SYNC_FLUSH_COMMANDS_BIT = _constant('GL_SYNC_FLUSH_COMMANDS_BIT', 0x1)
+GL_ALREADY_SIGNALED = _constant('GL_ALREADY_SIGNALED', 0x911A)
+GL_TIMEOUT_EXPIRED = _constant('GL_TIMEOUT_EXPIRED', 0x911B)
+GL_CONDITION_SATISFIED = _constant('GL_CONDITION_SATISFIED', 0x911C)
+GL_WAIT_FAILED = _constant('GL_WAIT_FAILED', 0x911D)
+
+glFenceSync = _function('glFenceSync', GLsync, [gl.GLenum, gl.GLbitfield],
+                        'ARB_sync')
+glClientWaitSync = _function('glClientWaitSync', gl.GLenum,
+                             [GLsync, gl.GLbitfield, c_uint64], 'ARB_sync')
+glDeleteSync = _function('glDeleteSync', None, [GLsync], 'ARB_sync')
+
+# ARB_vertex_array_object (core in OpenGL 3.0)
+
+GL_VERTEX_ARRAY_BINDING = _constant('GL_VERTEX_ARRAY_BINDING', 0x85B5)
+
+glGenVertexArrays = _function('glGenVertexArrays', None,
+                              [gl.GLsizei, POINTER(gl.GLuint)],
+                              'ARB_vertex_array_object')
+glBindVertexArray = _function('glBindVertexArray', None, [gl.GLuint],
+                              'ARB_vertex_array_object')
+glDeleteVertexArrays = _function('glDeleteVertexArrays', None,
+                                 [gl.GLsizei, POINTER(gl.GLuint)],
+                                 'ARB_vertex_array_object')
+
+# ARB_draw_instanced (core in OpenGL 3.1)
+
+glDrawArraysInstancedARB = _function('glDrawArraysInstancedARB', None,
+                                     [gl.GLenum, gl.GLint, gl.GLsizei,
+                                      gl.GLsizei], 'ARB_draw_instanced')
@@ -0,0 +1,109 @@
+"""Placement of array elements in textures.
+
+"""
+
+__all__ = ['texture_shape', 'padding', 'valid_regions', 'index_functions']
+
+import numpy as np
+
+def texture_shape(shape, packed=False):
+    """Return the size (width, height) of the texture that stores an
+    array of the given shape.
+
+    Elements are stored row by row, in C order, so that element ``i``
+    of the flattened array is found at texel
+    ``(i % width, i // width)``.  For arrays of two or more dimensions,
+    the last axis runs along the width of the texture, and all other
+    axes along its height.  One-dimensional arrays are laid out in a
+    nearly square texture, of which the last row may be partially
+    filled (see `padding`).
+
+    In the packed layout, each RGBA texel holds four consecutive
+    elements, so that element ``i`` is found in colour band ``i % 4``
+    of texel ``i // 4``.  The texels are laid out as a one-dimensional
+    array, whatever the shape.
+
+    >>> texture_shape((2, 3, 4))
+    (4, 6)
+
+    >>> texture_shape((5,))
+    (3, 2)
+
+    >>> texture_shape((512,))
+    (32, 16)
+
+    >>> texture_shape((2, 3, 4), packed=True)
+    (3, 2)
+
+    """
+    if len(shape) == 0:
+        raise ValueError("Cannot store a scalar in a texture.")
+    if 0 in shape:
+        raise ValueError("Cannot store an empty array in a texture.")
+
+    if packed:
+        return texture_shape((-(-int(np.prod(shape)) // 4),))
+
+    if len(shape) > 1:
+        return shape[-1], int(np.prod(shape[:-1]))
+
+    n = int(shape[0])
+    if n < 2:
+        return n, 1
+
+    if n & (n - 1) == 0:
+        # Powers of two are split into powers of two
+        width = 2 ** ((n.bit_length()) // 2)
+        return width, n // width
+
+    width = int(np.ceil(np.sqrt(n)))
+    return width, -(-n // width)
+
+def padding(shape, packed=False):
+    """Return the number of values (texels, or colour bands of texels
+    in the packed layout) that follow the last element of an array of
+    the given shape in its texture.
+
+    >>> padding((5,))
+    1
+
+    >>> padding((5,), packed=True)
+    3
+
+    """
+    width, height = texture_shape(shape, packed)
+    return width * height * (4 if packed else 1) - int(np.prod(shape))
+
+def valid_regions(width, count):
+    """Return the regions of a texture that hold the first `count`
+    texels, in row-major order, of a texture of the given width.
+
+    These are the full rows, followed by the partially filled last
+    row, each given as (x, y, width, height).  Empty regions are left
+    out.
+
+    >>> valid_regions(3, 5)
+    [(0, 0, 3, 1), (0, 1, 2, 1)]
+
+    """
+    rows, rest = divmod(count, width)
+    regions = [(0, 0, width, rows), (0, rows, rest, 1)]
+    return [r for r in regions if r[2] and r[3]]
+
+# GLSL functions that convert between the linear index of a texel and
+# its coordinates, in a texture of the given width:
+#
+#   float _index(vec2 texel, float width)
+#   vec2 _texel(float index, float width)
+#
+# Indices are exact up to 2**24.
+index_functions = """
+float _index(vec2 texel, float width) {
+    return floor(texel.y) * width + floor(texel.x);
+}
+
+vec2 _texel(float index, float width) {
+    float row = floor((index + 0.5) / width);
+    return vec2(index - row * width, row) + 0.5;
+}
+"""
@@ -3,6 +3,9 @@
 """
 
 from pyglet import gl
+import numpy as np
+
+from scikits.gpu import glext
 
 opengl_ctypes = {
     gl.GL_BYTE: gl.GLbyte,
@@ -13,6 +16,7 @@ opengl_ctypes = {
     gl.GL_UNSIGNED_INT: gl.GLuint,
     gl.GL_FLOAT: gl.GLfloat,
     gl.GL_DOUBLE: gl.GLdouble,
+    glext.GL_HALF_FLOAT_ARB: gl.GLushort,
     }
 
 ctypes_opengl = {
@@ -26,6 +30,20 @@ ctypes_opengl = {
     gl.GLdouble: gl.GL_DOUBLE,
     }
 
+opengl_numpy = {
+    gl.GL_BYTE: np.int8,
+    gl.GL_UNSIGNED_BYTE: np.uint8,
+    gl.GL_SHORT: np.int16,
+    gl.GL_UNSIGNED_SHORT: np.uint16,
+    gl.GL_INT: np.int32,
+    gl.GL_UNSIGNED_INT: np.uint32,
+    gl.GL_FLOAT: np.float32,
+    gl.GL_DOUBLE: np.float64,
+    glext.GL_HALF_FLOAT_ARB: np.float16,
+    }
+
+numpy_opengl = dict((np.dtype(v), k) for (k, v) in opengl_numpy.items())
+
 def memory_type(T):
     """For a given OpenGL type, such as GL_BYTE, return the corresponding
     ctypes data-type, in this case c_ubyte.  If type is a ctype, it is simply
@@ -49,3 +67,208 @@ def memory_type(T):
     else:
         raise ValueError("Cannot convert provided type to ctype.")
 
+
+def numpy_type(T):
+    """For a given OpenGL type, such as GL_FLOAT, return the corresponding
+    numpy data-type, in this case float32.
+
+    Parameters
+    ----------
+    T : OpenGL type
+
+    Returns
+    -------
+    dtype : numpy dtype
+        The numpy data-type corresponding to `T`.
+
+    """
+    try:
+        return np.dtype(opengl_numpy[T])
+    except KeyError:
+        raise ValueError("Cannot convert provided type to numpy dtype.")
+
+def opengl_type(dtype):
+    """For a given numpy data-type, such as float32, return the
+    corresponding OpenGL type, in this case GL_FLOAT.
+
+    """
+    try:
+        return numpy_opengl[np.dtype(dtype)]
+    except KeyError:
+        raise ValueError("No OpenGL type corresponds to %s." % dtype)
+
+# Pixel formats of data with 1, 2, 3 or 4 bands, for textures holding
+# floating point (or normalized) and integer values
+_pixel_formats = {False: (gl.GL_RED, glext.GL_RG, gl.GL_RGB, gl.GL_RGBA),
+                  True: (glext.GL_RED_INTEGER, glext.GL_RG_INTEGER,
+                         glext.GL_RGB_INTEGER, glext.GL_RGBA_INTEGER)}
+
+# Internal formats of textures with 1, 2, 3 or 4 bands, by numpy type
+# and whether integers are normalized to [0, 1] ([-1, 1] if signed)
+_internal_formats = {
+    (np.float16, False): (glext.GL_R16F, glext.GL_RG16F,
+                          gl.GL_RGB16F_ARB, gl.GL_RGBA16F_ARB),
+    (np.float32, False): (glext.GL_R32F, glext.GL_RG32F,
+                          gl.GL_RGB32F_ARB, gl.GL_RGBA32F_ARB),
+    (np.uint8, True): (glext.GL_R8, glext.GL_RG8, gl.GL_RGB8, gl.GL_RGBA8),
+    (np.uint16, True): (glext.GL_R16, glext.GL_RG16,
+                        gl.GL_RGB16, gl.GL_RGBA16),
+    (np.int8, True): (glext.GL_R8_SNORM, glext.GL_RG8_SNORM,
+                      glext.GL_RGB8_SNORM, glext.GL_RGBA8_SNORM),
+    (np.int16, True): (glext.GL_R16_SNORM, glext.GL_RG16_SNORM,
+                       glext.GL_RGB16_SNORM, glext.GL_RGBA16_SNORM),
+    (np.uint8, False): (glext.GL_R8UI, glext.GL_RG8UI,
+                        glext.GL_RGB8UI, glext.GL_RGBA8UI),
+    (np.uint16, False): (glext.GL_R16UI, glext.GL_RG16UI,
+                         glext.GL_RGB16UI, glext.GL_RGBA16UI),
+    (np.uint32, False): (glext.GL_R32UI, glext.GL_RG32UI,
+                         glext.GL_RGB32UI, glext.GL_RGBA32UI),
+    (np.int8, False): (glext.GL_R8I, glext.GL_RG8I,
+                       glext.GL_RGB8I, glext.GL_RGBA8I),
+    (np.int16, False): (glext.GL_R16I, glext.GL_RG16I,
+                        glext.GL_RGB16I, glext.GL_RGBA16I),
+    (np.int32, False): (glext.GL_R32I, glext.GL_RG32I,
+                        glext.GL_RGB32I, glext.GL_RGBA32I),
+    }
+
+# Numpy type, number of bands and normalization of each internal format
+internal_format_types = {}
+for (T, normalized), formats in _internal_formats.items():
+    for bands, f in enumerate(formats):
+        internal_format_types[f] = (np.dtype(T), bands + 1, normalized)
+
+def is_integer_format(internalformat):
+    """Whether a texture of the given internal format holds integers,
+    which shaders read unnormalized, through integer samplers.
+
+    """
+    try:
+        dtype, bands, normalized = internal_format_types[internalformat]
+    except KeyError:
+        return False
+    return dtype.kind in 'iu' and not normalized
+
+def pixel_format(bands, integer=False):
+    """Return the pixel format of data with the given number of colour
+    bands, e.g. ``GL_RGB`` for 3, or ``GL_RGB_INTEGER`` to transfer
+    data to and from integer textures.
+
+    """
+    if not 1 <= bands <= 4:
+        raise ValueError("Data cannot have %d colour bands." % bands)
+    return _pixel_formats[bool(integer)][bands - 1]
+
+def texture_format(dtype, bands=1, normalized=None):
+    """Return the texture format that stores data of the given numpy
+    data-type.
+
+    Parameters
+    ----------
+    dtype : data-type
+        One of float16, float32, (u)int8, (u)int16 or (u)int32.
+    bands : {1, 2, 3, 4}
+        Number of colour bands.
+    normalized : bool, optional
+        Whether integers are stored as fixed-point values, which
+        shaders read as floats in [0, 1] (or [-1, 1] for signed
+        types), rather than as integers.  By default, 8- and 16-bit
+        integers are normalized, and 32-bit integers are not.
+
+    Returns
+    -------
+    internalformat : int
+        Internal format of the texture, e.g. ``GL_RGBA16F_ARB``.
+    format : int
+        Pixel format in which the data is transferred.
+    type : int
+        OpenGL type of the transferred data.
+
+    Notes
+    -----
+    The formats with one or two bands need OpenGL 3.0 (or
+    ARB_texture_rg), as do half floats and integer textures.  Signed
+    normalized formats need OpenGL 3.1, and cannot be rendered to.
+
+    Examples
+    --------
+    >>> f = texture_format(np.float16, 4)
+    >>> f == (gl.GL_RGBA16F_ARB, gl.GL_RGBA, glext.GL_HALF_FLOAT_ARB)
+    True
+
+    >>> f = texture_format(np.uint8, 1, normalized=False)
+    >>> f == (glext.GL_R8UI, glext.GL_RED_INTEGER, gl.GL_UNSIGNED_BYTE)
+    True
+
+    """
+    dtype = np.dtype(dtype)
+    if normalized is None:
+        normalized = dtype.kind in 'iu' and dtype.itemsize < 4
+    normalized = bool(normalized) and dtype.kind in 'iu'
+
+    try:
+        formats = _internal_formats[(dtype.type, normalized)]
+    except KeyError:
+        raise ValueError("No texture format stores %s%s." % \
+                         (dtype, normalized and " as normalized values" or ""))
+
+    format = pixel_format(bands, integer=not (normalized or
+                                              dtype.kind == 'f'))
+    return formats[bands - 1], format, opengl_type(dtype)
+
+# Integer types of textures, from the smallest
+_integer_types = [np.uint8, np.int8, np.uint16, np.int16, np.uint32, np.int32]
+
+def smallest_dtype(arr):
+    """Return the smallest numpy data-type of a texture that holds the
+    values of `arr` exactly.
+
+    Integers (and booleans) are stored in the smallest integer type of
+    up to 32 bits that holds their range, and floats in float16 if all
+    values are representable in half precision, and float32 otherwise.
+
+    >>> smallest_dtype(np.array([0, 200, 255]))
+    dtype('uint8')
+
+    >>> smallest_dtype(np.array([-1, 1000]))
+    dtype('int16')
+
+    >>> smallest_dtype(np.array([0.5, 1024.0, -2.25]))
+    dtype('float16')
+
+    >>> smallest_dtype(np.array([0.1]))
+    dtype('float32')
+
+    """
+    arr = np.asarray(arr)
+
+    if arr.dtype.kind == 'b':
+        return np.dtype(np.uint8)
+
+    if arr.dtype.kind in 'iu':
+        if arr.size == 0:
+            return np.dtype(np.uint8)
+
+        low, high = arr.min(), arr.max()
+        for T in _integer_types:
+            info = np.iinfo(T)
+            if info.min <= low and high <= info.max:
+                return np.dtype(T)
+        raise ValueError("Integers in [%d, %d] do not fit into 32 bits." % \
+                         (low, high))
+
+    if arr.dtype.kind == 'f':
+        with np.errstate(over='ignore'):
+            half = arr.astype(np.float16)
+        if np.all((half == arr) | np.isnan(arr)):
+            return np.dtype(np.float16)
+        return np.dtype(np.float32)
+
+    raise ValueError("Cannot store %s in a texture." % arr.dtype)
+
+def smallest_format(arr, bands=1):
+    """Return the texture format (see `texture_format`) of the smallest
+    data-type that holds the values of `arr` exactly (see
+    `smallest_dtype`).  Integers are stored unnormalized.
+
+    """
+    return texture_format(smallest_dtype(arr), bands, normalized=False)
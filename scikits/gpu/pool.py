@@ -0,0 +1,185 @@
+"""Reuse of textures and framebuffer objects.
+
+Creating OpenGL objects is slow compared to short kernels, so objects
+that are no longer used are kept, and handed out again to the next
+request for an object of the same kind.  Unused objects are deleted,
+least recently used first, when the memory they occupy exceeds the
+budget of the pool.  Each OpenGL context has its own pools.
+
+"""
+
+__all__ = ['ResourcePool', 'texture_pool', 'framebuffer_pool',
+           'texture_bytes']
+
+from pyglet import gl
+from collections import OrderedDict
+import ctypes
+
+from scikits.gpu.state import current_state, ContextLocal, owned_by_current
+from scikits.gpu.ntypes import internal_format_types
+
+# Approximate number of bytes per texel of each internal format
+_texel_bytes = {gl.GL_RGBA32F_ARB: 16,
+                gl.GL_RGB32F_ARB: 12,
+                gl.GL_LUMINANCE_ALPHA32F_ARB: 8,
+                gl.GL_LUMINANCE32F_ARB: 4,
+                gl.GL_ALPHA32F_ARB: 4,
+                gl.GL_RGBA16F_ARB: 8,
+                gl.GL_RGB16F_ARB: 6,
+                gl.GL_LUMINANCE16F_ARB: 2,
+                gl.GL_RGBA: 4,
+                gl.GL_RGBA8: 4,
+                gl.GL_RGB: 4,
+                gl.GL_RGB8: 4,
+                gl.GL_LUMINANCE_ALPHA: 2,
+                gl.GL_LUMINANCE: 1,
+                gl.GL_ALPHA: 1}
+for f, (dtype, bands, normalized) in internal_format_types.items():
+    _texel_bytes.setdefault(f, dtype.itemsize * bands)
+
+def texture_bytes(width, height, internalformat):
+    """Estimate the memory occupied by a texture.
+
+    """
+    return width * height * _texel_bytes.get(internalformat, 4)
+
+class ResourcePool(object):
+    def __init__(self, delete, budget=None):
+        """Pool of OpenGL objects that are not in use.
+
+        Parameters
+        ----------
+        delete : callable
+            Function that deletes an object, given its id.
+        budget : int, optional
+            Number of bytes that all objects of the pool, whether in
+            use or not, may occupy.  Unused objects are deleted to stay
+            within the budget.  By default, there is no limit.
+
+        Notes
+        -----
+        Objects are identified by the keys given to `acquire` and
+        `release`, such that any object released under a key can be
+        used by the next caller that acquires that key.
+
+        The statistics `hits` (requests served from the pool),
+        `misses` (requests for which a new object was needed),
+        `evictions` (unused objects deleted), `bytes_resident` (memory
+        occupied by all objects) and `bytes_free` (memory occupied by
+        unused objects) are available as attributes, and as a
+        dictionary from `stats`.
+
+        """
+        self.delete = delete
+        self.budget = budget
+
+        # Unused objects, by key, and the order in which they were
+        # released (id -> key, size)
+        self._free = {}
+        self._lru = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_resident = 0
+        self.bytes_free = 0
+
+    def acquire(self, key):
+        """Return the id of an unused object, or None.
+
+        If None is returned, the caller creates a new object, and
+        registers it with `allocated`.
+
+        """
+        ids = self._free.get(key)
+        if not ids:
+            self.misses += 1
+            return None
+
+        id = ids.pop()
+        key, nbytes = self._lru.pop(id.value)
+        self.bytes_free -= nbytes
+        self.hits += 1
+
+        return id
+
+    def allocated(self, nbytes):
+        """Register a newly created object of the given size.
+
+        Unused objects are first deleted to make room for it.
+
+        """
+        self.evict(nbytes)
+        self.bytes_resident += nbytes
+
+    def release(self, key, id, nbytes):
+        """Return an object that is no longer used to the pool.
+
+        """
+        self._free.setdefault(key, []).append(id)
+        self._lru[id.value] = (key, nbytes)
+        self.bytes_free += nbytes
+
+        self.evict()
+
+    def evict(self, nbytes=0):
+        """Delete unused objects, least recently used first, until there
+        is room for another `nbytes` bytes within the budget.
+
+        """
+        if self.budget is None:
+            return
+
+        while self._lru and self.bytes_resident + nbytes > self.budget:
+            value, (key, size) = self._lru.popitem(last=False)
+
+            ids = self._free[key]
+            id = [i for i in ids if i.value == value][0]
+            ids.remove(id)
+
+            self.bytes_free -= size
+            self.bytes_resident -= size
+            self.evictions += 1
+
+            self.delete(id)
+
+    def clear(self):
+        """Delete all unused objects.
+
+        """
+        budget = self.budget
+        self.budget = 0
+        try:
+            self.evict()
+        finally:
+            self.budget = budget
+
+    def stats(self):
+        """Return the statistics of the pool, as a dictionary.
+
+        """
+        return dict(hits=self.hits,
+                    misses=self.misses,
+                    evictions=self.evictions,
+                    bytes_resident=self.bytes_resident,
+                    bytes_free=self.bytes_free)
+
+def _delete_texture(id):
+    gl.glDeleteTextures(1, ctypes.byref(id))
+    current_state().deleted_texture(id)
+
+def _delete_framebuffer(id):
+    gl.glDeleteFramebuffersEXT(1, ctypes.byref(id))
+    current_state().deleted_framebuffer(id)
+
+# Textures, by (width, height, format, internalformat).  The budget of
+# the current context can be changed by assigning to
+# `texture_pool.budget`.
+texture_pool = ContextLocal(
+    lambda: ResourcePool(owned_by_current(_delete_texture),
+                         budget=256 * 2**20))
+
+# Framebuffer objects, all under the key None.  Their memory is not
+# counted.
+framebuffer_pool = ContextLocal(
+    lambda: ResourcePool(owned_by_current(_delete_framebuffer)))
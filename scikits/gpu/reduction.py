@@ -0,0 +1,448 @@
+"""Reduction of textures and arrays to a single value.
+
+"""
+
+__all__ = ['ReductionKernel', 'reduce_sum', 'reduce_min', 'reduce_max',
+           'reduce_mean', 'reduce_argmax']
+
+from pyglet import gl
+import numpy as np
+
+from scikits.gpu.shader import Program, VertexShader, FragmentShader
+from scikits.gpu.framebuffer import Framebuffer, _draw_canvas
+from scikits.gpu.texture import Texture
+from scikits.gpu.tiling import TiledTexture, _intersect
+from scikits.gpu.layout import valid_regions
+from scikits.gpu.state import current_state, ContextLocal
+
+_vertex_source = """
+void main(void) {
+    gl_Position = gl_Vertex;
+}
+"""
+
+def _chain(width, height, factor):
+    """Return the framebuffers into which the passes of a reduction of a
+    `width` x `height` texture render, from the largest down to 1x1.
+
+    The framebuffers and their textures are taken from the pools of the
+    context (see `pool`), and return there when they are deleted, so
+    that the memory of reductions of many sizes stays within the budget
+    of the pools.
+
+    """
+    chain = []
+    while True:
+        width = -(-width // factor)
+        height = -(-height // factor)
+
+        fbo = Framebuffer()
+        fbo.add_texture([width, height, 4], filter=gl.GL_NEAREST,
+                        internalformat=gl.GL_RGBA32F_ARB)
+        chain.append(fbo)
+
+        if width == height == 1:
+            break
+
+    return chain
+
+class ReductionKernel(object):
+    def __init__(self, combine, map=None, factor=4, preamble=''):
+        """Kernel that reduces all texels of a texture to one value.
+
+        Parameters
+        ----------
+        combine : str
+            GLSL expression that combines two partial results `a` and
+            `b`, both ``vec4``, e.g. ``"a + b"`` or ``"max(a, b)"``.
+            It must be associative.
+        map : str, optional
+            GLSL expression that converts the texel value `v`
+            (``vec4``) at position `p` (``vec2``, in texels from the
+            origin of the image) to a partial result, before it is
+            combined with others.  By default, the texel value itself.
+        factor : {2, 4}
+            Each pass combines blocks of `factor` x `factor` texels,
+            so that a reduction takes ``log(size) / log(factor)``
+            passes.
+        preamble : str, optional
+            GLSL declarations, e.g. of functions or uniforms, for use
+            in `combine` and `map`.  Uniforms are set when the kernel is
+            called.
+
+        Notes
+        -----
+        Partial results are stored in 32-bit RGBA float textures, each
+        pass rendering into a texture `factor` times smaller than the
+        previous one, down to a single texel.  The four colour bands
+        are reduced independently, so that four quantities can be packed
+        into one texture and reduced at the same time.  Only the final
+        texel is copied to the host.
+
+        Tiled images (see `tiling.TiledTexture`) are reduced one tile at
+        a time, after which the partial results of the tiles are reduced
+        in turn.  Partially filled last rows are handled in the same
+        way.
+
+        """
+        if factor not in (2, 4):
+            raise ValueError("Gather factor must be 2 or 4.")
+
+        self.combine = combine
+        self.map = map
+        self.factor = factor
+        self.preamble = preamble
+
+        # Generated programs, by texture target and whether the pass
+        # reads the input, for each context
+        self._programs = ContextLocal(dict)
+
+    def source(self, target, first=True):
+        """Generate the fragment shader of a pass.
+
+        Parameters
+        ----------
+        target : int
+            Texture target of the texture that the pass reads.
+        first : bool
+            Whether the pass reads the input, to which `map` is applied,
+            rather than partial results.
+
+        """
+        lines = []
+        if target == gl.GL_TEXTURE_2D:
+            lines += ['uniform sampler2D _tex;',
+                      'uniform vec2 _scale;']
+            lookup = 'texture2D(_tex, (%s + 0.5) * _scale)'
+        else:
+            lines += ['#extension GL_ARB_texture_rectangle : enable',
+                      'uniform sampler2DRect _tex;']
+            lookup = 'texture2DRect(_tex, %s + 0.5)'
+
+        # Texels of the input that hold data
+        lines += ['uniform vec2 _size;']
+
+        if first:
+            # Position of the data in the texture, and of the texture
+            # in the image
+            lines += ['uniform vec2 _offset;',
+                      'uniform vec2 _origin;']
+
+        lines += [self.preamble,
+                  'vec4 _combine(vec4 a, vec4 b) {',
+                  '    return %s;' % self.combine,
+                  '}',
+                  '',
+                  'vec4 _fetch(vec2 p) {']
+
+        if first:
+            lines += ['    vec4 v = %s;' % (lookup % '(p + _offset)'),
+                      '    p += _origin;',
+                      '    return %s;' % (self.map or 'v')]
+        else:
+            lines += ['    return %s;' % (lookup % 'p')]
+
+        lines += ['}',
+                  '',
+                  'void main(void) {',
+                  '    vec2 _base = floor(gl_FragCoord.xy) * %d.0;' % \
+                  self.factor,
+                  '    vec4 _r = _fetch(_base);',
+                  '    vec2 _p;']
+
+        # Blocks at the edge of the input are partially filled.  The
+        # first texel of a block always holds data.
+        for j in range(self.factor):
+            for i in range(self.factor):
+                if i == j == 0:
+                    continue
+                lines += [
+                    '    _p = _base + vec2(%d.0, %d.0);' % (i, j),
+                    '    if (all(lessThan(_p, _size)))',
+                    '        _r = _combine(_r, _fetch(_p));']
+
+        lines += ['    gl_FragData[0] = _r;',
+                  '}']
+
+        return '\n'.join(lines)
+
+    def program(self, target, first=True):
+        """Return the compiled program of a pass.
+
+        """
+        programs = self._programs.get()
+        key = (target, first)
+        if key not in programs:
+            programs[key] = Program(
+                [VertexShader(_vertex_source),
+                 FragmentShader(self.source(target, first))])
+
+        return programs[key]
+
+    def _passes(self, texture, size, first=True, offset=(0, 0),
+                origin=(0, 0), uniforms={}):
+        """Render the passes of the reduction of a `size` region of
+        `texture`, at `offset` in the texture and `origin` in the image,
+        with the given values of the uniforms of the preamble.
+
+        Returns the framebuffer holding the result, which is left bound.
+
+        """
+        width, height = size
+        chain = _chain(width, height, self.factor)
+        state = current_state()
+
+        source = texture
+        program = None
+        targets = set()
+        try:
+            for n, fbo in enumerate(chain):
+                program = self.program(source.target, first and n == 0)
+                program.use()
+
+                active = set(program.active_uniforms)
+                program['_tex'] = 0
+                program['_size'] = [float(width), float(height)]
+                for name, value in [('_scale', [1. / source.width,
+                                                1. / source.height]),
+                                    ('_offset', [float(k) for k in offset]),
+                                    ('_origin', [float(k) for k in origin])
+                                    ] + uniforms.items():
+                    if name in active:
+                        program[name] = value
+
+                output = fbo._textures[0]
+
+                # The texture read by a pass is never the one it renders
+                # to, so that it stays bound until replaced
+                state.bind_texture(source.target, source.id)
+                targets.add(source.target)
+                fbo.bind()
+                state.set_viewport(0, 0, output.width, output.height)
+                _draw_canvas()
+
+                source = output
+                width, height = output.width, output.height
+        finally:
+            for target in targets:
+                state.bind_texture(target, 0)
+            if program is not None:
+                program.disable()
+
+        return chain[-1]
+
+    def __call__(self, texture, size=None, count=None, uniforms=None):
+        """Reduce a texture.
+
+        Parameters
+        ----------
+        texture : Texture or TiledTexture
+            Input.
+        size : tuple of ints, optional
+            Width and height of the region, at the origin of the
+            texture, to reduce.  By default, the whole texture.  Tiled
+            textures are always reduced as a whole.
+        count : int, optional
+            Number of texels of the region, in row-major order, that
+            hold data, e.g. the size of an array whose texture has a
+            partially filled last row (see `layout.padding`).  By
+            default, all texels.
+        uniforms : dict, optional
+            Values of the uniforms declared in the preamble.
+
+        Returns
+        -------
+        out : ndarray
+            The reduced value of each of the four colour bands.
+
+        """
+        if size is None:
+            size = (texture.width, texture.height)
+        width, height = size
+
+        if count is None:
+            count = width * height
+
+        if uniforms is None:
+            uniforms = {}
+
+        if isinstance(texture, TiledTexture):
+            if size != (texture.width, texture.height):
+                raise ValueError("Tiled textures are reduced as a whole.")
+            tiles = zip(texture.textures, texture.regions)
+            halo = texture.halo
+        else:
+            tiles = [(texture, (0, 0, width, height))]
+            halo = (0, 0)
+
+        if not (0 < width <= texture.width and 0 < height <= texture.height):
+            raise ValueError("Cannot reduce %dx%d texels of a %dx%d "
+                             "texture." % (width, height,
+                                           texture.width, texture.height))
+
+        if not 0 < count <= width * height:
+            raise ValueError("Cannot reduce %d of %d texels." % \
+                             (count, width * height))
+
+        # Parts of each tile that hold data, with their position in the
+        # texture of the tile
+        parts = []
+        for tex, tile in tiles:
+            for region in valid_regions(width, count):
+                part = _intersect(tile, region)
+                if part is not None:
+                    offset = (part[0] - tile[0] + halo[0],
+                              part[1] - tile[1] + halo[1])
+                    parts.append((tex, part, offset))
+
+        state = current_state()
+        state.refresh()
+        previous = state.get_framebuffer()
+        viewport = state.viewport
+
+        state.active_texture(0)
+
+        try:
+            if len(parts) == 1:
+                tex, (x, y, w, h), offset = parts[0]
+                fbo = self._passes(tex, (w, h), offset=offset,
+                                   origin=(x, y), uniforms=uniforms)
+            else:
+                # Gather the result of each part into a texel
+                partial = Texture(len(parts), 1, format=gl.GL_RGBA,
+                                  internalformat=gl.GL_RGBA32F_ARB,
+                                  filter=gl.GL_NEAREST)
+
+                for n, (tex, (x, y, w, h), offset) in enumerate(parts):
+                    fbo = self._passes(tex, (w, h), offset=offset,
+                                       origin=(x, y), uniforms=uniforms)
+
+                    gl.glReadBuffer(gl.GL_COLOR_ATTACHMENT0_EXT)
+                    state.bind_texture(partial.target, partial.id)
+                    gl.glCopyTexSubImage2D(partial.target, 0, n, 0,
+                                           0, 0, 1, 1)
+                    state.bind_texture(partial.target, 0)
+
+                fbo = self._passes(partial, (len(parts), 1), first=False,
+                                   uniforms=uniforms)
+        finally:
+            state.set_viewport(*viewport)
+            state.bind_framebuffer(previous)
+
+        return fbo.read().reshape(4)
+
+_sum = ReductionKernel('a + b')
+_min = ReductionKernel('min(a, b)')
+_max = ReductionKernel('max(a, b)')
+
+# Largest value of the red band, with its position (x, y) in the green
+# and blue bands.  Of equal values, the first in row-major order wins.
+_argmax = ReductionKernel('b.r > a.r || (b.r == a.r && (b.b < a.b || '
+                          '(b.b == a.b && b.g < a.g))) ? b : a',
+                          map='vec4(v.r, p, 0.0)')
+
+# Reductions of packed textures, of which each texel holds four
+# consecutive values (see `layout.texture_shape`).  Of the `n` values,
+# the last texel may hold fewer than four; its other colour bands are
+# replaced by a value that does not change the result.
+_packed_preamble = """
+uniform float n;
+uniform float width;
+
+vec4 _mask(vec4 v, vec2 p, vec4 fill) {
+    float k = (p.y * width + p.x) * 4.0;
+    if (k + 1.0 >= n) v.y = fill.y;
+    if (k + 2.0 >= n) v.z = fill.z;
+    if (k + 3.0 >= n) v.w = fill.w;
+    return v;
+}
+
+// Largest value of a texel, with its index in the first band
+vec4 _argmax4(vec4 v, vec2 p) {
+    v = _mask(v, p, v.xxxx);
+    float m = max(max(v.x, v.y), max(v.z, v.w));
+    float c = v.x == m ? 0.0 : (v.y == m ? 1.0 : (v.z == m ? 2.0 : 3.0));
+    return vec4(m, (p.y * width + p.x) * 4.0 + c, 0.0, 0.0);
+}
+"""
+
+_packed_sum = ReductionKernel('a + b', map='_mask(v, p, vec4(0.0))',
+                              preamble=_packed_preamble)
+_packed_min = ReductionKernel('min(a, b)', map='_mask(v, p, v.xxxx)',
+                              preamble=_packed_preamble)
+_packed_max = ReductionKernel('max(a, b)', map='_mask(v, p, v.xxxx)',
+                              preamble=_packed_preamble)
+_packed_argmax = ReductionKernel('b.r > a.r || (b.r == a.r && b.g < a.g) '
+                                 '? b : a', map='_argmax4(v, p)',
+                                 preamble=_packed_preamble)
+
+def _reduce_packed(kernel, texture, size, count):
+    """Apply a reduction of packed values (`count` of them) to a texture.
+
+    """
+    if size is None:
+        size = (texture.width, texture.height)
+    if count is None:
+        count = size[0] * size[1] * 4
+
+    return kernel(texture, size, -(-count // 4),
+                      uniforms={'n': float(count), 'width': float(size[0])})
+
+def reduce_sum(texture, size=None, count=None, packed=False):
+    """Return the sum of each colour band of a texture.
+
+    See `ReductionKernel.__call__` for the parameters.  If `packed`,
+    the texture holds four values per texel, `count` is the number of
+    values, and the sum of all values is returned.
+
+    """
+    if packed:
+        return _reduce_packed(_packed_sum, texture, size,
+                              count).sum(dtype=np.float64)
+    return _sum(texture, size, count)
+
+def reduce_min(texture, size=None, count=None, packed=False):
+    """Return the minimum of each colour band of a texture, or of all
+    values if `packed` (see `reduce_sum`).
+
+    """
+    if packed:
+        return _reduce_packed(_packed_min, texture, size, count).min()
+    return _min(texture, size, count)
+
+def reduce_max(texture, size=None, count=None, packed=False):
+    """Return the maximum of each colour band of a texture, or of all
+    values if `packed` (see `reduce_sum`).
+
+    """
+    if packed:
+        return _reduce_packed(_packed_max, texture, size, count).max()
+    return _max(texture, size, count)
+
+def reduce_mean(texture, size=None, count=None, packed=False):
+    """Return the mean of each colour band of a texture, or of all
+    values if `packed` (see `reduce_sum`).
+
+    """
+    if size is None:
+        size = (texture.width, texture.height)
+    if count is None:
+        count = size[0] * size[1] * (4 if packed else 1)
+    return reduce_sum(texture, size, count, packed) / count
+
+def reduce_argmax(texture, size=None, count=None, packed=False):
+    """Return the position (x, y) of the largest value in the first
+    colour band of a texture.
+
+    If `packed` (see `reduce_sum`), return the index of the largest
+    value instead, counting four values per texel.  Indices are exact up
+    to 2**24.
+
+    """
+    if packed:
+        value, index, _, _ = _reduce_packed(_packed_argmax, texture, size,
+                                            count)
+        return int(index)
+
+    value, x, y, _ = _argmax(texture, size, count)
+    return int(x), int(y)
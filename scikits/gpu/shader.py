@@ -34,15 +34,80 @@ DEALINGS IN THE SOFTWARE.
 """
 
 __all__ = ['Program', 'VertexShader', 'FragmentShader', 'Shader',
-           'default_vertex_shader']
+           'default_vertex_shader', 'enable_binary_cache',
+           'disable_binary_cache']
 
-from scikits.gpu.config import require_extension, GLSLError
+from scikits.gpu.config import require_extension, GLSLError, hardware_info, \
+                              initialize
+from scikits.gpu.cache import HandleCache, BinaryCache
+from scikits.gpu.state import current_state, ContextLocal, owned_by_current
+from scikits.gpu import glext
 
 import pyglet.gl as gl
 from ctypes import pointer, POINTER, c_char_p, byref, cast, c_char, c_int, \
-                   create_string_buffer
+                   create_string_buffer, sizeof
 
 import numpy as np
+import hashlib
+import re
+import os
+import warnings
+
+_shader_types = {'vertex': gl.GL_VERTEX_SHADER,
+                 'fragment': gl.GL_FRAGMENT_SHADER,}
+##               'geometry': gl.GL_GEOMETRY_SHADER}
+
+def _compile_shader(source, shader_type):
+    """Compile GLSL source code.
+
+    Parameters
+    ----------
+    source : list of str
+        The GLSL source code.
+    shader_type : GLenum
+        GL_VERTEX_SHADER or GL_FRAGMENT_SHADER.
+
+    Returns
+    -------
+    handle : int
+        OpenGL shader handle.
+
+    """
+    initialize()
+
+    count = len(source)
+
+    # create the shader handle
+    shader = gl.glCreateShader(shader_type)
+
+    # convert the source strings into a ctypes pointer-to-char array,
+    # and upload them.  This is deep, dark, dangerous black magick -
+    # don't try stuff like this at home!
+    src = (c_char_p * count)(*source)
+    gl.glShaderSource(shader, count,
+                      cast(pointer(src), POINTER(POINTER(c_char))),
+                   None)
+
+    # compile the shader
+    gl.glCompileShader(shader)
+
+    temp = c_int(0)
+    # retrieve the compile status
+    gl.glGetShaderiv(shader, gl.GL_COMPILE_STATUS, byref(temp))
+
+    # if compilation failed, print the log
+    if not temp:
+        # retrieve the log length
+        gl.glGetShaderiv(shader, gl.GL_INFO_LOG_LENGTH, byref(temp))
+        # create a buffer for the log
+        buffer = create_string_buffer(temp.value)
+        # retrieve the log text
+        gl.glGetShaderInfoLog(shader, temp, None, buffer)
+        gl.glDeleteShader(shader)
+        # print the log to the console
+        raise GLSLError(buffer.value)
+
+    return shader
 
 class Shader:
     def __init__(self, source="", type='vertex'):
@@ -57,10 +122,6 @@ class Shader:
             Type of shader.
 
         """
-        shader_type = {'vertex': gl.GL_VERTEX_SHADER,
-                       'fragment': gl.GL_FRAGMENT_SHADER,}
-        ##             'geometry': gl.GL_GEOMETRY_SHADER}
-
         if isinstance(source, basestring):
             source = [source]
 
@@ -69,37 +130,39 @@ class Shader:
         if count < 1:
             raise GLSLError("No GLSL source provided.")
 
-        # create the shader handle
-        shader = gl.glCreateShader(shader_type[type])
+        self.source = "\n".join(source)
+        self.type = type
+
+        # Shaders with the same type and source are compiled only once
+        # (see shader_cache)
+        self.key = (type, hashlib.sha1("".join(source)).hexdigest())
+        self.handle = None
+        self._source = source
+
+        # When programs are restored from the binary cache, shaders
+        # that compiled before are compiled only if needed.  Others
+        # are compiled now, so that errors are reported here.
+        if binary_cache is None:
+            self.compile()
+        else:
+            key = _compiled_key(self)
+            if key not in binary_cache:
+                self.compile()
+                _save_compiled(key)
 
-        # convert the source strings into a ctypes pointer-to-char array,
-        # and upload them.  This is deep, dark, dangerous black magick -
-        # don't try stuff like this at home!
-        src = (c_char_p * count)(*source)
-        gl.glShaderSource(shader, count,
-                          cast(pointer(src), POINTER(POINTER(c_char))),
-                       None)
+    def compile(self):
+        """Compile the shader, unless this has been done already.
 
-        # compile the shader
-        gl.glCompileShader(shader)
+        """
+        if self.handle is None:
+            self._cache = shader_cache.get()
+            self.handle = self._cache.acquire(
+                self.key,
+                lambda: _compile_shader(self._source, _shader_types[self.type]))
 
-        temp = c_int(0)
-        # retrieve the compile status
-        gl.glGetShaderiv(shader, gl.GL_COMPILE_STATUS, byref(temp))
-
-        # if compilation failed, print the log
-        if not temp:
-            # retrieve the log length
-            gl.glGetShaderiv(shader, gl.GL_INFO_LOG_LENGTH, byref(temp))
-            # create a buffer for the log
-            buffer = create_string_buffer(temp.value)
-            # retrieve the log text
-            gl.glGetShaderInfoLog(shader, temp, None, buffer)
-            # print the log to the console
-            raise GLSLError(buffer.value)
-
-        self.handle = shader
-        self.source = "\n".join(source)
+    def __del__(self):
+        if getattr(self, 'handle', None) is not None:
+            self._cache.release(self.key)
 
 class VertexShader(Shader):
     def __init__(self, source):
@@ -116,6 +179,432 @@ class FragmentShader(Shader):
 ##         Shader.__init__(self, source, type='geometry')
 
 
+# For each OpenGL uniform type: the ctype in which its values are
+# exchanged, the shape of a single element and the function that
+# uploads it.  Matrix shapes are given as (rows, columns).
+_uniform_types = {
+    gl.GL_FLOAT: (gl.GLfloat, (1,), gl.glUniform1fv),
+    gl.GL_FLOAT_VEC2: (gl.GLfloat, (2,), gl.glUniform2fv),
+    gl.GL_FLOAT_VEC3: (gl.GLfloat, (3,), gl.glUniform3fv),
+    gl.GL_FLOAT_VEC4: (gl.GLfloat, (4,), gl.glUniform4fv),
+
+    gl.GL_INT: (gl.GLint, (1,), gl.glUniform1iv),
+    gl.GL_INT_VEC2: (gl.GLint, (2,), gl.glUniform2iv),
+    gl.GL_INT_VEC3: (gl.GLint, (3,), gl.glUniform3iv),
+    gl.GL_INT_VEC4: (gl.GLint, (4,), gl.glUniform4iv),
+
+    gl.GL_BOOL: (gl.GLint, (1,), gl.glUniform1iv),
+    gl.GL_BOOL_VEC2: (gl.GLint, (2,), gl.glUniform2iv),
+    gl.GL_BOOL_VEC3: (gl.GLint, (3,), gl.glUniform3iv),
+    gl.GL_BOOL_VEC4: (gl.GLint, (4,), gl.glUniform4iv),
+
+    gl.GL_FLOAT_MAT2: (gl.GLfloat, (2, 2), gl.glUniformMatrix2fv),
+    gl.GL_FLOAT_MAT3: (gl.GLfloat, (3, 3), gl.glUniformMatrix3fv),
+    gl.GL_FLOAT_MAT4: (gl.GLfloat, (4, 4), gl.glUniformMatrix4fv),
+    glext.GL_FLOAT_MAT2x3: (gl.GLfloat, (3, 2), glext.glUniformMatrix2x3fv),
+    glext.GL_FLOAT_MAT2x4: (gl.GLfloat, (4, 2), glext.glUniformMatrix2x4fv),
+    glext.GL_FLOAT_MAT3x2: (gl.GLfloat, (2, 3), glext.glUniformMatrix3x2fv),
+    glext.GL_FLOAT_MAT3x4: (gl.GLfloat, (4, 3), glext.glUniformMatrix3x4fv),
+    glext.GL_FLOAT_MAT4x2: (gl.GLfloat, (2, 4), glext.glUniformMatrix4x2fv),
+    glext.GL_FLOAT_MAT4x3: (gl.GLfloat, (3, 4), glext.glUniformMatrix4x3fv),
+    }
+
+# Samplers are set to the number of a texture unit
+for _sampler in ['GL_SAMPLER_1D', 'GL_SAMPLER_2D', 'GL_SAMPLER_3D',
+                 'GL_SAMPLER_CUBE', 'GL_SAMPLER_1D_SHADOW',
+                 'GL_SAMPLER_2D_SHADOW', 'GL_SAMPLER_2D_RECT_ARB',
+                 'GL_SAMPLER_2D_RECT_SHADOW_ARB']:
+    _uniform_types[getattr(gl, _sampler)] = (gl.GLint, (1,), gl.glUniform1iv)
+
+
+class _Uniform(object):
+    """Description of an active uniform variable.
+
+    All information needed to set or query the uniform is computed
+    once, when the program is linked.
+
+    Attributes
+    ----------
+    name : str
+        Name of the uniform, without array subscript.
+    type : GLenum
+        OpenGL type of the uniform, e.g. GL_FLOAT_VEC4.
+    count : int
+        Number of active array elements (1 for non-array uniforms).
+        Drivers may leave out unused elements at the end of an array.
+    array : bool
+        Whether the uniform is declared as an array.
+    length : int
+        Number of array elements as declared, if known from the shader
+        sources, and `count` otherwise.  Values for up to this many
+        elements are accepted, of which OpenGL ignores those beyond
+        the first `count`.
+    shape : tuple of ints
+        Shape of a single element, e.g. (4,) for vec4 or (3, 2) for mat2x3.
+    element_size : int
+        Number of values per array element, i.e. prod(shape).
+    size : int
+        Total number of values, i.e. count * element_size.
+    value_shape : tuple of ints
+        Shape of the uniform's value, i.e. (count,) + shape.
+    nbytes : int
+        Number of bytes occupied by the values.
+    ctype : ctype
+        Type in which the values are exchanged with OpenGL.
+    dtype : NumPy data-type
+        Data-type of NumPy arrays that can be uploaded without conversion.
+    pointer : ctypes pointer type
+        Pointer to `ctype`, as expected by `setter`.
+    storage : ctypes array type
+        Array type that can hold all values, one element per row.
+    locations : list of int
+        Location of each array element.
+    matrix : bool
+        Whether the uniform is a matrix.
+    boolean : bool
+        Whether the uniform is a bool or bvec.
+    setter : function
+        The glUniform* function used to upload values.
+    getter : function
+        The glGetUniform* function used to query values.
+
+    """
+    __slots__ = ['name', 'type', 'count', 'array', 'length', 'shape',
+                 'element_size', 'size', 'value_shape',
+                 'nbytes', 'ctype', 'dtype', 'pointer', 'storage',
+                 'locations', 'matrix', 'boolean', 'setter', 'getter']
+
+    def __init__(self, name, type, count, locations, array=False,
+                 length=None):
+        ctype, shape, setter = _uniform_types[type]
+
+        element_size = int(np.prod(shape))
+
+        self.name = name
+        self.type = type
+        self.count = count
+        self.array = array or count > 1
+        self.length = max(count, length or 0)
+        self.shape = shape
+        self.element_size = element_size
+        self.size = count * element_size
+        self.value_shape = (count,) + shape
+        self.nbytes = self.size * sizeof(ctype)
+        self.ctype = ctype
+        self.dtype = np.dtype(ctype)
+        self.pointer = POINTER(ctype)
+        self.storage = ctype * element_size * count
+        self.locations = locations
+        self.matrix = len(shape) == 2
+        self.boolean = type in (gl.GL_BOOL, gl.GL_BOOL_VEC2,
+                                gl.GL_BOOL_VEC3, gl.GL_BOOL_VEC4)
+        self.setter = setter
+
+        if ctype is gl.GLint:
+            self.getter = gl.glGetUniformiv
+        else:
+            self.getter = gl.glGetUniformfv
+
+
+def _uniform_array(uniform, value):
+    """Prepare a NumPy array for upload to a uniform.
+
+    Parameters
+    ----------
+    uniform : _Uniform
+        Description of the target uniform.
+    value : ndarray
+        Values of the uniform, with `uniform.size` elements.
+
+    Returns
+    -------
+    data : ndarray
+        C-contiguous array of data-type `uniform.dtype`.  This is `value`
+        itself (or a view on it) whenever possible.
+    transpose : bool
+        Whether matrices in `data` are stored in row-major order.
+
+    """
+    if value.dtype != uniform.dtype:
+        value = np.ascontiguousarray(value, dtype=uniform.dtype)
+
+    if uniform.matrix and value.ndim >= 2 and \
+           value.shape[-2:] == uniform.shape and \
+           not value.flags.c_contiguous:
+        # Matrices given in column-major order are exactly what OpenGL
+        # expects when not transposing
+        column_major = value.swapaxes(-1, -2)
+        if column_major.flags.c_contiguous:
+            return column_major, False
+
+    return np.ascontiguousarray(value), True
+
+
+# Declaration of a uniform array of constant length, e.g.
+# "uniform vec4 x[3]"
+_array_declaration = re.compile(r'\buniform\s+(?:\w+\s+)*?\w+\s+(\w+)\s*'
+                                r'\[\s*(\d+)\s*\]')
+
+def _declared_lengths(sources):
+    """Return the declared length of each uniform array in the given
+    shader sources.
+
+    >>> _declared_lengths(["uniform float a[4]; uniform vec2 b;"])
+    {'a': 4}
+
+    """
+    lengths = {}
+    for source in sources:
+        for name, length in _array_declaration.findall(source):
+            lengths[name] = max(lengths.get(name, 0), int(length))
+    return lengths
+
+def _uniform_table(program, shaders=()):
+    """Query OpenGL for the active uniforms, their types and locations.
+
+    Uniforms of types that cannot be set from Python, such as double
+    precision values, are left out.
+
+    Parameters
+    ----------
+    program : int
+        Handle of a linked program.
+    shaders : list of Shader
+        Shaders of the program, whose sources give the declared
+        lengths of uniform arrays.
+
+    Returns
+    -------
+    uniforms : dict
+        Maps each uniform name to a _Uniform description.
+
+    """
+    # Query maximum uniform name length
+    max_length = gl.GLint()
+    gl.glGetProgramiv(program, gl.GL_ACTIVE_UNIFORM_MAX_LENGTH,
+                      byref(max_length))
+    max_length = max_length.value
+
+    # Query number of active uniforms
+    nr_uniforms = gl.GLint()
+    gl.glGetProgramiv(program, gl.GL_ACTIVE_UNIFORMS, byref(nr_uniforms))
+    nr_uniforms = nr_uniforms.value
+
+    length = gl.GLsizei()
+    size = gl.GLint()
+    enum = gl.GLenum()
+    name = create_string_buffer(max_length)
+
+    lengths = _declared_lengths([shader.source for shader in shaders])
+
+    uniforms = {}
+    for i in range(nr_uniforms):
+        gl.glGetActiveUniform(program, i, max_length,
+                              byref(length), byref(size), byref(enum), name)
+
+        if enum.value not in _uniform_types:
+            continue
+
+        # Some drivers report arrays as "x[0]", others simply as "x"
+        var = name.value.split('[')[0]
+
+        locations = [gl.glGetUniformLocation(program, var)]
+        for j in range(1, size.value):
+            locations.append(
+                gl.glGetUniformLocation(program, var + '[%d]' % j))
+
+        uniforms[var] = _Uniform(var, enum.value, size.value, locations,
+                                 array=name.value.endswith(']'),
+                                 length=lengths.get(var))
+
+    return uniforms
+
+def _link_program(shaders):
+    """Link shaders into a new program.
+
+    Returns
+    -------
+    handle : int
+        OpenGL program handle.
+    uniforms : dict
+        Descriptions of the active uniforms, see `_uniform_table`.
+    values : dict
+        Empty dictionary, for the values of the uniforms.
+
+    """
+    initialize()
+
+    handle = gl.glCreateProgram()
+
+    if binary_cache is not None:
+        binary_key = _binary_key(shaders)
+        if _load_binary(handle, binary_key):
+            return handle, _uniform_table(handle, shaders), {}
+
+    for shader in shaders:
+        shader.compile()
+        gl.glAttachShader(handle, shader.handle);
+
+    if binary_cache is not None:
+        glext.glProgramParameteri(handle,
+                                  glext.GL_PROGRAM_BINARY_RETRIEVABLE_HINT,
+                                  gl.GL_TRUE)
+
+    # link the program
+    gl.glLinkProgram(handle)
+
+    temp = c_int(0)
+    # retrieve the link status
+    gl.glGetProgramiv(handle, gl.GL_LINK_STATUS, byref(temp))
+
+    # if linking failed, print the log
+    if not temp:
+        #       retrieve the log length
+        gl.glGetProgramiv(handle, gl.GL_INFO_LOG_LENGTH, byref(temp))
+        # create a buffer for the log
+        buffer = create_string_buffer(temp.value)
+        # retrieve the log text
+        gl.glGetProgramInfoLog(handle, temp, None, buffer)
+        gl.glDeleteProgram(handle)
+        # print the log to the console
+        raise GLSLError(buffer.value)
+
+    if binary_cache is not None:
+        _save_binary(handle, binary_key)
+
+    return handle, _uniform_table(handle, shaders), {}
+
+def _binary_key(shaders):
+    """Key of a program binary in the binary cache.
+
+    Binaries are only valid for the driver that produced them, so the
+    key depends on the graphics hardware as well as on the shaders.
+
+    """
+    key = hashlib.sha1()
+    for part in [hardware_info['vendor'], hardware_info['renderer'],
+                 hardware_info['version']]:
+        key.update(part + '\0')
+
+    for shader_type, source_hash in [shader.key for shader in shaders]:
+        key.update(shader_type + source_hash)
+
+    return key.hexdigest()
+
+def _compiled_key(shader):
+    """Key under which the binary cache records that `shader` compiles
+    on this hardware.
+
+    """
+    return hashlib.sha1('compiled\0' + _binary_key([shader])).hexdigest()
+
+def _save_compiled(key):
+    """Record in the binary cache that a shader compiled.
+
+    """
+    try:
+        binary_cache.save(key, 0, '')
+    except (IOError, OSError), e:
+        warnings.warn("Could not record compiled shader: %s" % e,
+                      RuntimeWarning)
+
+def _load_binary(program, key):
+    """Load a program binary from the binary cache.
+
+    Returns
+    -------
+    loaded : bool
+        Whether the program was loaded and linked successfully.  A
+        binary rejected by the driver is removed from the cache.
+
+    """
+    stored = binary_cache.load(key)
+    if stored is None:
+        return False
+
+    format, data = stored
+    glext.glProgramBinary(program, format,
+                          create_string_buffer(data, len(data)), len(data))
+
+    status = c_int(0)
+    gl.glGetProgramiv(program, gl.GL_LINK_STATUS, byref(status))
+
+    if not status:
+        binary_cache.remove(key)
+        return False
+
+    return True
+
+def _save_binary(program, key):
+    """Store the binary of a linked program in the binary cache.
+
+    """
+    length = gl.GLint(0)
+    gl.glGetProgramiv(program, glext.GL_PROGRAM_BINARY_LENGTH, byref(length))
+    if not length.value:
+        return
+
+    data = create_string_buffer(length.value)
+    written = gl.GLsizei()
+    format = gl.GLenum()
+    glext.glGetProgramBinary(program, length, byref(written), byref(format),
+                             data)
+
+    try:
+        binary_cache.save(key, format.value, data.raw[:written.value])
+    except (IOError, OSError), e:
+        warnings.warn("Could not store program binary: %s" % e,
+                      RuntimeWarning)
+
+#: On-disk cache of program binaries, see enable_binary_cache.
+binary_cache = None
+
+def enable_binary_cache(path=None):
+    """Store linked programs on disk, and restore them in later runs.
+
+    Once enabled, linking a program first looks for a binary produced
+    by an earlier run on the same graphics driver.  If one is found and
+    accepted by the driver, the shaders are neither compiled nor
+    linked.  Otherwise, the program is built from source as usual and
+    its binary is stored.
+
+    Shaders created before the cache is enabled are compiled right away.
+
+    Parameters
+    ----------
+    path : str
+        Cache directory.  Defaults to ~/.scikits.gpu/programs.
+
+    """
+    global binary_cache
+
+    require_extension('ARB_get_program_binary')
+
+    if path is None:
+        path = os.path.join(os.path.expanduser('~'), '.scikits.gpu',
+                            'programs')
+
+    binary_cache = BinaryCache(path)
+
+def disable_binary_cache():
+    """Stop storing and restoring program binaries.
+
+    """
+    global binary_cache
+    binary_cache = None
+
+#: Compiled shaders, keyed by shader type and SHA-1 hash of the source.
+#: Each OpenGL context has its own cache.
+shader_cache = ContextLocal(
+    lambda: HandleCache(owned_by_current(gl.glDeleteShader)))
+
+#: Linked programs, keyed by the keys of their shaders.  Each OpenGL
+#: context has its own cache.
+program_cache = ContextLocal(
+    lambda: HandleCache(owned_by_current(
+        lambda program: gl.glDeleteProgram(program[0]))))
+
+
 def if_in_use(f):
     """Decorator: Execute this function if and only if the program is in use.
 
@@ -143,13 +632,13 @@ class Program(list):
             # In case only one shader was provided
             list.__init__(self, [shaders])
 
-        self.handle = gl.glCreateProgram()
-
         # not bound yet (i.e. not in rendering pipeline)
         self.bound = False
 
-        # Variable types and descriptions
-        self._uniform_type_info = {}
+        # Key of the linked program in program_cache, and the cache
+        # of the context in which it was linked
+        self._key = None
+        self._cache = None
 
         self._link()
 
@@ -158,9 +647,10 @@ class Program(list):
 
         """
         list.append(self, shader)
+        self._link()
 
         if self.bound:
-            self.bind()
+            self.use()
 
     @property
     def linked(self):
@@ -170,160 +660,83 @@ class Program(list):
         return bool(temp)
 
     def _link(self):
-        for shader in self:
-            gl.glAttachShader(self.handle, shader.handle);
+        """Link the shaders into a program.
 
-        # link the program
-        gl.glLinkProgram(self.handle)
+        Programs linked from the same shaders are shared through
+        program_cache.  Along with the program handle, they share the
+        descriptions and values of the active uniforms:
 
-        temp = c_int(0)
-        # retrieve the link status
-        gl.glGetProgramiv(self.handle, gl.GL_LINK_STATUS, byref(temp))
+        _uniforms : dict
+            Maps each uniform name to a _Uniform description.
+        _values : dict
+            Maps uniform names to their last known values.
 
-        # if linking failed, print the log
-        if not temp:
-            #       retrieve the log length
-            gl.glGetProgramiv(self.handle, gl.GL_INFO_LOG_LENGTH, byref(temp))
-            # create a buffer for the log
-            buffer = create_string_buffer(temp.value)
-            # retrieve the log text
-            gl.glGetProgramInfoLog(self.handle, temp, None, buffer)
-            # print the log to the console
-            raise GLSLError(buffer.value)
+        """
+        key = tuple([shader.key for shader in self])
+        shaders = list(self)
 
-        # Query maximum uniform name length
-        AUL = gl.GLint()
-        gl.glGetProgramiv(self.handle, gl.GL_ACTIVE_UNIFORM_MAX_LENGTH,
-                          byref(AUL))
-        self._ACTIVE_UNIFORM_MAX_LENGTH = AUL.value
+        # Identical shaders share a handle, which OpenGL refuses to
+        # attach twice
+        if len(set(key)) < len(key):
+            raise GLSLError("The same shader cannot be linked into a "
+                            "program more than once.")
 
-        self._update_uniform_types()
+        cache = program_cache.get()
+        self.handle, self._uniforms, self._values = \
+                     cache.acquire(key, lambda: _link_program(shaders))
 
+        if self._key is not None:
+            self._cache.release(self._key)
+        self._key, self._cache = key, cache
 
     @property
     def active_uniforms(self):
-        """Query OpenGL for a list of active uniforms.
+        """List of active uniforms.
 
         This is needed, because we are only allowed to set and query the
-        values of active uniforms.
-
-        """
-        # Query number of active uniforms
-        nr_uniforms = gl.GLint()
-        gl.glGetProgramiv(self.handle, gl.GL_ACTIVE_UNIFORMS,
-                          byref(nr_uniforms))
-        nr_uniforms = nr_uniforms.value
-
-        length = gl.GLsizei()
-        size = gl.GLsizei()
-        enum = gl.GLenum()
-        name = create_string_buffer(self._ACTIVE_UNIFORM_MAX_LENGTH)
-
-        uniforms = []
-        for i in range(nr_uniforms):
-            gl.glGetActiveUniform(self.handle, i, 20, byref(length), byref(size),
-                                  byref(enum), name)
-            uniforms.append(name.value)
-
-        return uniforms
-
-    def _update_uniform_types(self):
-        """Determine the numeric types of uniform variables.
-
-        Updates the internal dictionary _uniform_type_info[var] with:
-
-        kind : {'mat', 'vec', 'int', 'float'}
-            The kind of numeric type.
-        size : {2, 3, 4}
-            The size of the type, e.g., 4 for vec4, 4 for mat2, 1 for scalar.
-        array : bool
-            Whether the variable is defined as an array, e.g.,
-            uniform vec4 x[]; ==> true.
+        values of active uniforms.  The list is queried from OpenGL
+        when the program is linked.
 
         """
-        source = ";".join([s.source for s in self])
-
-        # And look at each statement individually
-        source = [s.strip() for s in source.split(';')]
-
-        # Now look only at uniform declarations
-        source = [s[len('uniform')+1:] for s in source if s.startswith('uniform')]
-
-        types = [desc_name.split(' ')[:2] for desc_name in source]
-
-        # Handle declarations of the form uniform float f=3.0
-        types = [(desc, name.split('=')[0]) for (desc, name) in types]
-
-        type_info = {}
-
-        for desc, name in types:
-            # Check for vector type, e.g. float x[12]
-            name_array = name.split('[')
-            var_name = name_array[0]
-
-            # If array size is specified, see what it is
-            if len(name_array) > 1:
-                array_size = name_array[1].split(']')[0].strip()
-                if not array_size:
-                    raise RuntimeError("Array declaration without size is not "
-                                       "supported.")
-
-                array_size = int(array_size)
-            else:
-                array_size = 1
-
-            # Check if type is, e.g., vec3
-            vec_param = desc[-1]
-            if vec_param.isdigit():
-                size = int(vec_param)
-                desc = desc[:-1]
-            else:
-                size = 1
-
-            # For a square matrix, we have the side dimension.  To get
-            # the size, we need to square that.
-            if desc == 'mat':
-                size *= size
-
-            var_info = {
-                'kind': desc,
-                'size': size,
-                'array': array_size}
-
-            if type_info.has_key(var_name) and \
-                   type_info[var_name] != var_info:
-                raise GLSLError("Inconsistent definition of variable '%s'." % \
-                                var_name)
-            else:
-                type_info[var_name] = var_info
-
-        self._uniform_type_info = type_info
+        return sorted(self._uniforms.keys())
 
     def use(self):
         """Bind the program into the rendering pipeline.
 
-        """
-        if not self.linked:
-            self._link()
+        Nothing is done if the program is already in use.  Programs are
+        only linked successfully, in `_link`, so that the link status
+        need not be checked here.
 
-        # bind the program
-        gl.glUseProgram(self.handle)
+        """
+        current_state().use_program(self.handle)
         self.bound = True
 
     def disable(self):
         """Unbind all programs in use.
 
         """
-        gl.glUseProgram(0)
+        current_state().use_program(0)
         self.bound = False
 
     def __del__(self):
-        self.disable()
-        gl.glDeleteProgram(self.handle)
+        if self._key is None:
+            return
+
+        try:
+            # Unbind the program if it is in use, unless another
+            # Program shares its handle
+            state = current_state()
+            if self.bound and state.program == self.handle and \
+                   self._cache is program_cache.get() and \
+                   self._cache.refcount(self._key) == 1:
+                state.use_program(0)
+        except:
+            pass
 
-    def _uniform_loc_storage_and_type(self, var):
-        """Return the uniform location and a container that can
-        store its value.
+        self._cache.release(self._key)
+
+    def _uniform(self, var):
+        """Return the description of an active uniform.
 
         Parameters
         ----------
@@ -331,121 +744,170 @@ class Program(list):
             Uniform name.
 
         """
-        if var not in self.active_uniforms:
+        try:
+            return self._uniforms[var]
+        except KeyError:
             raise GLSLError("Uniform '%s' is not active.  Make sure the "
                             "variable is used in the source code." % var)
 
-        try:
-            var_info = self._uniform_type_info[var]
-        except KeyError:
-            raise ValueError("Uniform variable '%s' is not defined in "
-                             "shader source." % var)
+    def _set_uniform(self, uniform, value):
+        """Upload the value of a uniform, described by `uniform`.
 
-        # If this is an array, how many values are involved?
-        count = var_info['array']
+        The program must be in use.  Nothing is uploaded if the uniform
+        already has the given value.
 
-        if var_info['kind'] in ['int']:
-            data_type = gl.GLint
+        """
+        if isinstance(value, np.ndarray):
+            size = value.size
         else:
-            data_type = gl.GLfloat
-
-        assert gl.glIsProgram(self.handle) == True
-        assert self.linked
-
-        loc = gl.glGetUniformLocation(self.handle, var)
-
-        if loc == -1:
-            raise RuntimeError("Could not query uniform location "
-                               "for '%s'." % var)
+            # Ensure the value is given as a list
+            try:
+                value = list(value)
+            except TypeError:
+                value = [value]
+            size = len(value)
+
+        # Arrays may be declared longer than their active part, in
+        # which case the remaining elements are ignored
+        count, remainder = divmod(size, uniform.element_size)
+        if remainder or not uniform.count <= count <= uniform.length:
+            varname = uniform.name
+            if uniform.array:
+                varname += '[%d]' % uniform.length
+            raise ValueError("Invalid input size (%s) for (%s) size '%s'." \
+                             % (size, uniform.size, varname))
+
+        # Compare with the host copy, without copying arrays of the
+        # uniform's data-type
+        current = np.asarray(value, dtype=uniform.dtype)
+        if uniform.boolean:
+            current = current != 0
+
+        previous = self._values.get(uniform.name)
+        if previous is not None and previous.size == current.size and \
+               np.array_equal(previous.reshape(current.shape), current):
+            return
+
+        # Host copy of the value, in the form returned by get()
+        shadow = np.array(current, dtype=uniform.dtype, order='C')
+        shadow = shadow.reshape((count,) + uniform.shape)
+
+        if isinstance(value, np.ndarray):
+            value, transpose = _uniform_array(uniform, value)
+            data = value.ctypes.data_as(uniform.pointer)
+        else:
+            transpose = True
+            data = (uniform.ctype * size)(*value)
 
-        storage = data_type * (count * var_info['size'])
-        storage_nested = count * (data_type * var_info['size'])
+        if uniform.matrix:
+            uniform.setter(uniform.locations[0], count, transpose, data)
+        else:
+            uniform.setter(uniform.locations[0], count, data)
 
-        return loc, storage, storage_nested, data_type
+        self._values[uniform.name] = shadow
 
     @if_in_use
     def __setitem__(self, var, value):
         """Set uniform variable value.
 
-        Please note that matrices must be specified in row-major format.
-
-        """
-        loc, container, container_nested, dtype = \
-             self._uniform_loc_storage_and_type(var)
+        Please note that matrices must be specified in row-major format,
+        unless they are given as NumPy arrays (see below).
 
-        var_info = self._uniform_type_info[var]
-        count, kind, size = [var_info[k] for k in 'array', 'kind', 'size']
+        A C-contiguous NumPy array of the uniform's data-type (float32
+        or int32) is passed to OpenGL without being copied.  A matrix
+        uniform may also be given as an array of shape (..., rows,
+        columns) stored in column-major order, such as ``m.T`` for a
+        C-contiguous ``m`` of shape (columns, rows); OpenGL is then
+        told not to transpose the data.  Arrays of other data-types or
+        layouts are converted before being uploaded.
 
-        # Ensure the value is given as a list
-        try:
-            value = list(value)
-        except TypeError:
-            value = [value]
+        """
+        self._set_uniform(self._uniform(var), value)
 
-        expected_size = var_info['size'] * var_info['array']
-        if len(value) != var_info['size'] * var_info['array']:
-            varname = var
-            if var_info['array'] > 0:
-                varname += '[%d]' % var_info['array']
-            raise ValueError("Invalid input size (%s) for (%s) size '%s'." \
-                             % (len(value), expected_size, varname))
+    @if_in_use
+    def update(self, values=(), **kwargs):
+        """Set the values of several uniform variables.
 
-        if var_info['kind'] == 'mat':
-            set_func_name = 'glUniformMatrix%dfv' % np.sqrt(var_info['size'])
-            set_func = getattr(gl, set_func_name)
-            set_func(loc, count, True, container(*value))
-        else:
-            if var_info['kind'] == 'int':
-                type_code = 'i'
-            else:
-                type_code = 'f'
+        This is equivalent to assigning each value in turn, but all
+        uniforms are looked up before any value is uploaded.
 
-            # Setter function, named something like glUniform4iv
-            set_func_name = 'glUniform%d%sv' % (var_info['size'],
-                                                type_code)
+        Parameters
+        ----------
+        values : dict or sequence of (name, value) pairs
+            Uniform names and values.
+        kwargs : dict
+            Further uniform names and values.
 
-            set_func = getattr(gl, set_func_name)
-            set_func(loc, count, container(*value))
+        Examples
+        --------
+        ::
 
-    def __getitem__(self, var):
-        """Get uniform value.
+            p.update({'offset': [-1.0, 0.0], 'zoom': 2.0})
+            p.update(offset=[-1.0, 0.0], zoom=2.0)
 
         """
-        loc, container, container_nested, dtype = \
-             self._uniform_loc_storage_and_type(var)
-        var_info = self._uniform_type_info[var]
-        data = container_nested()
+        if hasattr(values, 'items'):
+            values = values.items()
 
-        if dtype == gl.GLint:
-            get_func = gl.glGetUniformiv
-        else:
-            get_func = gl.glGetUniformfv
+        items = [(self._uniform(var), value) for (var, value) in
+                 list(values) + kwargs.items()]
 
-        alen = var_info['array']
-        for i in range(alen):
-            if i > 0:
-                # Query the location of each array element
-                loc = gl.glGetUniformLocation(self.handle, var + '[%d]' % i)
+        set_uniform = self._set_uniform
+        for uniform, value in items:
+            set_uniform(uniform, value)
 
-            assert loc != -1
+    def _query_uniform(self, uniform):
+        """Query OpenGL for the value of a uniform, described by `uniform`.
+
+        """
+        data = uniform.storage()
 
-            get_func(self.handle, loc, data[i])
+        for i, loc in enumerate(uniform.locations):
+            uniform.getter(self.handle, loc, data[i])
 
         # Convert to a NumPy array for easier processing
         data = np.array(data)
 
+        # Matrices are stored in column-major order
+        if uniform.matrix:
+            rows, cols = uniform.shape
+            data = data.reshape((uniform.count, cols, rows)).swapaxes(1, 2)
+
+        return np.ascontiguousarray(data).reshape(uniform.value_shape)
+
+    def get(self, var, refresh=False):
+        """Get uniform value.
+
+        Parameters
+        ----------
+        var : str
+            Uniform name.
+        refresh : bool
+            By default, the value last assigned to the uniform (or read
+            from OpenGL) is returned, without querying OpenGL.  Set
+            `refresh` to query OpenGL, for example after changing the
+            uniform with direct calls to glUniform*.
+
+        """
+        uniform = self._uniform(var)
+
+        if refresh or var not in self._values:
+            self._values[var] = self._query_uniform(uniform)
+
+        data = self._values[var].copy()
+
         # Scalar
         if data.size == 1:
             return data[0]
-        # Array, matrix, vector
-        elif var_info['kind'] == 'mat':
-            count, n_sqr = data.shape
-            n = np.sqrt(n_sqr)
-
-            data = data.reshape((count, n, n), order='F')
 
         return data
 
+    def __getitem__(self, var):
+        """Get uniform value, without querying OpenGL.  See `get`.
+
+        """
+        return self.get(var)
+
 def default_vertex_shader():
     """Generate a pass-through VertexShader.
 
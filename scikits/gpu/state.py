@@ -0,0 +1,274 @@
+"""Record of OpenGL bindings, to skip calls that would change nothing.
+
+Binding a program, framebuffer or texture that is already bound still
+costs a call into the driver, and querying a binding may stall it.
+The bindings made by this package are therefore recorded, separately
+for each OpenGL context, so that redundant calls are skipped and the
+current bindings are known without asking OpenGL.
+
+The current program and framebuffer are trusted across operations:
+code that binds these with direct OpenGL calls must call
+``current_state().invalidate()`` before using this package again.  The
+texture bindings and the viewport, which windowing toolkits change
+freely, are only trusted for the duration of an operation, which starts
+by calling `GLState.refresh` (or `GLState.forget_textures`, if it does
+not change the viewport).
+
+OpenGL names are only valid in the context that created them.  Caches
+of OpenGL objects are therefore kept separately for each context as
+well, in `GLState.resources` (see `ContextLocal`).
+
+"""
+
+__all__ = ['GLState', 'current_state', 'ContextLocal', 'owned_by_current']
+
+from pyglet import gl
+import ctypes
+import itertools
+
+def _value(id):
+    """Return the value of an OpenGL name, given as int or ctypes value.
+
+    """
+    return getattr(id, 'value', id)
+
+class GLState(object):
+    def __init__(self):
+        """Bindings of an OpenGL context, as last set through this object.
+
+        Attributes
+        ----------
+        program : int or None
+            Program in use.
+        framebuffer : int or None
+            Framebuffer object bound to ``GL_FRAMEBUFFER_EXT``.
+        unit : int or None
+            Active texture unit, counted from 0.
+        textures : dict
+            Texture bound to each (unit, target).
+        viewport : tuple of ints or None
+            Viewport (x, y, width, height).
+        resources : dict
+            Objects kept for the lifetime of the context, such as
+            caches of OpenGL names (see `ContextLocal`).
+
+        Bindings that are not known are None (or missing from
+        `textures`); the next call that sets them is never skipped.
+
+        The numbers of calls made and skipped are counted in `calls`
+        and `skipped`.
+
+        """
+        self.calls = 0
+        self.skipped = 0
+
+        self.resources = {}
+
+        self.invalidate()
+
+    def invalidate(self):
+        """Forget all bindings, e.g. after they were changed directly.
+
+        """
+        self.program = None
+        self.framebuffer = None
+        self.viewport = None
+        self.forget_textures()
+
+    def forget_textures(self):
+        """Forget the active texture unit and the texture bindings.
+
+        """
+        self.unit = None
+        self.textures = {}
+
+    def refresh(self):
+        """Forget the texture bindings and query the viewport, which
+        other code may have changed since the last operation.
+
+        """
+        self.forget_textures()
+
+        viewport = (gl.GLint * 4)()
+        gl.glGetIntegerv(gl.GL_VIEWPORT, viewport)
+        self.viewport = tuple(viewport)
+
+    def _changed(self, current, value):
+        """Whether a binding must be set, counting the call.
+
+        """
+        if current is not None and current == value:
+            self.skipped += 1
+            return False
+
+        self.calls += 1
+        return True
+
+    def use_program(self, handle):
+        """Use a program (0 for none).
+
+        """
+        if self._changed(self.program, handle):
+            gl.glUseProgram(handle)
+            self.program = handle
+
+    def get_framebuffer(self):
+        """Return the id of the bound framebuffer object.
+
+        """
+        if self.framebuffer is None:
+            current = gl.GLint()
+            gl.glGetIntegerv(gl.GL_FRAMEBUFFER_BINDING_EXT,
+                             ctypes.byref(current))
+            self.framebuffer = current.value
+
+        return self.framebuffer
+
+    def bind_framebuffer(self, id):
+        """Bind a framebuffer object (0 for the window).
+
+        """
+        id = _value(id)
+        if self._changed(self.framebuffer, id):
+            gl.glBindFramebufferEXT(gl.GL_FRAMEBUFFER_EXT, id)
+            self.framebuffer = id
+
+    def active_texture(self, unit):
+        """Select the texture unit to which textures are bound.
+
+        """
+        if self._changed(self.unit, unit):
+            gl.glActiveTexture(gl.GL_TEXTURE0 + unit)
+            self.unit = unit
+
+    def bind_texture(self, target, id, unit=None):
+        """Bind a texture (0 for none) to the active texture unit, or to
+        `unit` after making it active.
+
+        """
+        if unit is not None:
+            self.active_texture(unit)
+
+        id = _value(id)
+        key = (self.unit, target)
+        if self._changed(self.textures.get(key), id):
+            gl.glBindTexture(target, id)
+            if self.unit is not None:
+                self.textures[key] = id
+
+    def set_viewport(self, x, y, width, height):
+        """Set the viewport.
+
+        """
+        viewport = (x, y, width, height)
+        if self._changed(self.viewport, viewport):
+            gl.glViewport(*viewport)
+            self.viewport = viewport
+
+    def deleted_texture(self, id):
+        """Record that a texture was deleted, which unbinds it.
+
+        """
+        id = _value(id)
+        for key, value in self.textures.items():
+            if value == id:
+                self.textures[key] = 0
+
+    def deleted_framebuffer(self, id):
+        """Record that a framebuffer object was deleted, which binds the
+        window if it was bound.
+
+        """
+        if self.framebuffer == _value(id):
+            self.framebuffer = 0
+
+# Bindings of contexts that are not known to pyglet
+_unknown_context = GLState()
+
+def current_state():
+    """Return the bindings of the current OpenGL context.
+
+    """
+    context = gl.current_context
+    if context is None:
+        _unknown_context.invalidate()
+        return _unknown_context
+
+    state = getattr(context, '_gpu_state', None)
+    if state is None:
+        state = context._gpu_state = GLState()
+
+    return state
+
+# Keys of the instances of ContextLocal objects in GLState.resources
+_resource_keys = itertools.count()
+
+class ContextLocal(object):
+    def __init__(self, create):
+        """Object of which each OpenGL context has its own instance.
+
+        Attributes are looked up on the instance of the current
+        context, which is created by calling `create` when first
+        needed.  Objects that hold on to an instance, e.g. to return a
+        name to the cache it was taken from, should keep the result of
+        `get`.
+
+        Parameters
+        ----------
+        create : callable
+            Called without arguments, in the context, to create its
+            instance.
+
+        Examples
+        --------
+        >>> buffers = ContextLocal(dict)
+        >>> buffers.get() is buffers.get()
+        True
+
+        """
+        object.__setattr__(self, '_create', create)
+        object.__setattr__(self, '_key', _resource_keys.next())
+
+    def get(self):
+        """Return the instance of the current context.
+
+        """
+        resources = current_state().resources
+        try:
+            return resources[self._key]
+        except KeyError:
+            value = resources[self._key] = self._create()
+            return value
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.get(), name, value)
+
+    def __contains__(self, key):
+        return key in self.get()
+
+    def __len__(self):
+        return len(self.get())
+
+    def __del__(self):
+        # Instances in other contexts go when those are destroyed
+        try:
+            current_state().resources.pop(self._key, None)
+        except:
+            pass
+
+def owned_by_current(delete):
+    """Wrap a function that deletes OpenGL objects of the current
+    context, so that it does nothing when called while another context
+    is current (where the names refer to other objects, if any).
+
+    """
+    context = gl.current_context
+
+    def delete_owned(*args):
+        if gl.current_context is context:
+            delete(*args)
+
+    return delete_owned
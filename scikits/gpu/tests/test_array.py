@@ -0,0 +1,187 @@
+from nose.tools import *
+from numpy.testing import assert_array_almost_equal, assert_array_equal
+
+from scikits.gpu.array import *
+import numpy as np
+
+def test_transfer():
+    x = np.random.random((5, 7)).astype(np.float32)
+    a = to_gpu(x)
+    assert_equal(a.shape, (5, 7))
+    assert_equal(a.dtype, np.float32)
+    assert_equal(a.size, 35)
+    assert_array_equal(a.get(), x)
+    assert_array_equal(np.asarray(a), x)
+
+    assert_array_equal(zeros(4).get(), np.zeros(4))
+    assert_raises(ValueError, empty, 3, dtype=np.int32)
+
+    # Textures cannot be empty
+    assert_raises(ValueError, to_gpu, np.array([], dtype=np.float32))
+    assert_raises(ValueError, zeros, (3, 0))
+
+def test_arithmetic():
+    x = np.random.random((4, 6)).astype(np.float32) + 1
+    y = np.random.random((4, 6)).astype(np.float32) + 1
+    a, b = to_gpu(x), to_gpu(y)
+
+    for result, expected in [(a + b, x + y),
+                             (a - 2, x - 2),
+                             (2 - a, 2 - x),
+                             (a * b, x * y),
+                             (3 * a, 3 * x),
+                             (a / b, x / y),
+                             (1 / a, 1 / x),
+                             (a ** 2, x ** 2),
+                             (-a, -x),
+                             (abs(-a), x),
+                             ((a + b) * a - 1, (x + y) * x - 1)]:
+        assert isinstance(result, GPUArray)
+        assert_array_almost_equal(result.get(), expected, decimal=5)
+
+    assert_raises(ValueError, lambda: a + to_gpu(np.ones(3)))
+
+    # Operations with ndarrays and numpy scalars stay on the device
+    for result, expected in [(x + b, x + y),
+                             (y * a, x * y),
+                             (np.float32(2) - a, 2 - x)]:
+        assert isinstance(result, GPUArray)
+        assert_array_almost_equal(result.get(), expected, decimal=5)
+
+def test_views():
+    x = np.arange(48, dtype=np.float32).reshape((6, 8))
+    a = to_gpu(x)
+
+    for key in [np.s_[1:4], np.s_[2], np.s_[:, 3], np.s_[::2, 1::3],
+                np.s_[::-1, 2:7], np.s_[-1, ::-2]]:
+        view = a[key]
+        assert view._storage is a._storage
+        assert_array_equal(view.get(), x[key])
+        assert_array_equal((view * 2).get(), x[key] * 2)
+        assert_array_equal((view + view[...]).get(), x[key] * 2)
+
+    assert_equal(a[2, 3], x[2, 3])
+
+    # Views of different arrays combined
+    b = to_gpu(np.ones((3, 3)))
+    assert_array_equal((a[:3, :3] + b).get(), x[:3, :3] + 1)
+
+    # Fancy indexing makes a copy
+    assert_array_equal(a[[0, 2]].get(), x[[0, 2]])
+
+def test_dirty_tracking():
+    a = to_gpu(np.arange(16, dtype=np.float32).reshape((4, 4)))
+    storage = a._storage
+    assert storage.host_valid and not storage.device_valid
+
+    # Operations are evaluated when their data is needed
+    b = a + 1
+    assert not storage.device_valid
+    assert b._storage.device_valid and not b._storage.host_valid
+    assert storage.device_valid
+
+    # Chained operations stay on the device
+    c = b * b
+    assert not b._storage.host_valid
+
+    assert_equal(c[0, 1], 4)
+    assert c._storage.host_valid
+
+    # Writes on the host are uploaded on next use
+    a[1:3, 1] = -1
+    assert not storage.device_valid
+    expected = np.arange(16, dtype=np.float32).reshape((4, 4))
+    expected[1:3, 1] = -1
+    assert_array_equal((a * 1).get(), expected)
+
+    a[0].set([5, 6, 7, 8])
+    assert_array_equal((a + 0)[0].get(), [5, 6, 7, 8])
+
+def test_write_operand():
+    # Deferred operations see the operands as they were when the
+    # operation was written
+    a = to_gpu(np.zeros(4))
+    c = a + 1
+    a[:] = 100
+    assert_array_equal(c.get(), 1)
+
+    b = to_gpu(np.ones(4))
+    d = b * 2
+    e = d + b
+    b.set([7] * 4)
+    assert_array_equal(d.get(), 2)
+    assert_array_equal(e.get(), 3)
+
+    # Also through views, and for results of evaluated operations
+    f = e * 1
+    e[1:3] = 0
+    a[::2].set([-1, -1])
+    g = a + f
+    assert_array_equal(f.get(), 3)
+    assert_array_equal(g.get(), [2, 103, 2, 103])
+
+def test_fusion():
+    import scikits.gpu.array as array
+
+    x = np.random.random((5, 6)).astype(np.float32) + 1
+    y = np.random.random((5, 6)).astype(np.float32)
+    a, b, c = to_gpu(x), to_gpu(y), to_gpu(x * y)
+
+    n = len(array._kernels)
+    d = a * b + c * a - 2.5
+    assert d._lazy
+    assert_equal(d.shape, (5, 6))
+    assert_equal(d.size, 30)
+    assert_array_almost_equal(d.get(), x * y + x * y * x - 2.5, decimal=5)
+    assert not d._lazy
+
+    # One kernel for the whole expression, reused for other operands
+    assert_equal(len(array._kernels), n + 1)
+    e = b * c + a * b - 1
+    assert_array_almost_equal(e.get(), y * x * y + x * y - 1, decimal=5)
+    assert_equal(len(array._kernels), n + 1)
+
+    # Intermediate results are not computed
+    f = a + 1
+    g = f * f
+    assert_array_almost_equal(g.get(), (x + 1) ** 2, decimal=5)
+    assert f._lazy
+
+def test_long_chain():
+    x = np.random.random(10).astype(np.float32)
+    a = to_gpu(x)
+    b, y = a, x
+    for i in range(100):
+        b = b + a * 0.5
+        y = y + x * np.float32(0.5)
+    assert_array_almost_equal(b.get(), y, decimal=3)
+
+def test_packed():
+    x = np.random.random((5, 7)).astype(np.float32) + 1
+    y = np.random.random((5, 7)).astype(np.float32) + 1
+    a, b = to_gpu(x, packed=True), to_gpu(y, packed=True)
+    assert a.packed
+    assert_equal(a._storage.width * a._storage.height, 9)
+    assert_array_equal(a.get(), x)
+
+    c = (a + b) * a - 1
+    assert c.packed
+    assert_array_almost_equal(c.get(), (x + y) * x - 1, decimal=5)
+    assert_array_almost_equal((1 / a).get(), 1 / x, decimal=5)
+    assert_array_almost_equal((a + y).get(), x + y, decimal=5)
+    assert (a + y).packed
+
+    # Views and mixed layouts
+    assert_array_equal(a[1:3, ::2].get(), x[1:3, ::2])
+    assert_array_almost_equal((a[::-1] * 2).get(), x[::-1] * 2, decimal=5)
+    mixed = a + to_gpu(y)
+    assert not mixed.packed
+    assert_array_almost_equal(mixed.get(), x + y, decimal=5)
+
+    # Reductions ignore the padding of the last texel
+    assert_almost_equal(a.sum(), x.sum(), places=3)
+    assert_almost_equal(a.min(), x.min(), places=5)
+    assert_almost_equal(a.max(), x.max(), places=5)
+    assert_equal(a.argmax(), x.argmax())
+    assert_almost_equal((-a).max(), -x.min(), places=5)
+    assert_equal(zeros(6, packed=True).max(), 0)
@@ -0,0 +1,107 @@
+from nose.tools import *
+from numpy.testing import assert_array_equal, assert_array_almost_equal
+
+from scikits.gpu.batch import *
+from scikits.gpu.batch import _grid
+from scikits.gpu.shader import VertexShader, FragmentShader
+from scikits.gpu.config import GLSLError
+
+import numpy as np
+
+def shaders():
+    v = VertexShader("""
+    uniform vec2 offset;
+    uniform float zoom;
+
+    varying vec2 pos;
+
+    void main(void) {
+        pos = gl_Vertex.xy * zoom + offset;
+        gl_Position = ftransform();
+    }""")
+
+    f = FragmentShader("""
+    uniform float level;
+    uniform float scale;
+
+    varying vec2 pos;
+
+    void main(void) {
+        gl_FragColor = vec4(pos, level * scale, 1.0);
+    }""")
+
+    return v, f
+
+def expected(offset, zoom, level, width, height):
+    y, x = np.mgrid[:height, :width] + 0.5
+    out = np.empty((height, width, 4), dtype=np.float32)
+    out[..., 0] = (x / width * 2 - 1) * zoom + offset[0]
+    out[..., 1] = (y / height * 2 - 1) * zoom + offset[1]
+    out[..., 2] = level
+    out[..., 3] = 1
+    return out
+
+def test_grid():
+    assert_equal(_grid(1, 5, 3, 64), (1, 1))
+    assert_equal(_grid(5, 5, 3, 64), (3, 2))
+    assert_equal(_grid(100, 4, 4, 16), (4, 4))
+    assert_raises(ValueError, _grid, 1, 32, 4, 16)
+
+def test_batch():
+    kernel = BatchKernel(shaders(), ['offset', 'zoom', 'level'])
+
+    count, width, height = 7, 6, 5
+    offset = np.random.random((count, 2))
+    zoom = np.arange(1, count + 1)
+    level = np.random.random(count)
+
+    out = kernel({'offset': offset, 'zoom': zoom, 'level': level},
+                 width, height, uniforms={'scale': 2.0})
+    assert_equal(out.shape, (count, height, width, 4))
+
+    for k in range(count):
+        assert_array_almost_equal(out[k],
+                                  expected(offset[k], zoom[k], 2 * level[k],
+                                           width, height), decimal=4)
+
+def test_structured():
+    kernel = BatchKernel(shaders(), ['zoom', 'offset'])
+
+    values = np.zeros(3, dtype=[('offset', np.float32, 2),
+                                ('zoom', np.float32)])
+    values['offset'] = [[0, 1], [1, 0], [2, 2]]
+    values['zoom'] = [1, 2, 3]
+
+    out = kernel(values, 4, 4, bands=2, uniforms={'level': 0.5, 'scale': 1.0})
+    assert_equal(out.shape, (3, 4, 4, 2))
+    for k in range(3):
+        assert_array_almost_equal(out[k],
+                                  expected(values['offset'][k],
+                                           values['zoom'][k], 0.5,
+                                           4, 4)[..., :2])
+
+def test_passes():
+    import scikits.gpu.batch as batch
+
+    kernel = BatchKernel(shaders(), ['level'])
+    level = np.arange(10, dtype=np.float32)
+
+    max_texture_size = batch.max_texture_size
+    batch.max_texture_size = lambda: 8
+    try:
+        out = kernel({'level': level}, 4, 3,
+                     uniforms={'zoom': 1.0, 'offset': [0.0, 0.0],
+                               'scale': 1.0})
+    finally:
+        batch.max_texture_size = max_texture_size
+
+    assert_array_equal(out[:, 0, 0, 2], level)
+
+def test_invalid():
+    assert_raises(GLSLError, BatchKernel, shaders(), ['pos'])
+
+    kernel = BatchKernel(shaders(), ['offset', 'zoom'])
+    assert_raises(ValueError, kernel, {'offset': [1, 2], 'zoom': [1, 2]},
+                  4, 4)
+    assert_raises(ValueError, kernel, {'offset': [[1, 2]], 'zoom': [1, 2]},
+                  4, 4)
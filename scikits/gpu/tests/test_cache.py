@@ -0,0 +1,44 @@
+from nose.tools import *
+
+from scikits.gpu.cache import HandleCache
+
+class TestHandleCache(object):
+    def setup(self):
+        self.deleted = []
+        self.cache = HandleCache(self.deleted.append, max_unused=2)
+
+    def test_shared(self):
+        a = self.cache.acquire('a', lambda: 1)
+        b = self.cache.acquire('a', lambda: 2)
+        assert_equal(a, b)
+        assert_equal(self.cache.refcount('a'), 2)
+
+    def test_failed_creation(self):
+        def fail():
+            raise RuntimeError()
+
+        assert_raises(RuntimeError, self.cache.acquire, 'a', fail)
+        assert 'a' not in self.cache
+
+    def test_lru_eviction(self):
+        for key in 'abc':
+            self.cache.acquire(key, lambda: key)
+
+        self.cache.release('a')
+        self.cache.release('b')
+        assert_equal(self.deleted, [])
+
+        # Reusing 'a' makes 'b' the least recently used
+        self.cache.acquire('a', lambda: None)
+        self.cache.release('a')
+        self.cache.release('c')
+        assert_equal(self.deleted, ['b'])
+        assert 'b' not in self.cache
+
+    def test_clear(self):
+        self.cache.acquire('a', lambda: 'a')
+        self.cache.acquire('b', lambda: 'b')
+        self.cache.release('b')
+        self.cache.clear()
+        assert_equal(self.deleted, ['b'])
+        assert_equal(len(self.cache), 1)
@@ -0,0 +1,64 @@
+from nose.tools import *
+from numpy.testing import assert_array_equal
+
+from scikits.gpu.canvas import *
+from scikits.gpu.framebuffer import Framebuffer, _current_framebuffer
+from scikits.gpu.shader import Program, VertexShader, FragmentShader
+from pyglet import gl
+
+import numpy as np
+
+def coords_program():
+    return Program([VertexShader("""
+                    void main(void) { gl_Position = gl_Vertex; }"""),
+                    FragmentShader("""
+                    uniform float z;
+                    void main(void) {
+                        gl_FragColor = vec4(gl_FragCoord.xy, z, 1.0);
+                    }""")])
+
+def test_run_pass():
+    fbo = Framebuffer()
+    fbo.add_texture([6, 5, 3], filter=gl.GL_NEAREST)
+    fbo.unbind()
+
+    gl.glViewport(0, 0, 1, 1)
+
+    p = coords_program()
+    p.use()
+    p['z'] = 2.0
+    run_pass(p, fbo)
+    assert p.bound
+    p.disable()
+
+    # State is restored
+    assert_equal(_current_framebuffer(), 0)
+    viewport = (gl.GLint * 4)()
+    gl.glGetIntegerv(gl.GL_VIEWPORT, viewport)
+    assert_equal(list(viewport), [0, 0, 1, 1])
+
+    y, x = np.mgrid[:5, :6] + 0.5
+    out = fbo.read()
+    assert_array_equal(out[..., 0], x)
+    assert_array_equal(out[..., 1], y)
+    assert_array_equal(out[..., 2], 2)
+
+def test_canvas():
+    c = canvas()
+    assert c is canvas()
+
+    fbo = Framebuffer()
+    fbo.add_texture([4, 4, 3], filter=gl.GL_NEAREST)
+    gl.glViewport(0, 0, 4, 4)
+
+    p = coords_program()
+    p.use()
+    c.bind()
+    for z in [1.0, 3.0]:
+        p['z'] = z
+        c.draw()
+    c.unbind()
+    p.disable()
+    fbo.unbind()
+
+    assert_array_equal(fbo.read()[..., 2], 3)
@@ -9,3 +9,26 @@ def test_requires_ext():
 
 def test_hardware_info():
     assert(isinstance(hardware_info, dict))
+    assert 'vendor' in hardware_info
+    assert_equal(sorted(hardware_info.keys()), ['renderer', 'vendor', 'version'])
+
+def test_reset():
+    vendor = hardware_info['vendor']
+    reset()
+    assert_equal(dict.__len__(hardware_info), 0)
+    assert_equal(hardware_info['vendor'], vendor)
+
+def test_max_color_attachments():
+    assert max_color_attachments() >= 1
+    assert max_texture_size() >= 64
+
+def test_deprecated_constant():
+    from scikits.gpu import config
+
+    initialize()
+    assert_equal(config.MAX_COLOR_ATTACHMENTS, max_color_attachments())
+
+    reset()
+    assert_equal(config.MAX_COLOR_ATTACHMENTS, None)
+    initialize()
+    assert_equal(config.MAX_COLOR_ATTACHMENTS, max_color_attachments())
@@ -0,0 +1,53 @@
+from nose.tools import *
+from numpy.testing import assert_array_equal
+
+from scikits.gpu.context import *
+from scikits.gpu.canvas import run_pass
+from scikits.gpu.framebuffer import Framebuffer
+from scikits.gpu.shader import Program, VertexShader, FragmentShader
+from pyglet import gl
+
+import numpy as np
+
+def render(value, width=7):
+    """Fill a `width` x 3 framebuffer with `value` in the current context
+    and return its contents.
+
+    """
+    p = Program([VertexShader("""
+                 void main(void) { gl_Position = gl_Vertex; }"""),
+                 FragmentShader("""
+                 uniform vec4 value;
+                 void main(void) { gl_FragColor = value; }""")])
+    p.use()
+    p['value'] = value
+
+    fbo = Framebuffer()
+    fbo.add_texture([width, 3, 4], filter=gl.GL_NEAREST,
+                    internalformat=gl.GL_RGBA32F_ARB)
+    run_pass(p, fbo)
+    p.disable()
+    return fbo.read()
+
+def test_unknown_backend():
+    assert_raises(ValueError, HeadlessContext, backend='blah')
+
+def test_render():
+    with HeadlessContext() as ctx:
+        assert gl.current_context is ctx._pyglet_context
+        out = render([0.25, 0.5, 0.75, 1.0], 7)
+        assert_array_equal(out, np.tile([0.25, 0.5, 0.75, 1.0], (3, 7, 1)))
+
+    assert_raises(ContextError, ctx.make_current)
+
+def test_two_contexts():
+    value = [1.0, 2.0, 3.0, 4.0]
+    assert_array_equal(render(value, 5), np.tile(value, (3, 5, 1)))
+
+    # Programs and canvases cached in the first context are not used in
+    # the second
+    with HeadlessContext():
+        assert_array_equal(render(value, 6), np.tile(value, (3, 6, 1)))
+
+    # The first context and its caches are still intact
+    assert_array_equal(render(value, 5), np.tile(value, (3, 5, 1)))
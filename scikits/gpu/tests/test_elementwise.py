@@ -0,0 +1,69 @@
+from nose.tools import *
+from numpy.testing import assert_array_almost_equal, assert_array_equal
+
+from scikits.gpu.elementwise import *
+import pyglet.gl as gl
+import numpy as np
+
+def test_expression():
+    k = ElementwiseKernel("out = a * sin(b) + c", "a, b, c")
+    assert_equal(k.outputs, ['out'])
+
+    a = np.random.random((5, 7))
+    b = np.random.random((5, 7))
+    c = np.random.random((5, 7))
+
+    out = k(a, b, c)
+    assert_equal(out.shape, (5, 7))
+    assert_equal(out.dtype, np.float32)
+    assert_array_almost_equal(out, a * np.sin(b) + c, decimal=5)
+
+    # Scalar input, keyword arguments, power-of-two shape
+    a = np.arange(16.)
+    assert_array_almost_equal(k(b=np.zeros(16), c=3.0, a=a), 3.0)
+    assert_equal(len(k._programs), 2)
+
+def test_multiple_outputs():
+    k = ElementwiseKernel("""
+    s = a + b;
+    if (a > b) d = a - b;
+    """, ['a', 'b'])
+    assert_equal(k.outputs, ['s', 'd'])
+
+    a = np.arange(12.).reshape((3, 4))
+    s, d = k(a, 5.0)
+    assert_array_equal(s, a + 5)
+    assert_array_equal(d, np.where(a > 5, a - 5, 0))
+
+def test_signature_cache():
+    k = ElementwiseKernel("y = 2.0 * x", "x")
+    x = np.ones((4, 4))
+    k(x)
+    k(x + 1)
+    assert_equal(len(k._programs), 1)
+
+    program = k.program([(gl.GL_TEXTURE_2D, True)], ndim=2)
+    assert_equal(k._programs.values(), [program])
+
+def test_invalid_arguments():
+    k = ElementwiseKernel("out = a + b", "a, b")
+    assert_raises(ValueError, k, 1.0, 2.0)
+    assert_raises(ValueError, k, np.ones(3), np.ones(4))
+    assert_raises(TypeError, k, np.ones(3))
+    assert_raises(TypeError, k, np.ones(3), c=1.0)
+    assert_raises(ValueError, ElementwiseKernel, "a + b", "a, b")
+
+def test_packed():
+    from scikits.gpu.array import to_gpu
+
+    k = ElementwiseKernel("""
+    s = a * b + c;
+    d = max(a - b, 0.0);
+    """, "a, b, c")
+    x = np.random.random((3, 5)).astype(np.float32)
+    y = np.random.random((3, 5)).astype(np.float32)
+
+    s, d = k(to_gpu(x, packed=True), y, 2.0)
+    assert s.packed and d.packed
+    assert_array_almost_equal(s.get(), x * y + 2, decimal=5)
+    assert_array_almost_equal(d.get(), np.maximum(x - y, 0), decimal=5)
@@ -1,11 +1,36 @@
 from nose.tools import *
+from numpy.testing import assert_array_equal
 
-from scikits.gpu.config import MAX_COLOR_ATTACHMENTS
+from scikits.gpu.config import max_color_attachments
 from scikits.gpu.framebuffer import *
+from scikits.gpu.shader import Program, VertexShader, FragmentShader
+from scikits.gpu.ntypes import texture_format
 from pyglet.gl import *
 
+import numpy as np
 import warnings
 
+def render_coords(fbo, width, height, fragment="""
+                  void main(void) {
+                      gl_FragColor = vec4(gl_FragCoord.xy, 1.5, -2.0);
+                  }"""):
+    """Render the pixel coordinates into all slots of `fbo`.
+
+    """
+    p = Program([VertexShader("""
+                 void main(void) { gl_Position = gl_Vertex; }"""),
+                 FragmentShader(fragment)])
+
+    fbo.bind()
+    glViewport(0, 0, width, height)
+    p.use()
+    glBegin(GL_QUADS)
+    for x, y in [(-1, -1), (1, -1), (1, 1), (-1, 1)]:
+        glVertex2f(x, y)
+    glEnd()
+    p.disable()
+    fbo.unbind()
+
 class TestFramebuffer(object):
     def create(self, shape, dtype):
         fbo = Framebuffer()
@@ -40,7 +65,122 @@ class TestFramebuffer(object):
 
     def test_max_attachments(self):
         fbo = Framebuffer()
-        for i in range(MAX_COLOR_ATTACHMENTS):
+        for i in range(max_color_attachments()):
             fbo.add_texture([16, 16])
 
         assert_raises(RuntimeError, fbo.add_texture, [16, 16])
+
+    def test_read(self):
+        fbo = Framebuffer()
+        fbo.add_texture([8, 4, 3])
+        render_coords(fbo, 8, 4)
+
+        out = fbo.read(0)
+        assert_equal(out.shape, (4, 8, 3))
+        assert_equal(out.dtype, np.float32)
+
+        y, x = np.mgrid[:4, :8] + 0.5
+        assert_array_equal(out[..., 0], x)
+        assert_array_equal(out[..., 1], y)
+        assert_array_equal(out[..., 2], 1.5)
+
+        same = np.empty_like(out)
+        assert fbo.read(0, out=same) is same
+        assert_array_equal(same, out)
+
+        assert_raises(ValueError, fbo.read, 0, np.empty((4, 8)))
+        assert_raises(ValueError, fbo.read, 1)
+
+    def test_formats(self):
+        fbo = Framebuffer()
+        fbo.add_texture([8, 4, 2], dtype=GL_HALF_FLOAT_ARB)
+        fbo.add_texture([8, 4, 4], dtype=GL_UNSIGNED_BYTE)
+        assert_equal(fbo._textures[0].internalformat,
+                     texture_format(np.float16, 2)[0])
+        assert_equal(fbo._textures[1].internalformat, GL_RGBA8)
+
+        render_coords(fbo, 8, 4, """
+        void main(void) {
+            gl_FragData[0] = vec4(gl_FragCoord.xy, 0.0, 1.0);
+            gl_FragData[1] = vec4(0.2, 0.4, 0.6, 1.0);
+        }""")
+
+        out = fbo.read(0)
+        assert_equal(out.dtype, np.float16)
+        y, x = np.mgrid[:4, :8] + 0.5
+        assert_array_equal(out[..., 0], x)
+        assert_array_equal(out[..., 1], y)
+
+        out = fbo.read(1)
+        assert_equal(out.dtype, np.uint8)
+        assert_array_equal(out[0, 0], [51, 102, 153, 255])
+
+    def test_read_async(self):
+        fbo = Framebuffer()
+        fbo.add_texture([8, 4, 3])
+        render_coords(fbo, 8, 4)
+
+        expected = fbo.read(0)
+
+        # More reads in flight than buffers in the ring
+        futures = [fbo.read_async(0, buffers=2) for i in range(3)]
+        for future in futures:
+            assert_array_equal(future.result(), expected)
+            assert future.done()
+
+    def test_multiple_render_targets(self):
+        fbo = Framebuffer()
+        slots = [fbo.add_texture([8, 4, 3]) for i in range(3)]
+        assert_equal(slots, [0, 1, 2])
+
+        render_coords(fbo, 8, 4, """
+        void main(void) {
+            gl_FragData[0] = vec4(gl_FragCoord.x, 0.0, 0.0, 1.0);
+            gl_FragData[1] = vec4(gl_FragCoord.y, 0.0, 0.0, 1.0);
+            gl_FragData[2] = vec4(2.5, 0.0, 0.0, 1.0);
+        }""")
+
+        y, x = np.mgrid[:4, :8] + 0.5
+        assert_array_equal(fbo.read(0)[..., 0], x)
+        assert_array_equal(fbo.read(1)[..., 0], y)
+        assert_array_equal(fbo.read(2)[..., 0], 2.5)
+
+class TestPingPongFramebuffer(object):
+    def test_run(self):
+        pp = PingPongFramebuffer([8, 4, 3])
+        pp.front.write(np.zeros((4, 8, 3), dtype=np.float32))
+
+        p = Program([VertexShader("""
+                     void main(void) { gl_Position = gl_Vertex; }"""),
+                     FragmentShader("""
+                     uniform sampler2D state;
+
+                     void main(void) {
+                         vec4 x = texture2D(state, gl_FragCoord.xy /
+                                                   vec2(8.0, 4.0));
+                         gl_FragColor = vec4(x.r + 1.0, x.g + x.r, 0.0, 1.0);
+                     }""")])
+
+        pp.run(p, iterations=5)
+        assert_equal(pp.front_slot, 1)
+        assert not p.bound
+
+        out = pp.read()
+        assert_array_equal(out[..., 0], 5)
+        assert_array_equal(out[..., 1], 0 + 1 + 2 + 3 + 4)
+
+        pp.run(p, iterations=2)
+        assert_equal(pp.front_slot, 1)
+        assert_array_equal(pp.read()[..., 0], 7)
+        assert_array_equal(pp.read(0)[..., 0], 6)
+
+        # Both textures are render targets again
+        render_coords(pp, 8, 4, """
+        void main(void) {
+            gl_FragData[0] = vec4(gl_FragCoord.x, 0.0, 0.0, 1.0);
+            gl_FragData[1] = vec4(gl_FragCoord.y, 0.0, 0.0, 1.0);
+        }""")
+
+        y, x = np.mgrid[:4, :8] + 0.5
+        assert_array_equal(pp.read(0)[..., 0], x)
+        assert_array_equal(pp.read(1)[..., 0], y)
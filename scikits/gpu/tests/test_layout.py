@@ -0,0 +1,46 @@
+from nose.tools import *
+from numpy.testing import assert_array_almost_equal, assert_array_equal
+
+from scikits.gpu.layout import *
+from scikits.gpu.array import to_gpu
+import numpy as np
+
+def test_texture_shape():
+    assert_equal(texture_shape((3, 4)), (4, 3))
+    assert_equal(texture_shape((1,)), (1, 1))
+    assert_equal(texture_shape((16,)), (4, 4))
+    assert_equal(texture_shape((32,)), (8, 4))
+    assert_equal(texture_shape((10,)), (4, 3))
+
+    for n in [2, 7, 100, 1000, 12345, 2**20 + 1]:
+        width, height = texture_shape((n,))
+        assert width * height >= n
+        assert width * (height - 1) < n
+        assert abs(width - height) <= 1
+
+    assert_raises(ValueError, texture_shape, ())
+    assert_raises(ValueError, texture_shape, (0,))
+    assert_raises(ValueError, texture_shape, (0, 3), packed=True)
+
+def test_padding():
+    assert_equal(padding((10,)), 2)
+    assert_equal(padding((16,)), 0)
+    assert_equal(padding((3, 5)), 0)
+
+    assert_equal(valid_regions(4, 10), [(0, 0, 4, 2), (0, 2, 2, 1)])
+    assert_equal(valid_regions(4, 12), [(0, 0, 4, 3)])
+    assert_equal(valid_regions(4, 3), [(0, 0, 3, 1)])
+
+def test_signals():
+    x = -np.random.random(1001).astype(np.float32)
+    a = to_gpu(x)
+    assert_equal(a._storage.height, 32)
+
+    assert_array_almost_equal((a * 2 + 1).get(), x * 2 + 1)
+    assert_array_almost_equal(a[3:900:7].get(), x[3:900:7])
+    assert_array_almost_equal((a[:-1] + a[1:]).get(), x[:-1] + x[1:])
+
+    # Padding is left out of reductions
+    assert_equal(a.max(), x.max())
+    assert_equal(a.argmax(), x.argmax())
+    assert_array_almost_equal(a.mean(), x.mean(), decimal=5)
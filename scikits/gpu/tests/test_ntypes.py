@@ -1,9 +1,51 @@
 from scikits.gpu.ntypes import *
 import pyglet.gl as gl
 from ctypes import c_byte
+import numpy as np
 
 from nose.tools import *
 
 def test_memory_type():
     assert_equal(memory_type(gl.GL_BYTE), gl.GLbyte)
     assert_equal(memory_type(c_byte), c_byte)
+
+def test_numpy_type():
+    assert_equal(numpy_type(gl.GL_FLOAT), np.float32)
+    assert_equal(numpy_type(gl.GL_UNSIGNED_BYTE), np.uint8)
+    assert_equal(opengl_type(np.int16), gl.GL_SHORT)
+    assert_equal(opengl_type('<f4'), gl.GL_FLOAT)
+    assert_raises(ValueError, opengl_type, np.complex64)
+
+def test_half_float():
+    assert_equal(opengl_type(np.float16), gl.GL_HALF_FLOAT_ARB)
+    assert_equal(numpy_type(gl.GL_HALF_FLOAT_ARB), np.float16)
+
+def test_texture_format():
+    assert_equal(texture_format(np.float32, 3),
+                 (gl.GL_RGB32F_ARB, gl.GL_RGB, gl.GL_FLOAT))
+    assert_equal(texture_format(np.uint16, 4),
+                 (gl.GL_RGBA16, gl.GL_RGBA, gl.GL_UNSIGNED_SHORT))
+
+    # Integer textures
+    internalformat, format, type = texture_format(np.int32, 2)
+    assert is_integer_format(internalformat)
+    assert_equal(format, pixel_format(2, integer=True))
+    assert_equal(type, gl.GL_INT)
+    assert not is_integer_format(texture_format(np.uint8)[0])
+
+    assert_equal(internal_format_types[gl.GL_RGBA16F_ARB],
+                 (np.dtype(np.float16), 4, False))
+
+    assert_raises(ValueError, texture_format, np.float64)
+    assert_raises(ValueError, texture_format, np.int32, normalized=True)
+    assert_raises(ValueError, texture_format, np.float32, 5)
+
+def test_smallest_dtype():
+    assert_equal(smallest_dtype(np.array([True, False])), np.uint8)
+    assert_equal(smallest_dtype(np.array([-129, 5])), np.int16)
+    assert_equal(smallest_dtype(np.array([0, 70000])), np.uint32)
+    assert_equal(smallest_dtype(np.array([np.nan, 1.5])), np.float16)
+    assert_equal(smallest_dtype(np.array([1e5])), np.float32)
+    assert_raises(ValueError, smallest_dtype, np.array([2 ** 40]))
+
+    assert_equal(smallest_format(np.arange(300), 4)[2], gl.GL_UNSIGNED_SHORT)
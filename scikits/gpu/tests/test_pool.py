@@ -0,0 +1,111 @@
+from nose.tools import *
+
+from scikits.gpu.pool import *
+from scikits.gpu.texture import Texture
+from scikits.gpu.framebuffer import Framebuffer
+from scikits.gpu.context import HeadlessContext
+from pyglet import gl
+from numpy.testing import assert_array_equal
+import numpy as np
+import ctypes
+
+class TestResourcePool(object):
+    def setup(self):
+        self.deleted = []
+        self.pool = ResourcePool(self.deleted.append, budget=100)
+
+    def test_reuse(self):
+        p = self.pool
+        assert_equal(p.acquire('a'), None)
+        p.allocated(40)
+
+        id = gl.GLuint(7)
+        p.release('a', id, 40)
+        assert_equal(p.acquire('b'), None)
+        assert p.acquire('a') is id
+        assert_equal(p.acquire('a'), None)
+
+        assert_equal(p.stats(), dict(hits=1, misses=3, evictions=0,
+                                     bytes_resident=40, bytes_free=0))
+
+    def test_eviction(self):
+        p = self.pool
+        for i in range(3):
+            p.allocated(30)
+        for i in range(3):
+            p.release(i, gl.GLuint(i + 1), 30)
+        assert_equal(self.deleted, [])
+
+        # The least recently released objects make room
+        p.allocated(50)
+        assert_equal([id.value for id in self.deleted], [1, 2])
+        assert_equal(p.evictions, 2)
+        assert_equal(p.bytes_resident, 80)
+        assert_equal(p.bytes_free, 30)
+
+        assert_equal(p.acquire(0), None)
+        assert_equal(p.acquire(2).value, 3)
+
+        p.release(2, gl.GLuint(3), 30)
+        p.clear()
+        assert_equal(p.bytes_resident, 50)
+        assert_equal(p.bytes_free, 0)
+
+def test_textures():
+    stats = texture_pool.stats()
+
+    tex = Texture(8, 4, internalformat=gl.GL_RGBA32F_ARB)
+    id = tex.id.value
+    del tex
+
+    assert_equal(texture_pool.bytes_free - stats['bytes_free'], 8 * 4 * 16)
+
+    tex = Texture(8, 4, internalformat=gl.GL_RGBA32F_ARB,
+                  filter=gl.GL_NEAREST)
+    assert_equal(tex.id.value, id)
+    assert_equal(texture_pool.hits, stats['hits'] + 1)
+
+    # The filter is that of the new texture
+    value = gl.GLint()
+    gl.glBindTexture(tex.target, tex.id)
+    gl.glGetTexParameteriv(tex.target, gl.GL_TEXTURE_MIN_FILTER,
+                           ctypes.byref(value))
+    assert_equal(value.value, gl.GL_NEAREST)
+
+    # Other formats are not reused
+    other = Texture(8, 4, internalformat=gl.GL_RGB32F_ARB)
+    assert other.id.value != id
+
+def test_framebuffers():
+    fbo = Framebuffer()
+    fbo.add_texture([4, 4])
+    id = fbo.id.value
+    fbo.unbind()
+    del fbo
+
+    fbo = Framebuffer()
+    assert_equal(fbo.id.value, id)
+    fbo.add_texture([8, 8])
+    fbo.unbind()
+
+def test_contexts():
+    # Leave a texture and a framebuffer in the pools of this context
+    Texture.from_array(np.ones((4, 4), np.float32))
+    Framebuffer().unbind()
+    pools = texture_pool.get(), framebuffer_pool.get()
+
+    with HeadlessContext():
+        assert texture_pool.get() not in pools
+        assert framebuffer_pool.get() not in pools
+
+        tex = Texture.from_array(np.ones((4, 4), np.float32),
+                                 filter=gl.GL_NEAREST)
+        assert_array_equal(tex.read()[..., 0], 1)
+
+        fbo = Framebuffer()
+        fbo.attach_texture(tex)
+        assert_array_equal(fbo.read()[..., 0], 1)
+        fbo.unbind()
+
+    assert texture_pool.get() is pools[0]
+    assert framebuffer_pool.get() is pools[1]
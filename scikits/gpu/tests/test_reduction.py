@@ -0,0 +1,87 @@
+from nose.tools import *
+from numpy.testing import assert_array_almost_equal, assert_almost_equal
+
+from scikits.gpu.reduction import *
+from scikits.gpu.texture import Texture
+from scikits.gpu.pool import texture_pool
+from scikits.gpu.array import to_gpu
+import numpy as np
+
+def test_reduce():
+    x = np.random.random((37, 21, 4)).astype(np.float32)
+    x[5, 17, 0] = 2
+    tex = Texture.from_array(x)
+
+    assert_array_almost_equal(reduce_sum(tex), x.sum(axis=0).sum(axis=0),
+                              decimal=2)
+    assert_array_almost_equal(reduce_mean(tex), x.mean(axis=0).mean(axis=0),
+                              decimal=5)
+    assert_array_almost_equal(reduce_min(tex), x.min(axis=0).min(axis=0))
+    assert_array_almost_equal(reduce_max(tex), x.max(axis=0).max(axis=0))
+    assert_equal(reduce_argmax(tex), (17, 5))
+
+    # Part of the texture
+    assert_array_almost_equal(reduce_max(tex, (10, 3)),
+                              x[:3, :10].max(axis=0).max(axis=0))
+    assert_raises(ValueError, reduce_sum, tex, (22, 1))
+
+def test_many_sizes():
+    textures = [Texture.from_array(np.ones((h, w, 4), dtype=np.float32))
+                for w in range(1, 20, 3) for h in range(1, 30, 7)]
+
+    # The textures of the passes return to the pool, where they are
+    # reused or evicted within its budget
+    pool = texture_pool.get()
+    in_use = pool.bytes_resident - pool.bytes_free
+    for tex in textures:
+        assert_array_almost_equal(reduce_sum(tex),
+                                  [tex.width * tex.height] * 4)
+        assert_equal(pool.bytes_resident - pool.bytes_free, in_use)
+
+    hits = pool.hits
+    reduce_sum(textures[-1])
+    assert pool.hits > hits
+
+def test_custom_kernel():
+    x = np.random.random((16, 16, 4)).astype(np.float32) - 0.5
+    tex = Texture.from_array(x)
+
+    for factor in [2, 4]:
+        k = ReductionKernel('a + b', map='v * v', factor=factor)
+        assert_array_almost_equal(k(tex), (x ** 2).sum(axis=0).sum(axis=0),
+                                  decimal=3)
+
+    assert_raises(ValueError, ReductionKernel, 'a + b', factor=3)
+
+def test_array_reductions():
+    x = np.random.random((13, 9)).astype(np.float32)
+    x[7, 2] = x[9, 4] = 5
+    a = to_gpu(x)
+
+    assert_almost_equal(a.sum(), x.sum(), decimal=3)
+    assert_almost_equal(a.mean(), x.mean(), decimal=5)
+    assert_equal(a.min(), x.min())
+    assert_equal(a.max(), 5)
+    assert_equal(a.argmax(), x.argmax())
+
+    # Views and deferred operations
+    assert_equal(a[8:, ::2].argmax(), x[8:, ::2].argmax())
+    assert_almost_equal((a * 2 - 1)[3].sum(), (x * 2 - 1)[3].sum(),
+                        decimal=4)
+    assert_equal(to_gpu(np.arange(5.)).sum(), 10)
+
+def test_packed():
+    # 13 values in 4 texels, the last of which is partially filled
+    x = np.random.random(13).astype(np.float32) - 0.5
+    x[10] = 3
+    values = np.zeros(16, dtype=np.float32)
+    values[:13] = x
+    tex = Texture.from_array(values.reshape((2, 2, 4)))
+
+    assert_almost_equal(reduce_sum(tex, count=13, packed=True), x.sum(),
+                        decimal=5)
+    assert_almost_equal(reduce_mean(tex, count=13, packed=True), x.mean(),
+                        decimal=5)
+    assert_almost_equal(reduce_min(tex, count=13, packed=True), x.min())
+    assert_almost_equal(reduce_max(tex, count=13, packed=True), 3)
+    assert_equal(reduce_argmax(tex, count=13, packed=True), 10)
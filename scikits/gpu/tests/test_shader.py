@@ -5,6 +5,8 @@ import nose
 from nose.tools import *
 
 from numpy.testing import *
+import numpy as np
+import os
 
 def test_shader_creation():
     s = VertexShader("void main(void) { gl_Position = vec4(1,1,1,1); }")
@@ -65,7 +67,7 @@ void main(void)
     // to the vertex shader
     x = float(int_in) * 0.5;
     x = float(int_in) + vec_in.r;
-    x += mat_in[0];
+    x += mat_in[0][0];
 
     gl_Position = vec4(float_in, float(x), 0, 1);
 }
@@ -97,6 +99,7 @@ def test_uniform_active():
 
 def test_query_uniform_without_binding():
     v = VertexShader("""
+    #version 120
     uniform float f= 1.5;
 
     void main(void) {
@@ -128,6 +131,28 @@ def test_set_uniform_invalid_shape():
     assert_raises(ValueError, p.__setitem__, 'x', [1.0, 2.0])
     p.disable()
 
+def test_partially_active_array():
+    s = VertexShader("""
+    uniform float w[4];
+
+    void main(void) {
+        gl_Position = vec4(w[0], w[1], 0.0, 1.0);
+    }""")
+
+    p = Program(s)
+    p.use()
+    assert_equal(p._uniforms['w'].length, 4)
+
+    # Values for the active part, or for the declared length
+    p['w'] = [1.0, 2.0]
+    p['w'] = [1.0, 2.0, 3.0, 4.0]
+    assert_array_equal(p['w'].flat, [1.0, 2.0, 3.0, 4.0])
+
+    # Never more values than declared
+    assert_raises(ValueError, p.__setitem__, 'w', [1.0] * 5)
+    assert_raises(ValueError, p.__setitem__, 'w', [1.0] * 6)
+    p.disable()
+
 def test_uniform_types():
         v = VertexShader("""
 uniform float float_in;
@@ -157,10 +182,10 @@ varying float x;
 void main(void) {
     // Dummy statement to make sure all uniforms become active
     x = float_in + float(int_in) + vec2_in.r + vec3_in.r + vec4_in.r +
-        mat2_in[0] + mat3_in[0] + mat4_in[0] + float_arr[0] +
+        mat2_in[0][0] + mat3_in[0][0] + mat4_in[0][0] + float_arr[0] +
         float(int_arr[0]) + vec2_arr[0].r + vec3_arr[0].r +
-        vec4_arr[0].r + mat2_arr[0][0] + mat3_arr[0][0] +
-        mat4_arr[0][0];
+        vec4_arr[0].r + mat2_arr[0][0][0] + mat3_arr[0][0][0] +
+        mat4_arr[0][0][0];
 
     gl_Position = vec4(x, 0, 0, 0);
 }
@@ -212,3 +237,192 @@ def test_inconsistent_definitions():
         """)
 
     assert_raises(GLSLError, Program, [v, f])
+
+def test_active_uniforms():
+    v = VertexShader("""
+    uniform float f;
+    uniform vec2 arr[3];
+
+    void main(void) {
+        gl_Position = vec4(f, arr[0].x, arr[1].y, arr[2].x);
+    }""")
+    p = Program(v)
+    assert_equal(p.active_uniforms, ['arr', 'f'])
+    assert_equal(len(p._uniforms['arr'].locations), 3)
+
+def test_uniform_reflection():
+    v = VertexShader("""
+#version 120
+#define N 3
+uniform ivec2 iv; uniform bvec3 bv;
+uniform mat2x3 m23;
+uniform float w[N];
+uniform sampler2D tex;
+
+void main(void) {
+    vec4 t = texture2D(tex, vec2(0.5, 0.5));
+    gl_Position = vec4(float(iv.x) + float(bv.y) + m23[0][2] + w[2] + t.r,
+                       0, 0, 1);
+}""")
+    p = Program(v)
+    p.use()
+
+    assert_equal(p._uniforms['w'].count, 3)
+    assert_equal(p._uniforms['m23'].shape, (3, 2))
+
+    p['iv'] = [1, 2]
+    assert_array_equal(p['iv'].flat, [1, 2])
+
+    p['bv'] = [True, False, True]
+    assert_array_equal(p['bv'].flat, [1, 0, 1])
+
+    p['m23'] = [float(x) for x in range(6)]
+    assert_array_equal(p['m23'].flat, range(6))
+
+    p['tex'] = 0
+    p.disable()
+
+def test_uniform_numpy():
+    v = VertexShader("""
+    uniform float w[16];
+    uniform mat4 m[2];
+    uniform ivec2 iv;
+
+    void main(void) {
+        gl_Position = vec4(w[15], m[1][0][0], float(iv.x), 1);
+    }""")
+    p = Program(v)
+    p.use()
+
+    w = np.arange(16, dtype=np.float32)
+    p['w'] = w
+    assert_array_equal(p['w'].flat, w)
+
+    m = np.arange(32, dtype=np.float32).reshape((2, 4, 4))
+    p['m'] = m
+    assert_array_equal(p['m'], m)
+
+    # Column-major storage of the same matrices
+    p['m'] = m.transpose((0, 2, 1)).copy().transpose((0, 2, 1))
+    assert_array_equal(p['m'], m)
+
+    # Data-types other than float32 / int32 are converted
+    p['w'] = w.astype(np.float64)
+    assert_array_equal(p['w'].flat, w)
+    p['iv'] = np.array([3, 4], dtype=np.int64)
+    assert_array_equal(p['iv'].flat, [3, 4])
+
+    assert_raises(ValueError, p.__setitem__, 'w', w[:8])
+
+    # The host copy does not share memory with the assigned array, so
+    # that changes in place are uploaded on the next assignment
+    p['w'] = w
+    assert not np.may_share_memory(p._values['w'], w)
+    w[15] = 100
+    p['w'] = w
+    assert_equal(p.get('w', refresh=True).flat[15], 100)
+    p.disable()
+
+def test_update():
+    v = VertexShader("""
+    uniform vec2 offset;
+    uniform float zoom;
+    uniform float width_ratio;
+
+    void main(void) {
+        gl_Position = vec4(offset * zoom * width_ratio, 0, 1);
+    }""")
+    p = Program(v)
+    assert_raises(GLSLError, p.update, {'zoom': 2.0})
+
+    p.use()
+    p.update({'offset': [1.0, 2.0], 'zoom': 2.0}, width_ratio=1.5)
+    assert_array_equal(p['offset'].flat, [1.0, 2.0])
+    assert_equal(p['zoom'], 2.0)
+    assert_equal(p['width_ratio'], 1.5)
+
+    # Unknown uniforms are detected before any value is set
+    assert_raises(GLSLError, p.update, [('zoom', 3.0), ('blah', 1.0)])
+    assert_equal(p['zoom'], 2.0)
+    p.disable()
+
+def test_uniform_shadow():
+    v = VertexShader("""
+    #version 120
+    uniform float f = 1.5;
+
+    void main(void) {
+        gl_Position = vec4(f, 1, 1, 1);
+    }""")
+    p = Program(v)
+    p.use()
+    assert_equal(p['f'], 1.5)
+
+    p['f'] = 2.0
+    assert_equal(p['f'], 2.0)
+
+    # Changes made behind the program's back are only seen on refresh
+    import pyglet.gl as gl
+    gl.glUniform1f(p._uniform('f').locations[0], 3.0)
+    assert_equal(p['f'], 2.0)
+    assert_equal(p.get('f', refresh=True), 3.0)
+    assert_equal(p['f'], 3.0)
+    p.disable()
+
+def test_shader_cache():
+    a = default_vertex_shader()
+    b = default_vertex_shader()
+    assert_equal(a.handle, b.handle)
+
+    p = Program(a)
+    q = Program(b)
+    assert_equal(p.handle, q.handle)
+
+    # Programs sharing a handle also share the uniform values
+    v = VertexShader("""
+    uniform float f;
+    void main(void) { gl_Position = vec4(f, 1, 1, 1); }""")
+    p, q = Program(v), Program(v)
+    p.use()
+    p['f'] = 2.0
+    assert_equal(q['f'], 2.0)
+    p.disable()
+
+def test_binary_cache():
+    import tempfile, shutil
+    from scikits.gpu import shader
+    from scikits.gpu.config import HardwareSupportError
+
+    path = tempfile.mkdtemp()
+    try:
+        try:
+            enable_binary_cache(path)
+        except HardwareSupportError:
+            raise nose.SkipTest("Program binaries not supported.")
+
+        source = """
+        uniform float f;
+        void main(void) { gl_Position = vec4(f, 2, 1, 1); }"""
+
+        # The program binary, and a record that the shader compiles
+        p = Program(VertexShader(source))
+        assert_equal(len(os.listdir(path)), 2)
+
+        # Drop the in-memory copy, so that the program is restored from disk
+        del p
+        shader.program_cache.clear()
+        shader.shader_cache.clear()
+
+        v = VertexShader(source)
+        p = Program(v)
+        assert v.handle is None
+        p.use()
+        p['f'] = 1.5
+        assert_equal(p.get('f', refresh=True), 1.5)
+        p.disable()
+
+        # Compile errors are reported by shaders that are not in the cache
+        assert_raises(GLSLError, VertexShader, "void main(void) { x; }")
+    finally:
+        disable_binary_cache()
+        shutil.rmtree(path)
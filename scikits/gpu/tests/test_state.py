@@ -0,0 +1,121 @@
+from nose.tools import *
+
+from scikits.gpu.state import *
+from scikits.gpu.framebuffer import Framebuffer
+from scikits.gpu.texture import Texture
+from scikits.gpu.shader import Program, VertexShader, FragmentShader
+from pyglet import gl
+
+import ctypes
+
+def program(value):
+    return Program([VertexShader("""
+                    void main(void) { gl_Position = gl_Vertex; }"""),
+                    FragmentShader("""
+                    void main(void) { gl_FragColor = vec4(%f); }""" % value)])
+
+def current_program():
+    current = gl.GLint()
+    gl.glGetIntegerv(gl.GL_CURRENT_PROGRAM, ctypes.byref(current))
+    return current.value
+
+def test_per_context():
+    assert current_state() is current_state()
+
+def test_program():
+    state = current_state()
+    p = program(1.0)
+
+    p.use()
+    calls = state.calls
+    p.use()
+    p.use()
+    assert_equal(state.calls, calls)
+    assert_equal(current_program(), p.handle)
+
+    p.disable()
+    assert_equal(current_program(), 0)
+    assert_equal(state.program, 0)
+
+def test_delete_other_program():
+    p, q = program(2.0), program(3.0)
+    p.use()
+    q.use()
+    del p
+    assert_equal(current_program(), q.handle)
+    q.disable()
+
+def test_delete_shared_program():
+    p, q = program(4.0), program(4.0)
+    assert_equal(p.handle, q.handle)
+    q.use()
+    del p
+    assert_equal(current_program(), q.handle)
+    del q
+    assert_equal(current_program(), 0)
+
+def test_framebuffer():
+    state = current_state()
+    fbo = Framebuffer()
+    fbo.add_texture([4, 4])
+
+    fbo.bind()
+    calls = state.calls
+    fbo.bind()
+    assert_equal(state.calls, calls)
+
+    current = gl.GLint()
+    gl.glGetIntegerv(gl.GL_FRAMEBUFFER_BINDING_EXT, ctypes.byref(current))
+    assert_equal(current.value, fbo.id.value)
+    assert_equal(state.get_framebuffer(), fbo.id.value)
+
+    fbo.unbind()
+    assert_equal(state.get_framebuffer(), 0)
+
+def test_textures():
+    state = current_state()
+    state.refresh()
+    tex = Texture(4, 4)
+
+    state.bind_texture(tex.target, tex.id, 1)
+    calls = state.calls
+    state.bind_texture(tex.target, tex.id, 1)
+    assert_equal(state.calls, calls)
+
+    current = gl.GLint()
+    binding = {gl.GL_TEXTURE_2D: gl.GL_TEXTURE_BINDING_2D,
+               gl.GL_TEXTURE_RECTANGLE_ARB:
+               gl.GL_TEXTURE_BINDING_RECTANGLE_ARB}[tex.target]
+    gl.glGetIntegerv(binding, ctypes.byref(current))
+    assert_equal(current.value, tex.id.value)
+
+    state.bind_texture(tex.target, 0)
+    state.active_texture(0)
+
+def test_viewport():
+    state = current_state()
+    gl.glViewport(0, 0, 3, 2)
+    state.refresh()
+    assert_equal(state.viewport, (0, 0, 3, 2))
+
+    calls = state.calls
+    state.set_viewport(0, 0, 3, 2)
+    assert_equal(state.calls, calls)
+
+    state.set_viewport(0, 0, 1, 1)
+    viewport = (gl.GLint * 4)()
+    gl.glGetIntegerv(gl.GL_VIEWPORT, viewport)
+    assert_equal(list(viewport), [0, 0, 1, 1])
+
+def test_invalidate():
+    state = current_state()
+    p = program(5.0)
+    p.use()
+
+    # Changed behind the back of the state
+    gl.glUseProgram(0)
+    state.invalidate()
+
+    p.use()
+    assert_equal(current_program(), p.handle)
+    p.disable()
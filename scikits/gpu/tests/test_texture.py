@@ -1,7 +1,10 @@
 from nose.tools import *
+from numpy.testing import assert_array_equal, assert_array_almost_equal
 
 from scikits.gpu.texture import *
+from scikits.gpu.ntypes import opengl_type
 import pyglet.gl as gl
+import numpy as np
 
 def test_creation():
     Texture(20, 20)
@@ -11,3 +14,98 @@ def test_creation():
 #    assert_equal(texture_target(16, 16), gl.GL_TEXTURE_2D)
 #    assert texture_target(17, 16) in \
 #           [gl.GL_TEXTURE_2D, gl.GL_TEXTURE_RECTANGLE_ARB]
+
+def download(tex, bands=4):
+    """Copy the contents of a texture to an array of shape
+    (height, width, bands).
+
+    """
+    format = {3: gl.GL_RGB, 4: gl.GL_RGBA}[bands]
+    out = np.empty((tex.height, tex.width, bands), dtype=np.float32)
+    gl.glBindTexture(tex.target, tex.id)
+    gl.glPixelStorei(gl.GL_PACK_ALIGNMENT, 1)
+    gl.glGetTexImage(tex.target, 0, format, gl.GL_FLOAT, out.ctypes.data)
+    return out
+
+def test_from_array():
+    x = np.random.random((5, 7, 4)).astype(np.float32)
+    tex = Texture.from_array(x)
+    assert_equal((tex.width, tex.height), (7, 5))
+    assert_array_equal(download(tex), x)
+
+    x = np.arange(35, dtype=np.float32).reshape((5, 7))
+    tex = Texture.from_array(x)
+    assert_array_equal(download(tex, 3)[..., 0], x)
+
+    assert_raises(ValueError, Texture.from_array, np.zeros((2, 2, 5)))
+
+def test_write():
+    tex = Texture.from_array(np.zeros((8, 8, 4), dtype=np.float32))
+    x = np.random.random((3, 4, 4)).astype(np.float32)
+
+    # Non-contiguous input
+    tex.write(x[:, ::-1], offset=(2, 1))
+
+    expected = np.zeros((8, 8, 4), dtype=np.float32)
+    expected[1:4, 2:6] = x[:, ::-1]
+    assert_array_equal(download(tex), expected)
+
+    assert_raises(ValueError, tex.write, x, offset=(5, 0))
+    assert_raises(ValueError, tex.write, x, offset=(-1, 0))
+
+def test_write_converted():
+    # Doubles are written in single precision
+    tex = Texture(4, 4, internalformat=gl.GL_RGBA32F_ARB)
+    tex.write(np.ones((4, 4, 4)))
+    assert_array_equal(download(tex), 1)
+
+    x = np.random.random((4, 4, 4))
+    tex.write(x, staged=True)
+    assert_array_equal(download(tex), x.astype(np.float32))
+
+    # Booleans as bytes
+    tex = Texture.from_array(np.zeros((2, 3), dtype=np.uint8))
+    tex.write(np.array([[True, False, True], [False, True, False]]))
+    assert_array_equal(tex.read()[..., 0], [[1, 0, 1], [0, 1, 0]])
+
+def test_write_staged():
+    tex = Texture(16, 16, internalformat=gl.GL_RGBA32F_ARB)
+    expected = np.empty((16, 16, 4), dtype=np.float32)
+
+    # More uploads than pixel buffers
+    for i in range(4):
+        x = np.random.random((4, 16, 4)).astype(np.float32)
+        tex.write(x, offset=(0, 4 * i), staged=True)
+        expected[4 * i:4 * (i + 1)] = x
+
+    assert_array_equal(download(tex), expected)
+
+def test_read():
+    x = np.random.random((3, 5, 4)).astype(np.float32)
+    tex = Texture.from_array(x)
+    assert_array_equal(tex.read(), x)
+
+    out = np.empty(60, dtype=np.float32)
+    assert tex.read(out) is out
+    assert_array_equal(out, x.ravel())
+
+    assert_raises(ValueError, tex.read, np.empty(59, dtype=np.float32))
+
+def test_formats():
+    # Half floats, normalized and integer values
+    for x in [np.random.random((3, 5, 4)).astype(np.float16),
+              np.arange(30, dtype=np.uint8).reshape((3, 5, 2)) * 8,
+              np.arange(-20, 10, dtype=np.int32).reshape((3, 10))]:
+        tex = Texture.from_array(x)
+        assert_equal(tex.dtype, opengl_type(x.dtype))
+        assert_array_equal(tex.read().reshape(x.shape), x)
+
+    # Normalized bytes are sampled as floats
+    x = np.array([[0, 51, 255]], dtype=np.uint8)
+    tex = Texture.from_array(x, normalized=True)
+    assert not tex.integer
+    assert_array_almost_equal(download(tex, 3)[..., 0], x / 255.)
+
+    tex = Texture.from_array(x, normalized=False)
+    assert tex.integer
+    assert_array_equal(tex.read()[..., 0], x)
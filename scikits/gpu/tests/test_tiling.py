@@ -0,0 +1,103 @@
+from nose.tools import *
+from numpy.testing import assert_array_almost_equal, assert_array_equal, \
+                          assert_almost_equal
+
+from scikits.gpu.tiling import *
+import scikits.gpu.tiling as tiling
+from scikits.gpu.array import to_gpu
+from scikits.gpu.reduction import reduce_sum, reduce_argmax
+import numpy as np
+
+def test_tile_regions():
+    assert_equal(tile_regions(10, 3, tile_size=4),
+                 [(0, 0, 4, 3), (4, 0, 4, 3), (8, 0, 2, 3)])
+    assert_equal(tile_regions(5, 5, halo=(1, 1), tile_size=4),
+                 [(0, 0, 2, 2), (2, 0, 2, 2), (4, 0, 1, 2),
+                  (0, 2, 2, 2), (2, 2, 2, 2), (4, 2, 1, 2),
+                  (0, 4, 2, 1), (2, 4, 2, 1), (4, 4, 1, 1)])
+    assert_raises(ValueError, tile_regions, 5, 5, (2, 2), 4)
+
+def test_transfer():
+    x = np.random.random((23, 37, 3)).astype(np.float32)
+    for halo in [0, 2]:
+        tex = TiledTexture.from_array(x, halo=halo, tile_size=16)
+        assert len(tex.regions) > 1
+        assert_array_equal(tex.read(), x)
+
+    # 1D signals have no halo along y
+    x = np.random.random(100).astype(np.float32)
+    tex = TiledTexture.from_array(x, halo=1, tile_size=16)
+    assert_equal(tex.halo, (1, 0))
+    assert_equal(tex.grid, (8, 1))
+    assert_array_equal(tex.read().ravel(), x)
+
+    assert_raises(ValueError, tex.write, np.ones(99))
+
+def laplace(x):
+    y = np.zeros((x.shape[0] + 2, x.shape[1] + 2), dtype=x.dtype)
+    y[1:-1, 1:-1] = x
+    return y[:-2, 1:-1] + y[2:, 1:-1] + y[1:-1, :-2] + y[1:-1, 2:] - 4 * x
+
+def test_stencil():
+    k = StencilKernel("""
+    out = fetch(-1, 0) + fetch(1, 0) + fetch(0, -1) + fetch(0, 1)
+          - 4.0 * fetch(0, 0)
+    """)
+
+    x = np.random.random((29, 18)).astype(np.float32)
+    tex = TiledTexture.from_array(x, halo=1, tile_size=8)
+    out = k(tex)
+    assert_array_almost_equal(out.read()[..., 0], laplace(x), decimal=5)
+
+    # Halos are updated, so that kernels can be chained
+    out = k(out)
+    assert_array_almost_equal(out.read()[..., 0], laplace(laplace(x)),
+                              decimal=4)
+
+    # Untiled input
+    assert_array_almost_equal(k(x), laplace(x), decimal=5)
+
+    assert_raises(ValueError, k, TiledTexture.from_array(x, tile_size=8))
+
+def test_stencil_1d():
+    # Outside the image, also along y, texels are zero
+    x = np.arange(30, dtype=np.float32)
+    k = StencilKernel("out = fetch(0, 1)")
+    assert_array_equal(k(x), 0)
+
+    k = StencilKernel("out = 0.25 * (fetch(-1, 0) + fetch(1, 0) + "
+                      "fetch(0, -1) + fetch(0, 1))")
+    expected = 0.25 * (np.r_[0, x[:-1]] + np.r_[x[1:], 0])
+    assert_array_almost_equal(k(x), expected)
+    assert_equal(k(x)[0], 0.25)
+    assert_equal(k(x)[-1], 7)
+
+    # Across tiles
+    out = k(TiledTexture.from_array(x, halo=1, tile_size=8))
+    assert_array_almost_equal(out.read().ravel(), expected)
+
+def test_reduce():
+    x = np.random.random((29, 18)).astype(np.float32)
+    x[20, 11] = 3
+    tex = TiledTexture.from_array(x, halo=2, tile_size=8)
+    assert_almost_equal(reduce_sum(tex)[0], x.sum(), decimal=3)
+    assert_equal(reduce_argmax(tex), (11, 20))
+
+def test_tiled_arrays():
+    tiling.max_tile_size = 16
+    try:
+        x = np.random.random((40, 37)).astype(np.float32)
+        y = np.random.random((40, 37)).astype(np.float32)
+        a, b = to_gpu(x), to_gpu(y)
+        assert a._storage.tiled
+
+        assert_array_almost_equal((a * b + 1).get(), x * y + 1, decimal=5)
+        assert_array_almost_equal((a[::2] - b[1::2]).get(),
+                                  x[::2] - y[1::2], decimal=5)
+        assert_almost_equal(a.sum(), x.sum(), decimal=2)
+        assert_equal(a.argmax(), x.argmax())
+
+        x = np.random.random(300).astype(np.float32)
+        assert_array_almost_equal((to_gpu(x) * 2).get(), x * 2)
+    finally:
+        tiling.max_tile_size = None
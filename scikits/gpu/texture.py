@@ -32,16 +32,23 @@ ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 POSSIBILITY OF SUCH DAMAGE.
 """
 
-__all__ = ['Texture', 'texture_target']
+__all__ = ['Texture', 'texture_target', 'default_format']
 
-from pyglet import gl
 from pyglet.gl import *
+# Imported after the above, which would otherwise replace gl by the
+# pyglet.gl.gl module (core OpenGL only)
+from pyglet import gl
 
-# Need this so that current_context is exposed
-from pyglet.window import *
-
-from scikits.gpu.ntypes import memory_type
+from scikits.gpu.config import HardwareSupportError, have_extension, \
+                              initialize
+from scikits.gpu.ntypes import opengl_type, numpy_type, texture_format, \
+                              pixel_format, is_integer_format
+from scikits.gpu.buffer import PixelBufferRing
+from scikits.gpu.pool import texture_pool, texture_bytes
+from scikits.gpu.state import current_state, ContextLocal
+from scikits.gpu import glext
 
+import numpy as np
 import math
 
 def texture_target(height, width):
@@ -60,12 +67,78 @@ def texture_target(height, width):
 
     if power_of_two(height) and power_of_two(width):
         return gl.GL_TEXTURE_2D
-    elif gl.gl_info.have_extension('GL_ARB_texture_rectangle'):
+    elif have_extension('ARB_texture_rectangle'):
         return gl.GL_TEXTURE_RECTANGLE_ARB
     else:
         raise HardwareSupportError("Hardware does not support non-power-of-two"
                                    " textures.")
 
+# Pixel formats of arrays with 1, 2, 3 or 4 bands
+_band_formats = {1: GL_RED,
+                 2: glext.GL_RG,
+                 3: GL_RGB,
+                 4: GL_RGBA}
+
+# Number of bands of each pixel format
+_format_bands = {GL_RED: 1,
+                 GL_GREEN: 1,
+                 GL_BLUE: 1,
+                 GL_ALPHA: 1,
+                 GL_LUMINANCE: 1,
+                 GL_DEPTH_COMPONENT: 1,
+                 GL_LUMINANCE_ALPHA: 2,
+                 glext.GL_RG: 2,
+                 GL_RGB: 3,
+                 GL_RGBA: 4,
+                 glext.GL_RED_INTEGER: 1,
+                 glext.GL_RG_INTEGER: 2,
+                 glext.GL_RGB_INTEGER: 3,
+                 glext.GL_RGBA_INTEGER: 4}
+
+# Pixel buffers through which staged uploads pass, shared by all textures
+# of a context
+_upload_buffers = ContextLocal(
+    lambda: PixelBufferRing(glext.GL_PIXEL_UNPACK_BUFFER))
+
+def _stored_array(arr):
+    """Return `arr` as a C-contiguous array of a type that textures can
+    store: doubles become single precision floats, and booleans bytes.
+
+    """
+    arr = np.asarray(arr)
+    if arr.dtype == np.float64:
+        arr = arr.astype(np.float32)
+    elif arr.dtype == np.bool_:
+        arr = arr.astype(np.uint8)
+    return np.ascontiguousarray(arr)
+
+def _array_size(arr):
+    """Return the width, height and number of bands of an image array,
+    which has shape (width,), (height, width) or (height, width, bands).
+
+    """
+    shape = arr.shape
+    if arr.ndim == 1:
+        return shape[0], 1, 1
+    elif arr.ndim == 2:
+        return shape[1], shape[0], 1
+    elif arr.ndim == 3 and 1 <= shape[2] <= 4:
+        return shape[1], shape[0], shape[2]
+    else:
+        raise ValueError("Array of shape %s cannot be stored in a "
+                         "texture." % (shape,))
+
+def default_format(dtype, bands, normalized=None):
+    """Return the internal format of a texture that stores `bands`
+    colour bands of the given numpy data-type (see
+    `ntypes.texture_format`).  Without support for one- and two-band
+    formats (ARB_texture_rg), three bands are stored.
+
+    """
+    if bands < 3 and not have_extension('ARB_texture_rg'):
+        bands = 3
+    return texture_format(dtype, bands, normalized)[0]
+
 class Texture(object):
     '''An image loaded into video memory that can be efficiently drawn
     to the framebuffer.
@@ -74,7 +147,8 @@ class Texture(object):
     tex_coords = (0., 0., 0., 1., 0., 0., 1., 1., 0., 0., 1., 0.)
 
     def __init__(self, width, height,
-                 format=GL_RGBA, dtype=GL_FLOAT, internalformat=GL_RGBA):
+                 format=GL_RGBA, dtype=GL_FLOAT, internalformat=GL_RGBA,
+                 filter=GL_LINEAR):
         '''Create an empty Texture.
 
         Parameters
@@ -96,35 +170,58 @@ class Texture(object):
             texture; for example, ``GL_R3_G3_B2``.  This is a
             recommendation to OpenGL, but will not necessarily be
             followed.
+        filter : int
+            Sampling filter, ``GL_LINEAR`` or ``GL_NEAREST``.  Use
+            ``GL_NEAREST`` to read back exact texel values.  Integer
+            textures (e.g. ``GL_RGBA8UI``) are always sampled with
+            ``GL_NEAREST``.
+
+        Notes
+        -----
+        Textures are taken from, and returned to, `pool.texture_pool`
+        of the current context, so that the memory of a deleted texture
+        is reused by the next texture of the same size and format.
+
+        Integer textures must be given a pixel `format` such as
+        ``GL_RED_INTEGER``, and are read in shaders by integer
+        samplers (``isampler2D``, ``usampler2D``).
 
         '''
+        initialize()
+
         target = texture_target(height, width)
 
-        id = GLuint()
-        glGenTextures(1, byref(id))
-        glBindTexture(target, id.value)
-        glTexParameteri(target, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
-        glTexParameteri(target, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-
-        colour_bands = {GL_COLOR_INDEX: 1,
-                        GL_DEPTH_COMPONENT: 1,
-                        GL_RGB: 3,
-                        GL_RGBA: 4,
-                        GL_RED: 1,
-                        GL_GREEN: 1,
-                        GL_BLUE: 1,
-                        GL_ALPHA: 1,
-                        GL_LUMINANCE: 1,
-                        GL_LUMINANCE_ALPHA: 2}
-
-        blank = (memory_type(dtype) * \
-                 (width * height * colour_bands[format]))()
-        glTexImage2D(target, 0,
-                     internalformat,
-                     width, height,
-                     0,
-                     format, dtype,
-                     blank)
+        integer = is_integer_format(internalformat)
+        if integer:
+            filter = GL_NEAREST
+
+        key = (width, height, format, internalformat)
+        nbytes = texture_bytes(width, height, internalformat)
+
+        state = current_state()
+        state.forget_textures()
+
+        pool = texture_pool.get()
+        id = pool.acquire(key)
+        if id is None:
+            pool.allocated(nbytes)
+
+            id = GLuint()
+            glGenTextures(1, byref(id))
+            state.bind_texture(target, id)
+
+            # Allocate without initialising; use `write` to upload data
+            glTexImage2D(target, 0,
+                         internalformat,
+                         width, height,
+                         0,
+                         format, dtype,
+                         None)
+        else:
+            state.bind_texture(target, id)
+
+        glTexParameteri(target, GL_TEXTURE_MIN_FILTER, filter)
+        glTexParameteri(target, GL_TEXTURE_MAG_FILTER, filter)
 
         if texture_target != gl.GL_TEXTURE_2D:
             self.tex_coords = (0., 0.,  0.,
@@ -137,9 +234,138 @@ class Texture(object):
         self.target = target
         self.id = id
         self.height, self.width = height, width
+        self.format, self.dtype = format, dtype
+        self.internalformat = internalformat
+        self.integer = integer
+
+        self._key, self._nbytes, self._pool = key, nbytes, pool
+
+    @classmethod
+    def from_array(cls, arr, internalformat=None, filter=GL_LINEAR,
+                   normalized=None):
+        """Create a Texture holding the given data.
+
+        Parameters
+        ----------
+        arr : ndarray
+            Image of shape (width,), (height, width) or
+            (height, width, bands), with up to 4 bands.  Doubles are
+            stored in single precision, and booleans as bytes.
+        internalformat : int, optional
+            Internal format of the texture.  By default, the format
+            that matches the data-type and number of bands (see
+            `default_format`), e.g. ``GL_RGBA16F_ARB`` for float16
+            data.  Use `ntypes.smallest_dtype` to find a smaller
+            data-type that holds the data exactly.
+        filter : int
+            Sampling filter (see `Texture`).
+        normalized : bool, optional
+            Whether integers are stored normalized, rather than in an
+            integer texture (see `ntypes.texture_format`).
+
+        """
+        arr = _stored_array(arr)
+        width, height, bands = _array_size(arr)
+
+        if internalformat is None:
+            internalformat = default_format(arr.dtype, bands, normalized)
+        format = pixel_format(bands, is_integer_format(internalformat))
+
+        tex = cls(width, height, format=format, dtype=opengl_type(arr.dtype),
+                  internalformat=internalformat, filter=filter)
+        tex.write(arr)
+
+        return tex
+
+    def write(self, arr, offset=(0, 0), staged=False):
+        """Upload data to (part of) the texture.
+
+        Parameters
+        ----------
+        arr : ndarray
+            Image of shape (width,), (height, width) or
+            (height, width, bands).  C-contiguous arrays are uploaded
+            without making a copy.  Doubles are converted to single
+            precision, and booleans to bytes.
+        offset : tuple of ints
+            Position (x, y) of the first element of `arr` in the
+            texture.
+        staged : bool
+            Copy the data into a pixel buffer object, from which OpenGL
+            transfers it to the texture in the background.  The call
+            then returns as soon as the data has been copied, while
+            computations continue on the graphics card.
+
+        """
+        arr = _stored_array(arr)
+        width, height, bands = _array_size(arr)
+        x, y = offset
+
+        if x < 0 or y < 0 or x + width > self.width or \
+               y + height > self.height:
+            raise ValueError("Array of shape %s does not fit into texture "
+                             "of size %dx%d at offset %s." % \
+                             (arr.shape, self.width, self.height, offset))
+
+        format, dtype = pixel_format(bands, self.integer), \
+                        opengl_type(arr.dtype)
+
+        state = current_state()
+        state.forget_textures()
+        state.bind_texture(self.target, self.id)
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+
+        if staged:
+            buffers = _upload_buffers.get()
+            pbo = buffers.acquire(arr.nbytes)
+            pbo.write(arr)
+            pbo.bind()
+            glTexSubImage2D(self.target, 0, x, y, width, height,
+                            format, dtype, None)
+            pbo.unbind()
+            buffers.release(pbo)
+        else:
+            glTexSubImage2D(self.target, 0, x, y, width, height,
+                            format, dtype, arr.ctypes.data)
+
+    def read(self, out=None):
+        """Download the texture to host memory.
+
+        Parameters
+        ----------
+        out : ndarray, optional
+            C-contiguous array in which to place the result.  It must
+            have as many elements as the texture has values, and the
+            data-type of the texture.
+
+        Returns
+        -------
+        out : ndarray
+            The texture data, by default of shape (height, width, bands).
+
+        """
+        bands = _format_bands.get(self.format, 4)
+        dtype = numpy_type(self.dtype)
+
+        if out is None:
+            out = np.empty((self.height, self.width, bands), dtype=dtype)
+        elif out.size != self.height * self.width * bands or \
+                 out.dtype != dtype or not out.flags.c_contiguous:
+            raise ValueError("Output must be a C-contiguous array of %d "
+                             "elements of type %s." % \
+                             (self.height * self.width * bands, dtype))
+
+        state = current_state()
+        state.forget_textures()
+        state.bind_texture(self.target, self.id)
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        glGetTexImage(self.target, 0, pixel_format(bands, self.integer),
+                      self.dtype, out.ctypes.data)
+
+        return out
 
     def __del__(self):
         try:
-            self._context.delete_texture(self.id)
+            self._pool.release(self._key, self.id, self._nbytes)
         except:
             pass
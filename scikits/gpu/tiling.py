@@ -0,0 +1,452 @@
+"""Storage of arrays that are too large for a single texture.
+
+"""
+
+__all__ = ['tile_regions', 'TiledTexture', 'StencilKernel']
+
+from pyglet import gl
+import numpy as np
+import re
+
+from scikits.gpu.config import max_texture_size
+from scikits.gpu.texture import Texture, _array_size, _band_formats
+from scikits.gpu.framebuffer import Framebuffer, _draw_canvas
+from scikits.gpu.shader import Program, VertexShader, FragmentShader
+from scikits.gpu.state import current_state, ContextLocal
+
+# Largest width and height of a tile, including its halo.  By default,
+# the largest texture size of the hardware.
+max_tile_size = None
+
+def _tile_size():
+    return max_tile_size or max_texture_size()
+
+def tile_regions(width, height, halo=(0, 0), tile_size=None):
+    """Split a `width` x `height` array into tiles.
+
+    Parameters
+    ----------
+    width, height : int
+        Size of the array.
+    halo : tuple of ints
+        Number of texels (x, y) stored around each tile, in addition
+        to the tile itself.
+    tile_size : int, optional
+        Largest width and height of a tile, including its halo.  By
+        default, `max_tile_size`.
+
+    Returns
+    -------
+    regions : list of tuples
+        Position and size (x, y, width, height) of each tile in the
+        array, row by row.
+
+    >>> tile_regions(5, 3, tile_size=4)
+    [(0, 0, 4, 3), (4, 0, 1, 3)]
+
+    """
+    if tile_size is None:
+        tile_size = _tile_size()
+
+    step_x, step_y = tile_size - 2 * halo[0], tile_size - 2 * halo[1]
+    if step_x < 1 or step_y < 1:
+        raise ValueError("Halo of %s texels does not fit into tiles of "
+                         "size %d." % (halo, tile_size))
+
+    return [(x, y, min(step_x, width - x), min(step_y, height - y))
+            for y in range(0, height, step_y)
+            for x in range(0, width, step_x)]
+
+def _intersect(a, b):
+    """Return the intersection of two regions (x, y, width, height), or
+    None if they do not overlap.
+
+    """
+    x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+    x1 = min(a[0] + a[2], b[0] + b[2])
+    y1 = min(a[1] + a[3], b[1] + b[3])
+    if x0 < x1 and y0 < y1:
+        return x0, y0, x1 - x0, y1 - y0
+
+class TiledTexture(object):
+    def __init__(self, width, height, bands=1, halo=0, tile_size=None):
+        """Image stored as a grid of textures.
+
+        Images of any size can be stored, whereas the size of a single
+        texture is limited by the hardware (see `config.max_texture_size`).
+        Each tile holds a copy of the texels around it (the halo), so
+        that stencil kernels (see `StencilKernel`) can be evaluated one
+        tile at a time.
+
+        Parameters
+        ----------
+        width, height : int
+            Size of the image.
+        bands : int
+            Number of colour bands, from 1 to 4.
+        halo : int
+            Width of the halo, in texels.  There is no halo along an
+            axis of length 1, e.g. for 1D arrays.  Outside the image,
+            the halo holds zeros.
+        tile_size : int, optional
+            Largest width and height of a tile, including its halo.  By
+            default, the largest texture size.
+
+        """
+        if not 1 <= bands <= 4:
+            raise ValueError("Texture cannot have %d colour bands." % bands)
+
+        if tile_size is None:
+            tile_size = _tile_size()
+
+        self.width, self.height, self.bands = width, height, bands
+        self.halo = (halo if width > 1 else 0, halo if height > 1 else 0)
+        self.tile_size = tile_size
+        self.regions = tile_regions(width, height, self.halo, tile_size)
+
+        # Number of tiles along x and y
+        self.grid = (len(set([r[0] for r in self.regions])),
+                     len(set([r[1] for r in self.regions])))
+
+        hx, hy = self.halo
+        internalformat = {4: gl.GL_RGBA32F_ARB}.get(bands, gl.GL_RGB32F_ARB)
+        self.textures = [Texture(w + 2 * hx, h + 2 * hy,
+                                 format=_band_formats[bands],
+                                 internalformat=internalformat,
+                                 filter=gl.GL_NEAREST)
+                         for (x, y, w, h) in self.regions]
+
+        # Framebuffers of the tiles, created when first rendered to
+        self._framebuffers = [None] * len(self.regions)
+
+        if hx or hy:
+            self._clear()
+
+    @classmethod
+    def from_array(cls, arr, halo=0, tile_size=None):
+        """Create a TiledTexture holding the given data.
+
+        Parameters
+        ----------
+        arr : ndarray
+            Image of shape (width,), (height, width) or
+            (height, width, bands).
+        halo, tile_size : int
+            See `TiledTexture`.
+
+        """
+        arr = np.asarray(arr, dtype=np.float32)
+        width, height, bands = _array_size(arr)
+
+        tex = cls(width, height, bands, halo=halo, tile_size=tile_size)
+        tex.write(arr)
+
+        return tex
+
+    def _framebuffer(self, n):
+        """Return a framebuffer that renders to tile `n`.
+
+        """
+        if self._framebuffers[n] is None:
+            state = current_state()
+            previous = state.get_framebuffer()
+            fbo = Framebuffer()
+            fbo.attach_texture(self.textures[n], [self.textures[n].width,
+                                                  self.textures[n].height,
+                                                  self.bands])
+            state.bind_framebuffer(previous)
+            self._framebuffers[n] = fbo
+
+        return self._framebuffers[n]
+
+    def _clear(self):
+        """Set all texels, including the halo, to zero.
+
+        """
+        state = current_state()
+        previous = state.get_framebuffer()
+        gl.glPushAttrib(gl.GL_COLOR_BUFFER_BIT)
+        gl.glClearColor(0.0, 0.0, 0.0, 0.0)
+        for n in range(len(self.regions)):
+            self._framebuffer(n).bind()
+            gl.glClear(gl.GL_COLOR_BUFFER_BIT)
+        gl.glPopAttrib()
+        state.bind_framebuffer(previous)
+
+    def _extent(self, n):
+        """Return the region of the image stored in tile `n`, including
+        its halo.
+
+        """
+        x, y, w, h = self.regions[n]
+        hx, hy = self.halo
+        return x - hx, y - hy, w + 2 * hx, h + 2 * hy
+
+    def write(self, arr):
+        """Upload an image of the same size to the tiles.
+
+        Parameters
+        ----------
+        arr : ndarray
+            Image of shape (width,), (height, width) or
+            (height, width, bands).
+
+        """
+        arr = np.asarray(arr, dtype=np.float32)
+        if _array_size(arr) != (self.width, self.height, self.bands):
+            raise ValueError("Array of shape %s does not match tiled "
+                             "texture of size %dx%d with %d bands." % \
+                             (arr.shape, self.width, self.height,
+                              self.bands))
+        arr = arr.reshape((self.height, self.width, self.bands))
+
+        image = (0, 0, self.width, self.height)
+        for n, tex in enumerate(self.textures):
+            extent = self._extent(n)
+            x, y, w, h = _intersect(extent, image)
+
+            if (x, y, w, h) == extent:
+                tile = arr[y:y + h, x:x + w]
+            else:
+                # Zeros outside the image
+                tile = np.zeros((extent[3], extent[2], self.bands),
+                                dtype=np.float32)
+                tile[y - extent[1]:y - extent[1] + h,
+                     x - extent[0]:x - extent[0] + w] = arr[y:y + h,
+                                                           x:x + w]
+            tex.write(tile)
+
+    def read(self, out=None):
+        """Download the image, stitched together from the tiles.
+
+        Parameters
+        ----------
+        out : ndarray, optional
+            C-contiguous float32 array in which to place the result,
+            with as many elements as the image has values.
+
+        Returns
+        -------
+        out : ndarray
+            The image, by default of shape (height, width, bands).
+
+        """
+        shape = (self.height, self.width, self.bands)
+        if out is None:
+            out = np.empty(shape, dtype=np.float32)
+        elif out.size != np.prod(shape) or out.dtype != np.float32 or \
+                 not out.flags.c_contiguous:
+            raise ValueError("Output must be a C-contiguous array of %d "
+                             "elements of type float32." % np.prod(shape))
+
+        image = out.reshape(shape)
+        hx, hy = self.halo
+        for (x, y, w, h), tex in zip(self.regions, self.textures):
+            tile = tex.read()
+            image[y:y + h, x:x + w] = tile[hy:hy + h, hx:hx + w]
+
+        return out
+
+    def update_halo(self):
+        """Copy the texels around each tile from the neighbouring tiles.
+
+        This is needed after the tiles have been rendered to, e.g. by a
+        `StencilKernel`, and is done on the graphics card.
+
+        """
+        hx, hy = self.halo
+        if not (hx or hy) or len(self.regions) == 1:
+            return
+
+        state = current_state()
+        state.forget_textures()
+        previous = state.get_framebuffer()
+        try:
+            for n, tex in enumerate(self.textures):
+                extent = self._extent(n)
+                for m, region in enumerate(self.regions):
+                    if m == n:
+                        continue
+
+                    overlap = _intersect(extent, region)
+                    if overlap is None:
+                        continue
+
+                    x, y, w, h = overlap
+                    self._framebuffer(m).bind()
+                    gl.glReadBuffer(gl.GL_COLOR_ATTACHMENT0_EXT)
+                    state.bind_texture(tex.target, tex.id)
+                    gl.glCopyTexSubImage2D(
+                        tex.target, 0, x - extent[0], y - extent[1],
+                        x - region[0] + hx, y - region[1] + hy, w, h)
+        finally:
+            for tex in self.textures:
+                state.bind_texture(tex.target, 0)
+            state.bind_framebuffer(previous)
+
+_vertex_source = """
+void main(void) {
+    gl_Position = gl_Vertex;
+}
+"""
+
+class StencilKernel(object):
+    def __init__(self, operation, halo=1):
+        """Kernel that computes each texel from the texels around it.
+
+        Parameters
+        ----------
+        operation : str
+            GLSL statements that compute `out` (``vec4``) from the
+            neighbourhood of the texel.  The value of the texel at
+            offset (dx, dy) is given by ``fetch(dx, dy)``, e.g.
+            ``"out = 0.5 * (fetch(-1, 0) + fetch(1, 0))"``.
+        halo : int
+            Largest offset passed to ``fetch``.
+
+        Notes
+        -----
+        The kernel is evaluated for one tile of a `TiledTexture` at a
+        time.  Outside the image, ``fetch`` returns zeros, also along
+        axes that have no halo.
+
+        """
+        self.operation = operation.strip().rstrip(';')
+        self.halo = halo
+
+        # "out" is reserved in GLSL
+        self._body = re.sub(r'(?<![.\w])out\b', '_out', self.operation)
+
+        # Generated programs, by texture target, for each context
+        self._programs = ContextLocal(dict)
+
+    def source(self, target):
+        """Generate the fragment shader for tiles of the given target.
+
+        """
+        lines = []
+        if target == gl.GL_TEXTURE_2D:
+            lines += ['uniform sampler2D _tex;',
+                      'uniform vec2 _scale;']
+            lookup = 'texture2D(_tex, (gl_FragCoord.xy + vec2(dx, dy)) * ' \
+                     '_scale)'
+        else:
+            lines += ['#extension GL_ARB_texture_rectangle : enable',
+                      'uniform sampler2DRect _tex;']
+            lookup = 'texture2DRect(_tex, gl_FragCoord.xy + vec2(dx, dy))'
+
+        # Position of the tile texture in the image, and size of the
+        # image, to return zeros outside of it
+        lines += ['uniform vec2 _offset;',
+                  'uniform vec2 _size;',
+                  '',
+                  'vec4 fetch(float dx, float dy) {',
+                  '    vec2 p = gl_FragCoord.xy + vec2(dx, dy) + _offset;',
+                  '    if (any(lessThan(p, vec2(0.0))) ||',
+                  '        any(greaterThanEqual(p, _size)))',
+                  '        return vec4(0.0);',
+                  '    return %s;' % lookup,
+                  '}',
+                  '',
+                  'vec4 fetch(int dx, int dy) {',
+                  '    return fetch(float(dx), float(dy));',
+                  '}',
+                  '',
+                  'void main(void) {',
+                  '    vec4 _out = vec4(0.0);',
+                  '    %s;' % self._body,
+                  '    gl_FragData[0] = _out;',
+                  '}']
+
+        return '\n'.join(lines)
+
+    def program(self, target):
+        """Return the compiled program for tiles of the given target.
+
+        """
+        programs = self._programs.get()
+        if target not in programs:
+            programs[target] = Program(
+                [VertexShader(_vertex_source),
+                 FragmentShader(self.source(target))])
+
+        return programs[target]
+
+    def __call__(self, image, out=None):
+        """Evaluate the kernel.
+
+        Parameters
+        ----------
+        image : TiledTexture or ndarray
+            Input.  A TiledTexture must have a halo at least as wide as
+            that of the kernel.
+        out : TiledTexture, optional
+            Output, of the same size and tiling as `image`.  By default,
+            a new TiledTexture.
+
+        Returns
+        -------
+        out : TiledTexture or ndarray
+            The result, an ndarray (of the shape of `image`) if the input
+            is one.
+
+        """
+        if not isinstance(image, TiledTexture):
+            arr = np.asarray(image, dtype=np.float32)
+            result = self(TiledTexture.from_array(arr, halo=self.halo))
+            return result.read().reshape(arr.shape)
+
+        if [h for h, size in zip(image.halo, (image.width, image.height))
+            if size > 1 and h < self.halo]:
+            raise ValueError("Kernel needs a halo of %d texels, but the "
+                             "image has one of %s." % (self.halo, image.halo))
+
+        if out is None:
+            out = TiledTexture(image.width, image.height, image.bands,
+                               halo=max(image.halo),
+                               tile_size=image.tile_size)
+        elif out is image or out.regions != image.regions or \
+                 out.halo != image.halo:
+            raise ValueError("Output must be a separate texture with the "
+                             "tiling of the input.")
+
+        state = current_state()
+        state.refresh()
+        previous = state.get_framebuffer()
+        viewport = state.viewport
+
+        state.active_texture(0)
+
+        hx, hy = image.halo
+        program = None
+        try:
+            for n, (x, y, w, h) in enumerate(image.regions):
+                tex = image.textures[n]
+
+                program = self.program(tex.target)
+                program.use()
+                program['_tex'] = 0
+                active = program.active_uniforms
+                if '_scale' in active:
+                    program['_scale'] = [1. / tex.width, 1. / tex.height]
+                if '_offset' in active:
+                    program['_offset'] = [float(x - hx), float(y - hy)]
+                if '_size' in active:
+                    program['_size'] = [float(image.width),
+                                        float(image.height)]
+
+                state.bind_texture(tex.target, tex.id)
+                out._framebuffer(n).bind()
+                state.set_viewport(hx, hy, w, h)
+                _draw_canvas()
+        finally:
+            for tex in image.textures:
+                state.bind_texture(tex.target, 0)
+            if program is not None:
+                program.disable()
+            state.set_viewport(*viewport)
+            state.bind_framebuffer(previous)
+
+        out.update_halo()
+
+        return out